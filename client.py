@@ -2,34 +2,355 @@ import argparse
 import copy
 import enum
 import ipaddress
+import json
+import logging
 import os
 import re
 import shutil
+import threading
 import warnings
 from io import StringIO
-import requests
 import sys
-from jinja2 import Environment, FileSystemLoader
-from ruamel.yaml import YAML
 
-try:
-    from cryptography.utils import CryptographyDeprecationWarning
-    warnings.filterwarnings("ignore", category=CryptographyDeprecationWarning)
-except ImportError:
-    warnings.filterwarnings("ignore", category=DeprecationWarning, module="cryptography")
+log = logging.getLogger(__name__)
 
-import diagnostic
+# requests, jinja2, ruamel and diagnostic (scapy) are imported by actions which need them, --help and
+# lightweight actions don't pay for them. See startup_benchmark.py
+_ruamel_yaml_dd = {}
+# ruamel YAML instance keeps the state of the current dump, watchers generated in parallel take turns
+ruamel_yaml_lock = threading.Lock()
 
-ruamel_yaml_default_mode = YAML()
-ruamel_yaml_default_mode.width = 2048  # type: ignore
+
+def get_ruamel_yaml(typ="rt"):
+    """ Shared YAML instance, rt keeps comments and order of keys """
+    if typ not in _ruamel_yaml_dd:
+        from ruamel.yaml import YAML
+        ruamel_yaml = YAML(typ=typ)
+        if typ == "rt":
+            ruamel_yaml.width = 2048  # type: ignore
+        _ruamel_yaml_dd[typ] = ruamel_yaml
+    return _ruamel_yaml_dd[typ]
+
+
+def import_diagnostic():
+    """ scapy import takes seconds, only diagnostic actions need it """
+    try:
+        from cryptography.utils import CryptographyDeprecationWarning
+        warnings.filterwarnings("ignore", category=CryptographyDeprecationWarning)
+    except ImportError:
+        warnings.filterwarnings("ignore", category=DeprecationWarning, module="cryptography")
+    import diagnostic
+    return diagnostic
+
+
+class YAML_FILE_CACHE:
+    """
+    YAML documents parsed once per process and cached by path, a file is parsed again only when its mtime or size change.
+    * load: round-trip document (comments and order are kept) owned by the caller to modify and save. It's handed out
+      once, a saved document is put back to the cache
+    * load_template: round-trip document parsed once, each caller gets own copy
+    * load_safe: plain dicts for read-only access, parsed by the fast loader and shared between callers
+    """
+    # {(path, typ): (mtime_ns, size, document)}
+    _cache_dd = {}
+
+    @classmethod
+    def _get(cls, file_path, typ, pop=False):
+        stat = os.stat(file_path)
+        with ruamel_yaml_lock:
+            cached = cls._cache_dd.pop((file_path, typ), None) if pop else cls._cache_dd.get((file_path, typ))
+            if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+                with open(file_path) as f:
+                    document = get_ruamel_yaml("safe" if typ == "safe" else "rt").load(f)
+                cached = (stat.st_mtime_ns, stat.st_size, document)
+                if not pop:
+                    cls._cache_dd[(file_path, typ)] = cached
+        return cached[2]
+
+    @classmethod
+    def load(cls, file_path):
+        return cls._get(file_path, "rt", pop=True)
+
+    @classmethod
+    def load_template(cls, file_path):
+        return copy.deepcopy(cls._get(file_path, "template"))
+
+    @classmethod
+    def load_safe(cls, file_path):
+        return cls._get(file_path, "safe")
+
+    @classmethod
+    def save(cls, file_path, document):
+        """ Write to a temporary file and rename it, a watcher never has a partially written config """
+        s = StringIO()
+        with ruamel_yaml_lock:
+            get_ruamel_yaml().dump(document, s)
+        tmp_file_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file_path, "w") as f:
+            f.write(s.getvalue())
+        os.replace(tmp_file_path, file_path)
+        stat = os.stat(file_path)
+        with ruamel_yaml_lock:
+            cls._cache_dd[(file_path, "rt")] = (stat.st_mtime_ns, stat.st_size, document)
 
 class ACTIONS(enum.Enum):
     ADD_WATCHER = "add_watcher"
+    ADD_WATCHERS = "add_watchers"
     DIAGNOSTIC = "diagnostic"
     ENABLE_XDP = "enable_xdp"
     DISABLE_XDP = "disable_xdp"
 
 
+def save_json_atomically(file_path, data):
+    """ Write to a temporary file and rename it, readers never see a partially written file """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    tmp_file_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_file_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_file_path, file_path)
+
+
+class WATCHER_REGISTRY:
+    """
+    Index of watcher folders persisted in watcher/.registry/watchers.json.
+    It's rebuilt when watcher folder's mtime changes (a watcher is added or removed) or a config.yml is edited
+    in place, a config.yml is parsed again only if its own mtime has changed. Lookups by watcher num, device IP
+    and host veth are O(1)
+    """
+    REGISTRY_FOLDER_NAME = ".registry"
+    REGISTRY_FILE_NAME = "watchers.json"
+    # watcher1-gre1025-ospf or watcher1-bgpls-isis
+    WATCHER_RE_GRE = re.compile(r"(?P<name>[a-zA-Z]+)(?P<watcher_num>\d+)-gre(?P<gre_num>\d+)(-(?P<proto>[a-zA-Z]+))?")
+    WATCHER_RE_BGPLS = re.compile(r"(?P<name>[a-zA-Z]+)(?P<watcher_num>\d+)-bgpls(-(?P<proto>[a-zA-Z]+))?")
+    # registry of the current process, {watcher root folder path: WATCHER_REGISTRY}
+    _loaded_dd = {}
+
+    def __init__(self, watcher_root_folder_path, root_mtime_ns=0, watchers_dd=None) -> None:
+        self.watcher_root_folder_path = watcher_root_folder_path
+        self.root_mtime_ns = root_mtime_ns
+        # {folder name: entry}
+        self.watchers_dd = watchers_dd if watchers_dd is not None else {}
+        self.by_watcher_num = {}
+        self.by_device = {}
+        self.by_host_veth = {}
+        self.by_gre_num = {}
+        for folder_name, entry in self.watchers_dd.items():
+            self.by_watcher_num[entry['watcher_num']] = folder_name
+            if entry['device_ip']:
+                self.by_device[(entry['connection_mode'], entry['device_ip'])] = folder_name
+            if entry['host_veth']:
+                self.by_host_veth[entry['host_veth']] = folder_name
+            if entry['gre_num']:
+                self.by_gre_num.setdefault(entry['gre_num'], []).append(folder_name)
+
+    @property
+    def registry_file_path(self):
+        return os.path.join(self.watcher_root_folder_path, self.REGISTRY_FOLDER_NAME, self.REGISTRY_FILE_NAME)
+
+    @classmethod
+    def load(cls, watcher_root_folder_path):
+        """ Return up to date registry, it's rebuilt and saved only if watcher folders were changed """
+        root_mtime_ns = os.stat(watcher_root_folder_path).st_mtime_ns
+        registry = cls._loaded_dd.get(watcher_root_folder_path)
+        if registry is None:
+            registry = cls(watcher_root_folder_path)
+            try:
+                with open(registry.registry_file_path) as f:
+                    registry_dd = json.load(f)
+                registry = cls(watcher_root_folder_path, registry_dd['root_mtime_ns'], registry_dd['watchers'])
+            except (OSError, ValueError, KeyError):
+                pass
+        if registry.root_mtime_ns != root_mtime_ns or registry.has_pending or registry.has_changed_configs:
+            registry = registry.rebuild(root_mtime_ns)
+        cls._loaded_dd[watcher_root_folder_path] = registry
+        return registry
+
+    @property
+    def has_pending(self):
+        """ Folders without config.yml, i.e. being created. They are checked each time """
+        return any(not entry['config_mtime_ns'] for entry in self.watchers_dd.values())
+
+    @property
+    def has_changed_configs(self):
+        """ config.yml edits and replaces don't change mtime of the watcher root folder """
+        return any(self.config_mtime_ns(folder_name) != entry['config_mtime_ns'] for folder_name, entry in self.watchers_dd.items())
+
+    def config_file_path(self, folder_name):
+        return os.path.join(self.watcher_root_folder_path, folder_name, WATCHER_CONFIG.WATCHER_CONFIG_FILE)
+
+    def config_mtime_ns(self, folder_name):
+        """ 0 if there is no config.yml """
+        try:
+            return os.stat(self.config_file_path(folder_name)).st_mtime_ns
+        except OSError:
+            return 0
+
+    def rebuild(self, root_mtime_ns):
+        watchers_dd = {}
+        for folder_name in os.listdir(self.watcher_root_folder_path):
+            if not folder_name.startswith("watcher") or folder_name.endswith("template"):
+                continue
+            folder_path = os.path.join(self.watcher_root_folder_path, folder_name)
+            if not os.path.isdir(folder_path):
+                continue
+            config_mtime_ns = self.config_mtime_ns(folder_name)
+            entry = self.watchers_dd.get(folder_name)
+            if entry is None or entry['config_mtime_ns'] != config_mtime_ns or not config_mtime_ns:
+                entry = self.parse_entry(folder_name, self.config_file_path(folder_name), config_mtime_ns)
+            if entry is not None:
+                watchers_dd[folder_name] = entry
+        registry = self.__class__(self.watcher_root_folder_path, root_mtime_ns, watchers_dd)
+        registry.save()
+        return registry
+
+    @classmethod
+    def parse_entry(cls, folder_name, config_file_path, config_mtime_ns):
+        watcher_match_gre = cls.WATCHER_RE_GRE.match(folder_name)
+        watcher_match_bgpls = cls.WATCHER_RE_BGPLS.match(folder_name)
+        watcher_match = watcher_match_gre or watcher_match_bgpls
+        if not watcher_match:
+            return None
+        labels = {}
+        if config_mtime_ns:
+            labels = (YAML_FILE_CACHE.load_safe(config_file_path) or {}).get('topology', {}).get('defaults', {}).get('labels', {}) or {}
+        connection_mode = "gre" if watcher_match_gre else "bgpls"
+        gre_num = int(watcher_match.groupdict().get("gre_num") or 0)
+        host_veth = ""
+        if connection_mode == "gre":
+            watcher_obj = WATCHER_CONFIG(int(watcher_match.group("watcher_num")))
+            watcher_obj.gre_tunnel_number = gre_num
+            watcher_obj.organisation_name = str(labels.get('organisation_name') or "")
+            host_veth = watcher_obj.host_veth
+        return {
+            'watcher_num': int(watcher_match.group("watcher_num")),
+            'protocol': watcher_match.groupdict().get("proto") or "",
+            'connection_mode': connection_mode,
+            'gre_num': gre_num,
+            'device_ip': str(labels.get('gre_tunnel_network_device_ip') or labels.get('bgpls_router_ip') or ""),
+            'host_veth': host_veth,
+            'config_mtime_ns': config_mtime_ns,
+            'labels': json.loads(json.dumps(labels, default=str)),
+        }
+
+    def save(self):
+        try:
+            save_json_atomically(self.registry_file_path, {'root_mtime_ns': self.root_mtime_ns, 'watchers': self.watchers_dd})
+        except OSError as e:
+            # read-only mount, the registry is kept in memory only
+            log.error(f"Watcher registry was not saved, {e}")
+
+    def folder_names(self):
+        return list(self.watchers_dd)
+
+    def get(self, watcher_num):
+        folder_name = self.by_watcher_num.get(watcher_num)
+        return (folder_name, self.watchers_dd[folder_name]) if folder_name else (None, None)
+
+    def find_device(self, connection_mode, device_ip):
+        """ Return a folder of a watcher connected to the device or None """
+        return self.by_device.get((connection_mode, device_ip))
+
+    def find_host_veth(self, host_veth):
+        return self.by_host_veth.get(host_veth)
+
+    def find_gre_num(self, gre_num):
+        return self.by_gre_num.get(gre_num, [])
+
+
+class P2P_VETH_IPAM:
+    """
+    Allocator of p2p subnets between watcher's netns and the host, assignments are kept in watcher/.registry/ipam.json.
+    Blocks of /30 (or /31) are taken top down from the end of the supernet, the beginning of 169.254.0.0/16 is used by OSPF watcher
+    one /24 per watcher bottom up. Freed blocks are reused, blocks covered by /24 of watchers created before the allocator are skipped.
+    {"supernet": "169.254.0.0/16", "prefixlen": 30, "next_index": 3, "assignments": {"1": 0, "2": 1, "4": 2}}
+    """
+    IPAM_FILE_NAME = "ipam.json"
+
+    def __init__(self, ipam_file_path, supernet, prefixlen, ospf_network=None, next_index=0, assignments=None) -> None:
+        self.ipam_file_path = ipam_file_path
+        self.supernet = ipaddress.ip_network(supernet)
+        self.prefixlen = prefixlen
+        if not self.supernet.prefixlen < prefixlen <= 31:
+            raise ValueError(f"p2p prefix length /{prefixlen} doesn't fit into {self.supernet}")
+        self.block_size = 2 ** (32 - prefixlen)
+        self.blocks_num = self.supernet.num_addresses // self.block_size
+        self.ospf_network = ipaddress.ip_network(ospf_network) if ospf_network else None
+        self.next_index = next_index
+        # {watcher num: block index}
+        self.assignments = {int(watcher_num): index for watcher_num, index in (assignments or {}).items()}
+        self.used_indexes = set(self.assignments.values())
+        self.free_indexes = []
+
+    @classmethod
+    def load(cls, registry):
+        """ Load assignments and release blocks of removed watchers """
+        ipam_file_path = os.path.join(registry.watcher_root_folder_path, WATCHER_REGISTRY.REGISTRY_FOLDER_NAME, cls.IPAM_FILE_NAME)
+        supernet = os.getenv('WATCHER_P2P_VETH_SUPERNET', WATCHER_CONFIG.P2P_VETH_SUPERNET_W_MASK)
+        prefixlen = int(os.getenv('WATCHER_P2P_VETH_PREFIXLEN', '30'))
+        # OSPF watcher takes /24 per watcher from the beginning of 169.254.0.0/16, 64 watchers -> 169.254.0.0/18
+        ospf_watchers_max_num = int(os.getenv('OSPF_WATCHER_MAX_NUM', '64'))
+        ospf_network = None
+        if ospf_watchers_max_num:
+            ospf_prefixlen = 24 - (ospf_watchers_max_num - 1).bit_length()
+            ospf_network = f"{ipaddress.ip_network(WATCHER_CONFIG.P2P_VETH_SUPERNET_W_MASK).network_address}/{ospf_prefixlen}"
+        ipam_dd = {}
+        if os.path.exists(ipam_file_path):
+            with open(ipam_file_path) as f:
+                ipam_dd = json.load(f)
+            if (ipam_dd.get('supernet'), ipam_dd.get('prefixlen')) != (supernet, prefixlen) and ipam_dd.get('assignments'):
+                print(f"p2p veth plan {ipam_dd.get('supernet')} /{ipam_dd.get('prefixlen')} is already in use, {supernet} /{prefixlen} is ignored")
+                supernet, prefixlen = ipam_dd['supernet'], ipam_dd['prefixlen']
+        ipam = cls(ipam_file_path, supernet, prefixlen, ospf_network, ipam_dd.get('next_index', 0), ipam_dd.get('assignments'))
+        for watcher_num in list(ipam.assignments):
+            if watcher_num not in registry.by_watcher_num:
+                ipam.used_indexes.discard(ipam.assignments.pop(watcher_num))
+        for folder_name, entry in registry.watchers_dd.items():
+            if entry['connection_mode'] == "gre" and not entry['labels'].get('p2p_veth_network'):
+                ipam.reserve(WATCHER_CONFIG.legacy_p2p_veth_network_obj(entry['watcher_num']))
+        # the lowest free index is popped first
+        ipam.free_indexes = sorted((index for index in range(ipam.next_index) if index not in ipam.used_indexes), reverse=True)
+        return ipam
+
+    def block(self, index):
+        return ipaddress.ip_network((int(self.supernet.broadcast_address) + 1 - (index + 1) * self.block_size, self.prefixlen))
+
+    def reserve(self, network_obj):
+        """ Mark blocks overlapping with the network as used """
+        top = int(self.supernet.broadcast_address) + 1
+        first = max((top - int(network_obj.broadcast_address) - 1) // self.block_size, 0)
+        last = min((top - int(network_obj.network_address) - 1) // self.block_size, self.blocks_num - 1)
+        self.used_indexes.update(range(first, last + 1))
+
+    def allocate(self, watcher_num):
+        """ Return p2p subnet of the watcher, a new block is assigned if the watcher doesn't have it yet """
+        if watcher_num in self.assignments:
+            return self.block(self.assignments[watcher_num])
+        index = None
+        while self.free_indexes:
+            index = self.free_indexes.pop()
+            if index not in self.used_indexes:
+                break
+            index = None
+        if index is None:
+            while self.next_index in self.used_indexes:
+                self.next_index += 1
+            index = self.next_index
+            self.next_index += 1
+        if index >= self.blocks_num:
+            raise ValueError(f"No free p2p subnets are left in {self.supernet}")
+        network_obj = self.block(index)
+        if self.ospf_network and network_obj.overlaps(self.ospf_network):
+            raise ValueError(f"p2p subnet {network_obj} overlaps with OSPF watcher's allocation {self.ospf_network}")
+        self.assignments[watcher_num] = index
+        self.used_indexes.add(index)
+        return network_obj
+
+    def save(self):
+        save_json_atomically(self.ipam_file_path, {
+            'supernet': str(self.supernet), 'prefixlen': self.prefixlen, 'next_index': self.next_index, 'assignments': self.assignments,
+        })
+
+
 class WATCHER_CONFIG:
     P2P_VETH_SUPERNET_W_MASK = "169.254.0.0/16"
     WATCHER_ROOT_FOLDER = "watcher"
@@ -44,6 +365,7 @@ class WATCHER_CONFIG:
     LOGROTATION_IMAGE = "vadims06/docker-logrotate:v1.0.0"
     BGPLSWATCHER_NODE_NAME = "bgplswatcher"
     BGPLSWATCHER_IMAGE = "vadims06/bgplswatcher:latest"
+    ADD_WATCHERS_MAX_WORKERS = 16
 
     def __init__(self, watcher_num, protocol="isis"):
         self.watcher_num = watcher_num
@@ -72,10 +394,14 @@ class WATCHER_CONFIG:
         self.bgpls_grpc_port = 0
         # Delay before bgplswatcher dials isis-watcher gRPC (matches gobgp config.toml)
         self.wait_sec_before_send_topology = 5
+        # p2p subnet assigned by P2P_VETH_IPAM, empty for watchers created before it
+        self.p2p_veth_network = ""
+        # Jinja environment shared by watchers generated in bulk, templates are loaded from disk once
+        self._router_jinja_env = None
 
     def gen_next_free_number():
         """ Each Watcher installation has own sequence number starting from 1 """
-        watcher_seq_numbers = [int(folder_name.split('-')[0][7:]) for folder_name in WATCHER_CONFIG.get_existed_watchers() if '-' in folder_name]
+        watcher_seq_numbers = list(WATCHER_CONFIG.get_registry().by_watcher_num)
         if not watcher_seq_numbers:
             return 1
         expected_numbers = set(range(1, max(watcher_seq_numbers) + 1))
@@ -85,46 +411,67 @@ class WATCHER_CONFIG:
             next_number = next(iter(expected_numbers - set(watcher_seq_numbers)))
         return next_number
 
+    @staticmethod
+    def gen_next_free_numbers(count):
+        """ Return `count` free sequence numbers, gaps are filled first """
+        used_numbers = set(WATCHER_CONFIG.get_registry().by_watcher_num)
+        free_numbers, number = [], 1
+        while len(free_numbers) < count:
+            if number not in used_numbers:
+                free_numbers.append(number)
+            number += 1
+        return free_numbers
+
+    @staticmethod
+    def get_registry():
+        return WATCHER_REGISTRY.load(os.path.join(os.getcwd(), WATCHER_CONFIG.WATCHER_ROOT_FOLDER))
+
     @staticmethod
     def get_existed_watchers():
         """ Return a list of watcher folders """
-        watcher_root_folder_path = os.path.join(os.getcwd(), WATCHER_CONFIG.WATCHER_ROOT_FOLDER)
-        return [file for file in os.listdir(watcher_root_folder_path) if os.path.isdir(os.path.join(watcher_root_folder_path, file)) and file.startswith("watcher") and not file.endswith("template")]
+        return WATCHER_CONFIG.get_registry().folder_names()
 
     def import_from(self, watcher_num):
         """
-        Browse a folder directory and find a folder with watcher num. Parse GRE tunnel or BGP-LS
+        Find a watcher with watcher num in the registry and restore GRE tunnel or BGP-LS settings from its labels
         """
-        # watcher1-gre1025-ospf or watcher1-bgpls-isis
-        watcher_re_gre = re.compile(r"(?P<name>[a-zA-Z]+)(?P<watcher_num>\d+)-gre(?P<gre_num>\d+)(-(?P<proto>[a-zA-Z]+))?")
-        watcher_re_bgpls = re.compile(r"(?P<name>[a-zA-Z]+)(?P<watcher_num>\d+)-bgpls(-(?P<proto>[a-zA-Z]+))?")
-        for file in self.get_existed_watchers():
-            watcher_match_gre = watcher_re_gre.match(file)
-            watcher_match_bgpls = watcher_re_bgpls.match(file)
-            watcher_match = watcher_match_gre or watcher_match_bgpls
-            if watcher_match and watcher_match.groupdict().get("watcher_num", "") == str(watcher_num):
-                # these two attributes are needed to build paths
-                self.protocol = watcher_match.groupdict().get("proto") if watcher_match.groupdict().get("proto") else self.protocol
-                if watcher_match_gre:
-                    self.connection_mode = "gre"
-                    self.gre_tunnel_number = int(watcher_match.groupdict().get("gre_num", 0))
-                elif watcher_match_bgpls:
-                    self.connection_mode = "bgpls"
-                for label, value in self.watcher_config_file_yml.get('topology', {}).get('defaults', {}).get('labels', {}).items():
-                    setattr(self, label, value)
-                break
-        else:
+        folder_name, entry = self.get_registry().get(watcher_num)
+        if entry is None:
             raise ValueError(f"Watcher{watcher_num} was not found")
+        # these two attributes are needed to build paths
+        self.protocol = entry['protocol'] if entry['protocol'] else self.protocol
+        self.connection_mode = entry['connection_mode']
+        if self.connection_mode == "gre":
+            self.gre_tunnel_number = entry['gre_num']
+        for label, value in entry['labels'].items():
+            setattr(self, label, value)
+
+    @staticmethod
+    def legacy_p2p_veth_network_obj(watcher_num):
+        """ ISIS p2p subnet assigment is top down: start from the end (255) to the start (0) in order not to overlap with OSPF """
+        p2p_super_network_obj = ipaddress.ip_network(WATCHER_CONFIG.P2P_VETH_SUPERNET_W_MASK)
+        return ipaddress.ip_network(f"{p2p_super_network_obj.network_address + (256 - watcher_num) * 256}/24")
+
+    def allocate_p2p_veth_network(self, ipam):
+        self.p2p_veth_network = str(ipam.allocate(self.watcher_num))
 
     @property
     def p2p_veth_network_obj(self):
-        """ ISIS p2p subnet assigment is top down: start from the end (255) to the start (0) in order not to overlap with OSPF """
-        p2p_super_network_obj = ipaddress.ip_network(self.P2P_VETH_SUPERNET_W_MASK)
-        return list(p2p_super_network_obj.subnets(new_prefix=24))[256 - self.watcher_num]
+        cache_key = (self.p2p_veth_network, self.watcher_num)
+        if getattr(self, "_p2p_veth_network_cache", (None, None))[0] != cache_key:
+            network_obj = ipaddress.ip_network(self.p2p_veth_network) if self.p2p_veth_network else self.legacy_p2p_veth_network_obj(self.watcher_num)
+            self._p2p_veth_network_cache = (cache_key, network_obj)
+        return self._p2p_veth_network_cache[1]
+
+    @property
+    def _p2p_veth_first_host_obj(self):
+        # /31 has no network and broadcast addresses
+        network_obj = self.p2p_veth_network_obj
+        return network_obj.network_address if network_obj.prefixlen == 31 else network_obj.network_address + 1
 
     @property
     def p2p_veth_watcher_ip_obj(self):
-        return self.get_nth_elem_from_iter(self.p2p_veth_network_obj.hosts(), 2)
+        return self._p2p_veth_first_host_obj + 1
 
     @property
     def p2p_veth_watcher_ip_w_mask(self):
@@ -140,7 +487,7 @@ class WATCHER_CONFIG:
 
     @property
     def p2p_veth_host_ip_obj(self):
-        return self.get_nth_elem_from_iter(self.p2p_veth_network_obj.hosts(), 1)
+        return self._p2p_veth_first_host_obj
 
     @property
     def p2p_veth_host_ip_w_mask(self):
@@ -212,15 +559,21 @@ class WATCHER_CONFIG:
     @property
     def watcher_config_file_yml(self) -> dict:
         if os.path.exists(self.watcher_config_file_path):
-            with open(self.watcher_config_file_path) as f:
-                return ruamel_yaml_default_mode.load(f)
+            return YAML_FILE_CACHE.load(self.watcher_config_file_path)
         return {}
 
+    @property
+    def watcher_config_template_file_path(self):
+        return os.path.join(self.watcher_template_path, self.WATCHER_CONFIG_FILE)
+
     @property
     def watcher_config_template_yml(self):
-        watcher_template_path = os.path.join(self.watcher_root_folder_path, self.WATCHER_TEMPLATE_FOLDER_NAME)
-        with open(os.path.join(watcher_template_path, self.WATCHER_CONFIG_FILE)) as f:
-            return ruamel_yaml_default_mode.load(f)
+        """ Own copy of the template to modify """
+        return YAML_FILE_CACHE.load_template(self.watcher_config_template_file_path)
+
+    @property
+    def watcher_config_template_yml_read_only(self):
+        return YAML_FILE_CACHE.load_safe(self.watcher_config_template_file_path)
 
     @property
     def isis_watcher_template_path(self):
@@ -234,9 +587,18 @@ class WATCHER_CONFIG:
     def bgplswatcher_folder_path(self):
         return os.path.join(self.watcher_folder_path, self.BGPLSWATCHER_NODE_NAME)
         
+    @property
+    def router_jinja_env(self):
+        if self._router_jinja_env is None:
+            from jinja2 import Environment, FileSystemLoader
+            self._router_jinja_env = Environment(
+                loader=FileSystemLoader(self.router_template_path)
+            )
+        return self._router_jinja_env
+
     @property
     def netns_name(self):
-        watcher_config_yml = self.watcher_config_template_yml
+        watcher_config_yml = self.watcher_config_template_yml_read_only
         if not watcher_config_yml.get("prefix"):
             return f"clab-{self.watcher_folder_name}-{self.ROUTER_NODE_NAME}"
         elif watcher_config_yml["prefix"] == "__lab-name":
@@ -285,6 +647,7 @@ class WATCHER_CONFIG:
                     f.write(line)
 
     def do_check_topolograph_availability(self):
+        import requests
         from dotenv import load_dotenv
         load_dotenv()
         # using TOPOLOGRAPH_* env variable check if get request is ok
@@ -349,12 +712,15 @@ class WATCHER_CONFIG:
             self.create_folder_with_settings_bgpls()
             return
         # GRE mode (existing implementation)
+        if not self.p2p_veth_network:
+            ipam = P2P_VETH_IPAM.load(self.get_registry())
+            self.allocate_p2p_veth_network(ipam)
+            ipam.save()
         # watcher folder
         os.mkdir(self.watcher_folder_path)
         # isis-watcher folder
         watcher_logs_folder_path = os.path.join(self.watcher_root_folder_path, "logs")
-        if not os.path.exists(watcher_logs_folder_path):
-            os.mkdir(watcher_logs_folder_path)
+        os.makedirs(watcher_logs_folder_path, exist_ok=True)
         #os.mkdir(isis_watcher_folder_path)
         shutil.copyfile(
             src=os.path.join(self.isis_watcher_template_path, "watcher.log"),
@@ -369,9 +735,7 @@ class WATCHER_CONFIG:
                 dst=os.path.join(self.router_folder_path, file_name)
             )
         # Config generation
-        env = Environment(
-            loader=FileSystemLoader(self.router_template_path)
-        )
+        env = self.router_jinja_env
         # frr.conf
         frr_template = env.get_template("frr.template")
         frr_config = frr_template.render(
@@ -401,6 +765,7 @@ class WATCHER_CONFIG:
         watcher_config_yml['topology']['defaults']['labels'].update({'asn': self.asn})
         watcher_config_yml['topology']['defaults']['labels'].update({'organisation_name': self.organisation_name})
         watcher_config_yml['topology']['defaults']['labels'].update({'watcher_name': self.watcher_name})
+        watcher_config_yml['topology']['defaults']['labels'].update({'p2p_veth_network': self.p2p_veth_network})
         # Config
         watcher_config_yml['topology']['nodes']['h1']['exec'] = self.exec_cmds()
         watcher_config_yml['topology']['links'] = [{'endpoints': [f'{self.ROUTER_NODE_NAME}:veth1', f'host:{self.host_veth}']}]
@@ -438,8 +803,7 @@ class WATCHER_CONFIG:
         os.mkdir(self.watcher_folder_path)
         # logs folder
         watcher_logs_folder_path = os.path.join(self.watcher_root_folder_path, "logs")
-        if not os.path.exists(watcher_logs_folder_path):
-            os.mkdir(watcher_logs_folder_path)
+        os.makedirs(watcher_logs_folder_path, exist_ok=True)
         # Create log file
         shutil.copyfile(
             src=os.path.join(self.isis_watcher_template_path, "watcher.log"),
@@ -451,7 +815,7 @@ class WATCHER_CONFIG:
         # Generate bgplswatcher config.toml
         self.generate_bgplswatcher_config()
         # Generate containerlab config.yml
-        watcher_config_yml = copy.deepcopy(self.watcher_config_template_yml)
+        watcher_config_yml = self.watcher_config_template_yml
         watcher_config_yml["name"] = self.watcher_folder_name
         # Remove nodes that are not needed for BGP-LS
         if 'router' in watcher_config_yml['topology']['nodes']:
@@ -529,10 +893,7 @@ class WATCHER_CONFIG:
         self._do_save_watcher_config_file(watcher_config_yml)
 
     def _do_save_watcher_config_file(self, _config):
-        with open(self.watcher_config_file_path, "w") as f:
-            s = StringIO()
-            ruamel_yaml_default_mode.dump(_config, s)
-            f.write(s.getvalue())
+        YAML_FILE_CACHE.save(self.watcher_config_file_path, _config)
 
     def do_add_watcher_prechecks(self):
         if os.path.exists(self.watcher_folder_path):
@@ -540,7 +901,12 @@ class WATCHER_CONFIG:
                 raise ValueError(f"Watcher{self.watcher_num} with BGP-LS already exists")
             else:
                 raise ValueError(f"Watcher{self.watcher_num} with GRE{self.gre_tunnel_number} already exists")
-        # TODO, check if GRE with the same tunnel destination already exist without root access
+        registry = self.get_registry()
+        device_ip = self.bgpls_router_ip if self.connection_mode == "bgpls" else self.gre_tunnel_network_device_ip
+        if registry.find_device(self.connection_mode, device_ip):
+            raise ValueError(f"{device_ip} is already connected to {registry.find_device(self.connection_mode, device_ip)}")
+        if self.connection_mode == "gre" and registry.find_host_veth(self.host_veth):
+            raise ValueError(f"Interface {self.host_veth} is already used by {registry.find_host_veth(self.host_veth)}, please choose another GRE number")
 
     @staticmethod
     def do_print_banner():
@@ -578,6 +944,13 @@ class WATCHER_CONFIG:
 +-------------------------------+                                            
         """)
 
+    def gen_bgpls_grpc_port(self):
+        if self.protocol == "isis":
+            return 50100 + self.watcher_num
+        elif self.protocol == "ospf":
+            return 50200 + self.watcher_num
+        return 50100 + self.watcher_num  # Default to ISIS port
+
     def add_watcher_dialog_bgpls(self):
         # Router IP address (BGP peer)
         while not self.bgpls_router_ip:
@@ -621,12 +994,7 @@ class WATCHER_CONFIG:
                     print("⚠ Passive mode disabled - it limits the number of goBGP instances running on the same host to 1")
                     print("⚠ You can run multiple goBGP instances on the same host by disabling passive mode")
         # Calculate gRPC port based on protocol
-        if self.protocol == "isis":
-            self.bgpls_grpc_port = 50100 + self.watcher_num
-        elif self.protocol == "ospf":
-            self.bgpls_grpc_port = 50200 + self.watcher_num
-        else:
-            self.bgpls_grpc_port = 50100 + self.watcher_num  # Default to ISIS port
+        self.bgpls_grpc_port = self.gen_bgpls_grpc_port()
         # Topolograph's IP settings
         self.enable_topolograph = None
         while self.enable_topolograph is None:
@@ -777,8 +1145,9 @@ class WATCHER_CONFIG:
         watcher_obj.run_command(args.action)
 
     def run_command(self, action):
-        method = getattr(self, action)
-        return method()
+        # look up the class, enable_xdp attribute of an instance shadows enable_xdp action
+        method = getattr(type(self), action)
+        return method(self)
 
     def add_watcher(self):
         # Ask for connection mode first to show correct banner
@@ -803,6 +1172,138 @@ class WATCHER_CONFIG:
         self.create_folder_with_settings()
         print(f"Config has been successfully generated!")
 
+    def import_from_inventory(self, device, defaults):
+        """
+        Fill in settings from an inventory entry instead of the dialog. Return a list of errors, empty if the entry is valid
+        """
+        entry = {**defaults, **device}
+        errors = []
+        self.connection_mode = str(entry.get("mode", "gre")).lower()
+        area_num = entry.get("area_num", "")
+        # unquoted 49.0010 is loaded as a float 49.001
+        self.isis_area_num = self.do_check_area_num(f"{area_num:.4f}" if isinstance(area_num, float) else str(area_num))
+        if not self.isis_area_num:
+            errors.append(f"area_num {entry.get('area_num')} is not correct, expected 49.xxxx")
+        self.asn = int(entry.get("asn", 0)) if str(entry.get("asn", 0)).isdigit() else 0
+        self.organisation_name = str(entry.get("organisation", "")).lower()
+        self.watcher_name = str(entry.get("watcher_name", "")).lower().replace(" ", "-") or "isiswatcher-demo"
+        self.topolograph_api_token = str(entry.get("topolograph_api_token", "")).strip() or self._existing_topolograph_api_token_from_template_env()
+        self.enable_topolograph = bool(entry.get("enable_topolograph", False))
+        if self.connection_mode == "bgpls":
+            self.bgpls_router_ip = self.do_check_ip(str(entry.get("router_ip", "")))
+            if not self.bgpls_router_ip:
+                errors.append(f"router_ip {entry.get('router_ip')} is not correct")
+            self.bgpls_router_id = self.do_check_ip(str(entry.get("router_id", "")))
+            if not self.bgpls_router_id:
+                errors.append(f"router_id {entry.get('router_id')} is not correct")
+            for attr, key in [("bgpls_router_as", "router_as"), ("bgpls_watcher_as", "watcher_as")]:
+                if not str(entry.get(key, "")).isdigit():
+                    errors.append(f"{key} {entry.get(key)} is not correct AS number")
+                    continue
+                setattr(self, attr, int(entry[key]))
+            self.bgpls_ebgp_multihop = bool(self.bgpls_router_as and self.bgpls_watcher_as and self.bgpls_router_as != self.bgpls_watcher_as)
+            self.bgpls_passive_mode = bool(entry.get("passive_mode", False))
+            self.bgpls_grpc_port = self.gen_bgpls_grpc_port()
+            if self.enable_topolograph:
+                self.host_interface_device_ip = self.do_check_ip(str(entry.get("host_ip", "")))
+            return errors
+        if self.connection_mode != "gre":
+            return errors + [f"mode {self.connection_mode} is not supported, use gre or bgpls"]
+        self.gre_tunnel_network_device_ip = self.do_check_ip(str(entry.get("device_ip", "")))
+        if not self.gre_tunnel_network_device_ip:
+            errors.append(f"device_ip {entry.get('device_ip')} is not correct")
+        self.host_interface_device_ip = self.do_check_ip(str(entry.get("host_ip", "")))
+        if not self.host_interface_device_ip:
+            errors.append(f"host_ip {entry.get('host_ip')} is not correct")
+        if not str(entry.get("gre_num", "")).isdigit() or not int(entry["gre_num"]):
+            errors.append(f"gre_num {entry.get('gre_num')} is not a positive number")
+        else:
+            self.gre_tunnel_number = int(entry["gre_num"])
+        # tunnel subnet: the first host is network device's end, the second is watcher's one, unless they are set explicitly
+        try:
+            tunnel_network = ipaddress.ip_network(str(entry.get("tunnel_subnet", "")), strict=False)
+        except ValueError:
+            return errors + [f"tunnel_subnet {entry.get('tunnel_subnet')} is not correct"]
+        if tunnel_network.prefixlen >= 32:
+            return errors + ["Please provide non /32 subnet for tunnel network"]
+        tunnel_hosts = tunnel_network.hosts()
+        self.gre_tunnel_ip_w_mask_network_device = str(entry.get("tunnel_ip_device") or f"{self.get_nth_elem_from_iter(tunnel_hosts, 1)}/{tunnel_network.prefixlen}")
+        self.gre_tunnel_ip_w_mask_watcher = str(entry.get("tunnel_ip_watcher") or f"{self.get_nth_elem_from_iter(tunnel_hosts, 1)}/{tunnel_network.prefixlen}")
+        for tunnel_ip_w_mask in [self.gre_tunnel_ip_w_mask_network_device, self.gre_tunnel_ip_w_mask_watcher]:
+            if not self.do_check_ip(tunnel_ip_w_mask) or not self.is_network_the_same(tunnel_ip_w_mask, str(tunnel_network)):
+                errors.append(f"Tunnel IP {tunnel_ip_w_mask} doesn't belong to {tunnel_network}")
+        if self.gre_tunnel_ip_w_mask_network_device == self.gre_tunnel_ip_w_mask_watcher:
+            errors.append("Tunnel' IP addresses must be different on endpoints")
+        if self.do_check_ip(self.gre_tunnel_ip_w_mask_network_device) == self.gre_tunnel_network_device_ip:
+            errors.append("Tunnel IP address shouldn't be the same as physical device IP address")
+        self.enable_xdp = bool(entry.get("enable_xdp", False))
+        return errors
+
+    def add_watchers(self):
+        """
+        Non-interactive provisioning of many watchers from an inventory file:
+        defaults:
+          host_ip: 192.168.1.33
+          organisation: demo
+        devices:
+          - {mode: gre, device_ip: 192.168.1.35, tunnel_subnet: 10.10.25.32/30, gre_num: 1025, area_num: 49.0001, asn: 65001}
+          - {mode: bgpls, router_ip: 192.168.1.36, router_as: 65001, watcher_as: 65001, router_id: 10.10.10.10, area_num: 49.0002}
+        All devices are validated first, nothing is created if any of them has an error.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        if not args.inventory:
+            raise ValueError("Please provide an inventory file with --inventory <file>.yml")
+        with open(args.inventory) as f:
+            inventory = get_ruamel_yaml("safe").load(f) or {}
+        defaults, devices = inventory.get("defaults") or {}, inventory.get("devices") or []
+        if not devices:
+            raise ValueError(f"No devices are found in {args.inventory}")
+        # templates are read once and shared between all watchers
+        router_jinja_env = self.router_jinja_env
+        watchers, errors_dd = [], {}
+        registry = self.get_registry()
+        ipam = P2P_VETH_IPAM.load(registry)
+        seen_dd = {}
+        for device_num, (watcher_num, device) in enumerate(zip(self.gen_next_free_numbers(len(devices)), devices), start=1):
+            watcher_obj = WATCHER_CONFIG(watcher_num, protocol=self.protocol)
+            watcher_obj._router_jinja_env = router_jinja_env
+            device_name = f"#{device_num} {device.get('device_ip') or device.get('router_ip') or ''}".strip()
+            errors = watcher_obj.import_from_inventory(device, defaults)
+            if not errors and watcher_obj.connection_mode == "gre":
+                try:
+                    watcher_obj.allocate_p2p_veth_network(ipam)
+                except ValueError as e:
+                    errors.append(str(e))
+            if not errors:
+                # duplicates inside the inventory and among existing watchers
+                keys = [("device", watcher_obj.connection_mode, watcher_obj.gre_tunnel_network_device_ip or watcher_obj.bgpls_router_ip)]
+                if watcher_obj.connection_mode == "gre":
+                    keys.append(("veth", watcher_obj.host_veth))
+                for key in keys:
+                    if key in seen_dd:
+                        errors.append(f"{key[0]} {key[-1]} is the same as for {seen_dd[key]}")
+                    seen_dd[key] = device_name
+                if registry.find_device(*keys[0][1:]):
+                    errors.append(f"{keys[0][-1]} is already connected to {registry.find_device(*keys[0][1:])}")
+                if watcher_obj.connection_mode == "gre" and registry.find_host_veth(watcher_obj.host_veth):
+                    errors.append(f"Interface {watcher_obj.host_veth} is already used by {registry.find_host_veth(watcher_obj.host_veth)}")
+            if errors:
+                errors_dd[device_name] = errors
+            watchers.append(watcher_obj)
+        if errors_dd:
+            for device_name, errors in errors_dd.items():
+                print(f"{device_name}: {'; '.join(errors)}")
+            raise ValueError(f"{len(errors_dd)} of {len(devices)} devices in {args.inventory} are not valid, nothing was created")
+        ipam.save()
+        if any(watcher_obj.enable_topolograph for watcher_obj in watchers):
+            # .env is shared by all watchers
+            next(watcher_obj for watcher_obj in watchers if watcher_obj.enable_topolograph)._add_topolograph_host_to_env()
+        with ThreadPoolExecutor(max_workers=self.ADD_WATCHERS_MAX_WORKERS) as pool:
+            list(pool.map(lambda watcher_obj: watcher_obj.create_folder_with_settings(), watchers))
+        for watcher_obj in watchers:
+            print(f"{watcher_obj.watcher_folder_name} is created")
+        print(f"Config of {len(watchers)} watchers has been successfully generated!")
+
     def stop_watcher(self):
         raise NotImplementedError("Not implemented yet. Please run manually `sudo clab destroy --topo <path to config.yml>`")
 
@@ -811,6 +1312,11 @@ class WATCHER_CONFIG:
         raise NotImplementedError("Not implemented yet. Please run manually `sudo docker ps -f label=clab-node-name=router`")
 
     def diagnostic(self):
+        if args.monitor:
+            return self.diagnostic_monitor()
+        if args.all:
+            return self.diagnostic_all()
+        diagnostic = import_diagnostic()
         print(f"Diagnostic connection is started")
         self.import_from(watcher_num=args.watcher_num)
         diag_watcher_host = diagnostic.WATCHER_HOST(
@@ -818,28 +1324,105 @@ class WATCHER_CONFIG:
             watcher_internal_ip=self.p2p_veth_watcher_ip,
             network_device_ip=self.gre_tunnel_network_device_ip
         )
-        diag_watcher_host.does_conntrack_exist_for_gre()
-        # print(f"Please wait {diag_watcher_host.DUMP_FILTER_TIMEOUT} sec")
-        diag_watcher_host.run()
-        diagnostic.IPTABLES_NAT_FOR_REMOTE_NETWORK_DEVICE_UNIQUE.check(self.gre_tunnel_network_device_ip)
-        if diag_watcher_host.is_watcher_alive:
-            diagnostic.IPTABLES_FRR_NETNS_FORWARD_TO_NETWORK_DEVICE_BEFORE_NAT.check(self.gre_tunnel_network_device_ip)
-        if diag_watcher_host.is_network_device_alive:
-            is_passed = diagnostic.IPTABLES_REMOTE_NETWORK_DEVICE_FORWARD_TO_FRR_NETNS.check(self.gre_tunnel_network_device_ip)
+        diag_watcher_host.capture_backend = args.capture_backend
+        conntracks_ll = diagnostic.CONNTRACK_ENTRY.from_file(args.conntrack_file) if args.conntrack_file else None
+        diag_watcher_host.does_conntrack_exist_for_gre(conntracks_ll)
+        if args.pcap:
+            diag_watcher_host.run_offline(args.pcap)
+        else:
+            # print(f"Please wait {diag_watcher_host.DUMP_FILTER_TIMEOUT} sec")
+            diag_watcher_host.run(ring_buffer=self.get_ring_buffer(diagnostic), capture_sec=args.capture_sec)
+        is_watcher_alive = diag_watcher_host.is_watcher_alive
+        is_network_device_alive = diag_watcher_host.is_network_device_alive
+        if args.pcap:
+            print("Iptables checks are skipped, their counters don't belong to the time of saved captures")
+            return
+        # nat and filter tables are dumped once for all checks
+        iptables_snapshot = diagnostic.IPTABLES_SNAPSHOT.get()
+        diagnostic.IPTABLES_NAT_FOR_REMOTE_NETWORK_DEVICE_UNIQUE.check(self.gre_tunnel_network_device_ip, iptables_snapshot)
+        if is_watcher_alive:
+            diagnostic.IPTABLES_FRR_NETNS_FORWARD_TO_NETWORK_DEVICE_BEFORE_NAT.check(self.gre_tunnel_network_device_ip, iptables_snapshot)
+        if is_network_device_alive:
+            is_passed = diagnostic.IPTABLES_REMOTE_NETWORK_DEVICE_FORWARD_TO_FRR_NETNS.check(self.gre_tunnel_network_device_ip, iptables_snapshot)
             if not is_passed:
-                diagnostic.IPTABLES_REMOTE_NETWORK_DEVICE_NAT_TO_FRR_NETNS.check(self.gre_tunnel_network_device_ip)
+                diagnostic.IPTABLES_REMOTE_NETWORK_DEVICE_NAT_TO_FRR_NETNS.check(self.gre_tunnel_network_device_ip, iptables_snapshot)
+
+    @staticmethod
+    def get_ring_buffer(diagnostic):
+        if not args.ring_buffer:
+            return None
+        return diagnostic.PCAP_RING_BUFFER(args.ring_buffer, file_size_mb=args.ring_file_size_mb, files_num=args.ring_files)
+
+    def get_gre_watchers(self, only_watcher_num=0):
+        """ Watchers in GRE mode as dicts for diagnostic.FLEET_WATCHER_HOST, all of them or the given one """
+        watchers = []
+        registry = self.get_registry()
+        watcher_nums = sorted(registry.by_watcher_num)
+        if only_watcher_num:
+            watcher_nums = [watcher_num for watcher_num in watcher_nums if watcher_num == only_watcher_num]
+        for watcher_num in watcher_nums:
+            folder_name = registry.by_watcher_num[watcher_num]
+            watcher_obj = WATCHER_CONFIG(watcher_num)
+            watcher_obj.import_from(watcher_num=watcher_num)
+            if watcher_obj.connection_mode != "gre":
+                print(f"{folder_name} is skipped, diagnostic is available for GRE mode only")
+                continue
+            watchers.append({
+                'watcher_name': watcher_obj.watcher_folder_name,
+                'host_veth': watcher_obj.host_veth,
+                'watcher_internal_ip': watcher_obj.p2p_veth_watcher_ip,
+                'network_device_ip': watcher_obj.gre_tunnel_network_device_ip,
+            })
+        return watchers
+
+    def diagnostic_all(self):
+        """ Diagnostic of all GRE watchers on the host with a single capture """
+        diagnostic = import_diagnostic()
+        print(f"Diagnostic of all watchers is started")
+        watchers = self.get_gre_watchers()
+        if not watchers:
+            print("No GRE watchers found")
+            return
+        fleet_watcher_host = diagnostic.FLEET_WATCHER_HOST(watchers)
+        fleet_watcher_host.capture_backend = args.capture_backend
+        reports = fleet_watcher_host.check(
+            pcap_paths=args.pcap,
+            conntracks_ll=diagnostic.CONNTRACK_ENTRY.from_file(args.conntrack_file) if args.conntrack_file else None,
+            ring_buffer=self.get_ring_buffer(diagnostic),
+            capture_sec=args.capture_sec,
+        )
+        diagnostic.FLEET_WATCHER_HOST.print_table(reports)
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump(reports, f, indent=2)
+            print(f"JSON report is saved to {args.report}")
+
+    def diagnostic_monitor(self):
+        """ Continuous monitor of hellos of all GRE watchers, or of --watcher_num only """
+        diagnostic = import_diagnostic()
+        watchers = self.get_gre_watchers(only_watcher_num=args.watcher_num)
+        if not watchers:
+            print("No GRE watchers found")
+            return
+        print(f"Monitoring hellos of {len(watchers)} watchers, press Ctrl+C to stop")
+        hello_monitor = diagnostic.HELLO_MONITOR(watchers, default_holding_time_sec=args.hold_time_sec)
+        hello_monitor.capture_backend = args.capture_backend
+        hello_monitor.monitor(
+            report_interval_sec=args.interval_sec, report_path=args.report, duration_sec=args.capture_sec,
+        )
 
     def enable_xdp(self):
         self.import_from(watcher_num=args.watcher_num)
         current_clab_config = self.watcher_config_file_yml
         if not current_clab_config:
             raise ValueError(f"config file for watcher #{args.watcher_num} was not found")
-        current_clab_config['topology']['nodes'].setdefault(self.ISIS_FILTER_NODE_NAME, dict()).update( copy.deepcopy(self.watcher_config_template_yml['topology']['nodes'][self.ISIS_FILTER_NODE_NAME]) )
+        watcher_config_template_yml = self.watcher_config_template_yml
+        current_clab_config['topology']['nodes'].setdefault(self.ISIS_FILTER_NODE_NAME, dict()).update( watcher_config_template_yml['topology']['nodes'][self.ISIS_FILTER_NODE_NAME] )
         current_clab_config['topology']['nodes'][self.ISIS_FILTER_NODE_NAME]['image'] = self.ISIS_FILTER_NODE_IMAGE
         current_clab_config['topology']['nodes'][self.ISIS_FILTER_NODE_NAME]['network-mode'] = "host"
         current_clab_config['topology']['nodes'][self.ISIS_FILTER_NODE_NAME]['env']['VTAP_HOST_INTERFACE'] = self.host_veth
 
-        current_clab_config['topology']['nodes']['h2'].setdefault('stages', dict()).update( copy.deepcopy(self.watcher_config_template_yml['topology']['nodes']['h2']['stages']) )
+        current_clab_config['topology']['nodes']['h2'].setdefault('stages', dict()).update( watcher_config_template_yml['topology']['nodes']['h2']['stages'] )
         self._do_save_watcher_config_file(current_clab_config)
         print("XDP enabled")
 
@@ -860,12 +1443,52 @@ if __name__ == '__main__':
         description="Provisioning Watcher instances for tracking IS-IS topology changes"
     )
     parser.add_argument(
-        "--action", required=True, help="Options: add_watcher, enable_xdp, disable_xdp, diagnostic"
+        "--action", required=True, help="Options: add_watcher, add_watchers, enable_xdp, disable_xdp, diagnostic"
     )
     parser.add_argument(
         "--watcher_num", required=False, default=0, type=int, help="Number of watcher"
     )
-    
+    parser.add_argument(
+        "--all", required=False, action="store_true", help="Run diagnostic for all watchers at once"
+    )
+    parser.add_argument(
+        "--inventory", required=False, default="", help="Path to YAML file with devices for add_watchers"
+    )
+    parser.add_argument(
+        "--report", required=False, default="", help="Path to save JSON report of diagnostic --all, rewritten every --interval-sec by --monitor"
+    )
+    parser.add_argument(
+        "--pcap", required=False, nargs="+", default=[], help="Run diagnostic over saved captures instead of live capture: pcap/pcapng files or ring buffer folders"
+    )
+    parser.add_argument(
+        "--conntrack-file", required=False, default="", help="Output of `conntrack -L` saved at the time of the capture, live conntrack is read otherwise"
+    )
+    parser.add_argument(
+        "--ring-buffer", required=False, default="", help="Folder to save live capture of diagnostic as a ring buffer of pcap files"
+    )
+    parser.add_argument(
+        "--ring-file-size-mb", required=False, default=10, type=float, help="Size of a single file of the ring buffer"
+    )
+    parser.add_argument(
+        "--ring-files", required=False, default=10, type=int, help="Number of files of the ring buffer, the oldest one is overwritten"
+    )
+    parser.add_argument(
+        "--capture-backend", required=False, default="auto", choices=["auto", "raw", "scapy"],
+        help="Live capture of diagnostic: raw AF_PACKET sockets, scapy, or raw if it's available (default)"
+    )
+    parser.add_argument(
+        "--monitor", required=False, action="store_true", help="Monitor hellos of all GRE watchers (or --watcher_num) until Ctrl+C, alert on gaps longer than holding time"
+    )
+    parser.add_argument(
+        "--interval-sec", required=False, default=60, type=int, help="Interval to print and save hello stats of --monitor"
+    )
+    parser.add_argument(
+        "--hold-time-sec", required=False, default=30, type=int, help="Holding time until the first hello advertises its own"
+    )
+    parser.add_argument(
+        "--capture-sec", required=False, default=0, type=int, help="Duration of live capture. 10sec by default, until Ctrl+C with --ring-buffer and --monitor"
+    )
+
     args = parser.parse_args()
     allowed_actions = [actions.value for actions in ACTIONS]
     if args.action not in allowed_actions:
@@ -1,20 +1,29 @@
 from abc import abstractmethod
-from scapy.all import AsyncSniffer, IP, SndRcvList, PacketList, sniff
+from scapy.all import AsyncSniffer, GRE, IP, SndRcvList, PacketList, PcapReader, PcapWriter, sniff
 from scapy.config import conf
 import netns
-import re
+import os
 import logging
+import select
+import socket
+import struct
 import sys
+import threading
+import time
 
 logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 log = logging.getLogger(__name__)
 
 import subprocess
 import tempfile
+from typing import NamedTuple
 
 class LinuxCommandNotFound(Exception):
     pass
 
+class LinuxCommandFailed(Exception):
+    pass
+
 class LINUX_HOST:
 
     @staticmethod
@@ -38,68 +47,495 @@ class LINUX_HOST:
                 raise LinuxCommandNotFound(_msg)
         return output, err, proc.returncode
     
-    def get_conntrack(self, if_raise=None):
+    def iter_conntrack(self, proto=None, src=None, dst=None, if_raise=None):
+        """
+        Yield conntrack entries one by one. Entries are filtered by the kernel by protocol and
+        original source/destination, so only matched entries reach Python
+        gre      47 29 src=169.254.4.2 dst=192.168.1.35 srckey=0x0 dstkey=0x0 src=192.168.1.35 dst=192.168.1.33 srckey=0x0 dstkey=0x0 mark=0 use=1
+        """
+        command = ['conntrack', '-L']
+        if proto is not None:
+            command += ['-p', str(proto)]
+        if src:
+            command += ['--src', src]
+        if dst:
+            command += ['--dst', dst]
+        with tempfile.TemporaryFile() as stderr_f:
+            try:
+                proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_f, text=True)
+            except OSError:
+                _msg = f"The {command} command is not available. Make sure it's installed."
+                log.critical(_msg)
+                if if_raise:
+                    raise LinuxCommandNotFound(_msg)
+                return
+            with proc:
+                for line in proc.stdout:
+                    conntrack = CONNTRACK_ENTRY.from_line(line)
+                    if conntrack is not None:
+                        yield conntrack
+                if proc.wait() != 0:
+                    # the temporary file is binary
+                    stderr_f.seek(0)
+                    _msg = f"Error executing conntrack: {stderr_f.read().decode(errors='replace').strip()}"
+                    log.critical(_msg)
+                    if if_raise:
+                        raise LinuxCommandFailed(_msg)
+
+    def get_conntrack(self, if_raise=None, **filters):
         """ Return a list of conntracks"""
-        conntracks_ll = []
-        out, err, returncode = self.subprocess_output(['conntrack', '-L'], if_raise=if_raise)
-        if out is not None and isinstance(out, bytes):
-            out = out.decode('utf-8')
-        if returncode == 0:
-            conntrack_re = re.compile(r'(?P<proto_name>\w+)\s+(?P<proto_num>\d+).*src=(?P<inner_src_ip>[\d.]+)\s+dst=(?P<inner_dst_ip>[\d.]+)\s.*src=(?P<outer_src_ip>[\d.]+)\s+dst=(?P<outer_dst_ip>[\d.]+)')
-            conntrack_lines = out.splitlines()
-            for line in conntrack_lines:
-                conntrack_match = conntrack_re.match(line)
-                if conntrack_match:
-                    conntracks_ll.append(conntrack_match.groupdict())
-        else:
-            log.critical(f"Error executing conntrack: {err}")
-        return conntracks_ll
+        return list(self.iter_conntrack(if_raise=if_raise, **filters))
+
+
+class CONNTRACK_ENTRY(NamedTuple):
+    proto_name: str
+    proto_num: int
+    # original direction
+    inner_src_ip: str
+    inner_dst_ip: str
+    # reply direction
+    outer_src_ip: str
+    outer_dst_ip: str
+
+    @classmethod
+    def from_line(cls, line):
+        """ Return None if the line is not a conntrack entry, i.e. has no addresses of both directions """
+        fields = line.split()
+        if len(fields) < 2 or not fields[1].isdigit():
+            return None
+        src_ll = [field[4:] for field in fields if field.startswith('src=')]
+        dst_ll = [field[4:] for field in fields if field.startswith('dst=')]
+        if len(src_ll) < 2 or len(dst_ll) < 2:
+            return None
+        return cls(fields[0], int(fields[1]), src_ll[0], dst_ll[0], src_ll[1], dst_ll[1])
+
+    @classmethod
+    def from_file(cls, file_path):
+        """ Entries saved by `conntrack -L > file` at the time of the capture """
+        with open(file_path) as f:
+            return [conntrack for conntrack in map(cls.from_line, f) if conntrack is not None]
+
+
+class PCAP_RING_BUFFER:
+    """
+    Capture is written into files_num files of up to file_size_mb each, the oldest file is overwritten when
+    all of them are full (as tcpdump -C -W). Disk usage is bounded, so the capture can run for hours on a loaded host
+    and be analysed afterwards by reading the folder.
+    """
+    FILE_NAME = "{prefix}{num:03d}.pcap"
+
+    def __init__(self, folder_path, file_size_mb=10, files_num=10, prefix="diagnostic-") -> None:
+        os.makedirs(folder_path, exist_ok=True)
+        self.folder_path = folder_path
+        self.max_file_bytes = int(file_size_mb * 1024 * 1024)
+        self.files_num = max(files_num, 1)
+        self.prefix = prefix
+        self.file_num = -1
+        self.writer = None
+        self.packets_num = 0
+        self._next_file()
+
+    def _next_file(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.file_num = (self.file_num + 1) % self.files_num
+        file_path = os.path.join(self.folder_path, self.FILE_NAME.format(prefix=self.prefix, num=self.file_num))
+        self.writer = PcapWriter(file_path, append=False, sync=False)
+
+    def write(self, pkt):
+        self.writer.write(pkt)
+        self.packets_num += 1
+        if self.writer.f.tell() >= self.max_file_bytes:
+            self._next_file()
+
+    def close(self):
+        self.writer.close()
+        log.info(f"{self.packets_num} packets are saved to {self.folder_path}")
+
+    @staticmethod
+    def pcap_paths(paths):
+        """ Files as given, folders are expanded to their pcaps from the oldest to the newest """
+        pcap_paths = []
+        for path in paths:
+            if os.path.isdir(path):
+                folder_paths = [os.path.join(path, name) for name in os.listdir(path) if name.endswith(('.pcap', '.pcapng'))]
+                pcap_paths.extend(sorted(folder_paths, key=os.path.getmtime))
+            else:
+                pcap_paths.append(path)
+        return pcap_paths
+
+# GRE protocol type of IS-IS
+GRE_PROTO_OSI = 0x00fe
+ETH_P_ALL = 0x0003
+ETH_P_IP = 0x0800
+ETH_HEADER_SIZE = 14
+
+
+def decode_gre(frame, length):
+    """
+    (outer IP source, GRE protocol type) of an Ethernet frame carrying GRE over IPv4, None for anything else.
+    frame is bytes or a memoryview of the receive buffer, only the IP and GRE headers are read, nothing is copied
+    """
+    if length < ETH_HEADER_SIZE + 20 or frame[12] != 0x08 or frame[13] != 0x00 or frame[23] != WATCHER_HOST.CONNTRACK_PROTO_GRE:
+        return None
+    gre_offset = ETH_HEADER_SIZE + (frame[14] & 0x0f) * 4
+    if length < gre_offset + 4:
+        return None
+    return socket.inet_ntoa(frame[26:30]), frame[gre_offset + 2] << 8 | frame[gre_offset + 3]
+
+
+class CLASSIC_BPF:
+    """
+    Classic BPF programs for SO_ATTACH_FILTER of an AF_PACKET socket. They are assembled here, without libpcap,
+    and match the same packets as tcpdump expressions of BASE.dump_filter. Instruction is (code, jt, jf, k),
+    jt and jf are None (the next instruction), ACCEPT or DROP
+    """
+    LD_W_ABS, LD_H_ABS, LD_B_ABS = 0x20, 0x28, 0x30
+    LD_H_IND, LD_B_IND = 0x48, 0x50
+    LDX_B_MSH = 0xb1
+    ALU_AND_K = 0x54
+    JEQ_K, JGT_K, JGE_K, JSET_K = 0x15, 0x25, 0x35, 0x45
+    RET_K = 0x06
+    ACCEPT = "accept"
+    DROP = "drop"
+    SNAPLEN = 0x40000
+    SO_ATTACH_FILTER = 26
+
+    @classmethod
+    def gre(cls, src_hosts=(), is_isis_hello_only=False):
+        """ proto gre [and (src host A or src host B ...)], IS-IS hellos of GRE without options only if is_isis_hello_only """
+        program = [
+            (cls.LD_H_ABS, None, None, 12),
+            (cls.JEQ_K, None, cls.DROP, ETH_P_IP),
+            (cls.LD_B_ABS, None, None, 23),
+            (cls.JEQ_K, None, cls.DROP, WATCHER_HOST.CONNTRACK_PROTO_GRE),
+        ]
+        if is_isis_hello_only:
+            program += [
+                # GRE protocol type and IS-IS PDU type at the fixed offsets, as ip[22:2] and ip[28] of DUMP_FILTER_HELLO
+                (cls.LD_H_ABS, None, None, ETH_HEADER_SIZE + 22),
+                (cls.JEQ_K, None, cls.DROP, GRE_PROTO_OSI),
+                (cls.LD_B_ABS, None, None, ETH_HEADER_SIZE + 28),
+                (cls.ALU_AND_K, None, None, 0x1f),
+                (cls.JGE_K, None, cls.DROP, min(ISIS_HELLO_PDU_TYPES)),
+                (cls.JGT_K, cls.DROP, None, max(ISIS_HELLO_PDU_TYPES)),
+            ]
+        if src_hosts:
+            program.append((cls.LD_W_ABS, None, None, 26))
+            for host in src_hosts:
+                program.append((cls.JEQ_K, cls.ACCEPT, None, struct.unpack("!I", socket.inet_aton(host))[0]))
+            program.append((cls.RET_K, None, None, 0))
+        return cls.assemble(program)
+
+    @classmethod
+    def assemble(cls, program):
+        """ List of (code, jt, jf, k) with relative jumps, the program ends by accept and drop """
+        labels_dd = {cls.ACCEPT: len(program), cls.DROP: len(program) + 1}
+        instructions = []
+        for num, (code, jt, jf, k) in enumerate(program):
+            jump = lambda label: 0 if label is None else labels_dd[label] - num - 1
+            instructions.append((code, jump(jt), jump(jf), k))
+        instructions += [(cls.RET_K, 0, 0, cls.SNAPLEN), (cls.RET_K, 0, 0, 0)]
+        if any(jt > 255 or jf > 255 for _, jt, jf, _ in instructions):
+            raise ValueError("BPF program is too long")
+        return instructions
+
+    @classmethod
+    def attach(cls, sock, instructions):
+        import ctypes
+        filter_bytes = b"".join(struct.pack("HBBI", *instruction) for instruction in instructions)
+        filter_buffer = ctypes.create_string_buffer(filter_bytes, len(filter_bytes))
+        # struct sock_fprog {unsigned short len; struct sock_filter *filter;}
+        fprog = struct.pack("HL", len(instructions), ctypes.addressof(filter_buffer))
+        sock.setsockopt(socket.SOL_SOCKET, cls.SO_ATTACH_FILTER, fprog)
+
+
+class RAW_SNIFFER:
+    """
+    Capture by AF_PACKET sockets with a classic BPF filter, one socket per interface. Frames are received into
+    a preallocated buffer and handed to prn(interface, memoryview of the frame, length, kernel timestamp) without
+    scapy dissection. start(), stop(), join() and running are the same as of AsyncSniffer
+    """
+    BUFFER_SIZE = 65536
+    SO_TIMESTAMPNS = 35
+    SO_RCVBUF_BYTES = 4 * 1024 * 1024
+    POLL_INTERVAL_SEC = 0.2
+
+    def __init__(self, if_names, bpf_instructions, prn, stop_condition=None, nsname="") -> None:
+        self.prn = prn
+        self.stop_condition = stop_condition
+        self.results = []
+        self.sockets = []
+        try:
+            if nsname:
+                with netns.NetNS(nsname=nsname):
+                    self._open_sockets(if_names, bpf_instructions)
+            else:
+                self._open_sockets(if_names, bpf_instructions)
+        except OSError:
+            self.close()
+            raise
+        self.thread = None
+        self._is_stopped = threading.Event()
+
+    def _open_sockets(self, if_names, bpf_instructions):
+        for if_name in if_names:
+            # protocol 0 receives nothing until bind(), so no packet bypasses the filter
+            sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0)
+            self.sockets.append(sock)
+            CLASSIC_BPF.attach(sock, bpf_instructions)
+            sock.setsockopt(socket.SOL_SOCKET, self.SO_TIMESTAMPNS, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.SO_RCVBUF_BYTES)
+            sock.bind((if_name, ETH_P_ALL))
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="raw-sniffer", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        buffer = bytearray(self.BUFFER_SIZE)
+        view = memoryview(buffer)
+        ancillary_size = socket.CMSG_SPACE(16)
+        sockets = self.sockets
+        prn = self.prn
+        try:
+            while not self._is_stopped.is_set():
+                readable, _, _ = select.select(sockets, [], [], self.POLL_INTERVAL_SEC)
+                for sock in readable:
+                    length, ancdata, _, address = sock.recvmsg_into([buffer], ancillary_size)
+                    pkt_time = time.time()
+                    for level, cmsg_type, data in ancdata:
+                        if level == socket.SOL_SOCKET and cmsg_type == self.SO_TIMESTAMPNS and len(data) >= 16:
+                            seconds, nanoseconds = struct.unpack_from("qq", data)
+                            pkt_time = seconds + nanoseconds / 1e9
+                    prn(address[0], view, length, pkt_time)
+                    if self.stop_condition is not None and self.stop_condition():
+                        return
+        finally:
+            self.close()
+
+    def stop(self):
+        self._is_stopped.set()
+        self.join()
+
+    def join(self):
+        if self.thread is not None:
+            self.thread.join()
+
+    def close(self):
+        for sock in self.sockets:
+            sock.close()
+
 
 class BASE:
 
     DUMP_FILTER_GRE = "proto gre"
     DUMP_FILTER_TIMEOUT = 10
-    def __init__(self, if_names, nsname="") -> None:
+    # too long BPF filter can't be attached to a socket, capture all GRE instead
+    DUMP_FILTER_MAX_HOSTS = 64
+    def __init__(self, if_names, nsname="", store=False) -> None:
         # variable to sniff packets
         self.if_names = if_names if isinstance(if_names, list) else [if_names]
         self.nsname = nsname
+        # captured packets are kept only on demand, liveness is decided by seen_sources as packets arrive
+        self.store = store
         self.packets: PacketList = []
+        # (interface, outer IP source) of captured GRE packets, any GRE proves liveness of the tunnel
+        self.seen_sources = set()
+        # the same of GRE packets carrying IS-IS (protocol type 0x00fe), reported separately
+        self.isis_sources = set()
+        # PCAP_RING_BUFFER, captured packets are saved there as well
+        self.ring_buffer = None
+        # raw: AF_PACKET sockets, only outer IP and GRE headers are decoded. scapy: AsyncSniffer with full dissection.
+        # auto: raw if it's available and packets don't have to be stored or saved to a ring buffer
+        self.capture_backend = "auto"
+
+    def init_watchers(self, watchers, nsname="", store=False) -> None:
+        """
+        Capture on host veths of several watchers. watchers: list of dicts with watcher_name, host_veth,
+        watcher_internal_ip and network_device_ip keys. Watchers without a host veth are not running
+        """
+        self.watchers = watchers
+        self.missing_if_names = {w['host_veth'] for w in watchers if not os.path.exists(f"/sys/class/net/{w['host_veth']}")}
+        BASE.__init__(self, sorted({w['host_veth'] for w in watchers} - self.missing_if_names), nsname, store)
+
+    @staticmethod
+    def print_columns(reports, columns):
+        """ Print reports as a table, columns: list of (report key, title) """
+        format_value = lambda value: '-' if value is None else ('yes' if value is True else ('no' if value is False else str(value)))
+        rows = [[title for _, title in columns]] + [[format_value(report.get(key)) for key, _ in columns] for report in reports]
+        widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+        for row in rows:
+            print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+    @property
+    def expected_sources(self):
+        """ (interface, IP source) pairs, capture is stopped as soon as all of them are seen. Interface None matches any """
+        return set()
+
+    @property
+    def dump_filter(self):
+        hosts = sorted({src for _, src in self.expected_sources})
+        if not hosts or len(hosts) > self.DUMP_FILTER_MAX_HOSTS:
+            return self.DUMP_FILTER_GRE
+        return f"{self.DUMP_FILTER_GRE} and ({' or '.join(f'src host {host}' for host in hosts)})"
+
+    @property
+    def bpf_instructions(self):
+        """ dump_filter for the raw capture backend """
+        hosts = sorted({src for _, src in self.expected_sources})
+        return CLASSIC_BPF.gre(hosts if len(hosts) <= self.DUMP_FILTER_MAX_HOSTS else ())
 
     @property
     def sniffer(self):
         if hasattr(self, "_sniffer"):
             return self._sniffer
+        expected_sources = self.expected_sources
+        self._pending_sources = set(expected_sources)
+        # capture into a ring buffer lasts until the timeout
+        stop_condition = lambda: bool(expected_sources) and not self._pending_sources and self.ring_buffer is None
+        if self.capture_backend == "raw" or (self.capture_backend == "auto" and not self.store and self.ring_buffer is None):
+            try:
+                self._sniffer = RAW_SNIFFER(self.if_names, self.bpf_instructions, self.on_frame, stop_condition, self.nsname)
+                return self._sniffer
+            except (OSError, AttributeError, ValueError) as e:
+                # AttributeError: no AF_PACKET on this platform
+                if self.capture_backend == "raw":
+                    raise
+                log.info(f"Raw capture is not available, scapy is used: {e}")
         if self.nsname:
             self.change_netns(self.nsname)
-        self._sniffer = AsyncSniffer(iface=self.if_names, filter=self.DUMP_FILTER_GRE)
+        self._sniffer = AsyncSniffer(
+            iface=self.if_names, filter=self.dump_filter, store=self.store, prn=self.on_packet,
+            stop_filter=lambda pkt: stop_condition(),
+        )
         return self._sniffer
 
+    def on_frame(self, if_name, frame, length, pkt_time) -> None:
+        """ Frame of the raw capture backend """
+        decoded = decode_gre(frame, length)
+        if decoded is not None:
+            self.on_source(if_name, decoded[0], decoded[1] == GRE_PROTO_OSI)
+
+    def on_packet(self, pkt) -> None:
+        if self.ring_buffer is not None:
+            self.ring_buffer.write(pkt)
+        gre = pkt.getlayer(GRE)
+        if gre is None:
+            return
+        self.on_source(pkt.sniffed_on, pkt[IP].src, gre.proto == GRE_PROTO_OSI)
+
+    def on_source(self, if_name, src, is_isis=False) -> None:
+        self.seen_sources.add((if_name, src))
+        if is_isis:
+            self.isis_sources.add((if_name, src))
+        if self._pending_sources:
+            self._pending_sources.discard((if_name, src))
+            self._pending_sources.discard((None, src))
+
+    def is_source_seen(self, src, if_name=None, sources=None):
+        sources = self.seen_sources if sources is None else sources
+        if if_name is not None:
+            # packets of saved captures may have no interface
+            return (if_name, src) in sources or (None, src) in sources
+        return any(seen_src == src for _, seen_src in sources)
+
+    def is_isis_seen(self, src, if_name=None):
+        return self.is_source_seen(src, if_name, self.isis_sources)
+
     @staticmethod
     def change_netns(nsname) -> None:
         with netns.NetNS(nsname=nsname):
             conf.ifaces.reload()  # Reload interface list
             conf.route.resync()  # Reload IPv4 routes
 
-    def do_print_progress_bar(self, timeout=10):
+    def do_print_progress_bar(self, timeout=10, stop_condition=None):
         import time
         import sys
-        for i in range(1, timeout+1):
-            sys.stdout.write('\r')
-            # the exact output you're looking for:
-            sys.stdout.write("[%-10s] %dsec" % ('='*i, i))
-            sys.stdout.flush()
-            time.sleep(1)
+        start = time.monotonic()
+        printed_sec = 0
+        while time.monotonic() - start < timeout:
+            if stop_condition is not None and stop_condition():
+                break
+            i = int(time.monotonic() - start) + 1
+            if i != printed_sec:
+                printed_sec = i
+                sys.stdout.write('\r')
+                # the exact output you're looking for:
+                sys.stdout.write("[%-10s] %dsec" % ('='*i, i))
+                sys.stdout.flush()
+            time.sleep(0.1)
         sys.stdout.write('\n\r')
 
-    def run(self, nsname="") -> None:
+    def run(self, nsname="", ring_buffer=None, capture_sec=0) -> None:
+        """
+        Live capture for DUMP_FILTER_TIMEOUT, stopped as soon as all expected sources are seen.
+        With a ring buffer the capture is saved and lasts for capture_sec, or until Ctrl+C if it's 0
+        """
         if nsname:
             self.change_netns(nsname)
-        log.info(f"Start listening {self.if_names} interfaces")
+        self.ring_buffer = ring_buffer
+        log.info(f"Start listening {self.if_names} interfaces, filter: {self.dump_filter}")
         self.sniffer.start()
-        # time.sleep(self.DUMP_FILTER_TIMEOUT)
-        self.do_print_progress_bar(self.DUMP_FILTER_TIMEOUT)
-        self.sniffer.stop()
-        self.packets = self.sniffer.results
+        try:
+            if ring_buffer is None:
+                # the sniffer stops itself by stop_filter when hellos from all expected sources are seen
+                self.do_print_progress_bar(capture_sec or self.DUMP_FILTER_TIMEOUT, stop_condition=lambda: not self.sniffer.running)
+            else:
+                log.info(f"Capture is saved to {ring_buffer.folder_path}, {'press Ctrl+C to stop' if not capture_sec else f'for {capture_sec}sec'}")
+                start = time.monotonic()
+                while self.sniffer.running and (not capture_sec or time.monotonic() - start < capture_sec):
+                    time.sleep(0.5)
+        except KeyboardInterrupt:
+            log.info("Capture is stopped")
+        if self.sniffer.running:
+            self.sniffer.stop()
+        else:
+            self.sniffer.join()
+        if ring_buffer is not None:
+            ring_buffer.close()
+        if self.store:
+            self.packets = self.sniffer.results
+
+    def run_offline(self, pcap_paths) -> None:
+        """
+        The same analysis over saved captures (pcap, pcapng or folders of a ring buffer). Packets are streamed
+        by PcapReader one at a time, reading is stopped as soon as all expected sources are seen
+        """
+        expected_srcs = {src for _, src in self.expected_sources}
+        pending_srcs = set(expected_srcs)
+        first_time = last_time = None
+        packets_num = 0
+        for pcap_path in PCAP_RING_BUFFER.pcap_paths(pcap_paths):
+            log.info(f"Reading {pcap_path}")
+            with PcapReader(pcap_path) as reader:
+                for pkt in reader:
+                    packets_num += 1
+                    first_time = pkt.time if first_time is None else first_time
+                    last_time = pkt.time
+                    ip = pkt.getlayer(IP)
+                    gre = pkt.getlayer(GRE)
+                    # the same as DUMP_FILTER_GRE of the live capture
+                    if ip is None or gre is None:
+                        continue
+                    self.seen_sources.add((pkt.sniffed_on, ip.src))
+                    if gre.proto == GRE_PROTO_OSI:
+                        self.isis_sources.add((pkt.sniffed_on, ip.src))
+                    pending_srcs.discard(ip.src)
+                    if self.store:
+                        self.packets.append(pkt)
+                    if expected_srcs and not pending_srcs:
+                        break
+            if expected_srcs and not pending_srcs:
+                break
+        if packets_num:
+            log.info(f"{packets_num} packets are read, captured within {float(last_time - first_time):.1f}sec")
+        else:
+            log.warning("Saved captures have no packets")
 
     @abstractmethod
     def is_watcher_alive(self):
@@ -117,19 +553,17 @@ class WATCHER_NS(BASE):
         self.network_device_ip = network_device_ip
         super().__init__(if_names, nsname)
 
+    @property
+    def expected_sources(self):
+        return {(None, self.watcher_internal_ip), (None, self.network_device_ip)}
+
     @property
     def is_watcher_alive(self):
-        for pkt in self.packets:
-            if pkt[IP].src == self.watcher_internal_ip:
-                return True
-        return False
+        return self.is_source_seen(self.watcher_internal_ip)
     
     @property
     def is_network_device_alive(self):
-        for pkt in self.packets:
-            if pkt[IP].src == self.network_device_ip:
-                return True
-        return False
+        return self.is_source_seen(self.network_device_ip)
 
 
 class WATCHER_HOST(BASE):
@@ -137,21 +571,26 @@ class WATCHER_HOST(BASE):
     13:49:31.853767 IP 169.254.2.2 > 192.168.1.35: GREv0, length 72: IP 10.10.25.33 > 224.0.0.5: OSPFv2, Hello, length 48
     13:49:32.853323 IP 192.168.1.35 > 169.254.2.2: GREv0, length 72: IP 10.10.25.35 > 224.0.0.5: OSPFv2, Hello, length 48
     """
+    CONNTRACK_PROTO_GRE = 47
     def __init__(self, if_names, watcher_internal_ip, network_device_ip) -> None:
         self.watcher_internal_ip = watcher_internal_ip
         self.network_device_ip = network_device_ip
         super().__init__(if_names)
 
+    @property
+    def expected_sources(self):
+        return {(None, self.watcher_internal_ip), (None, self.network_device_ip)}
+
+    def warn_if_no_isis(self, src, sender):
+        if not self.is_isis_seen(src):
+            log.warning(f"{sender} sends GRE packets, but none of them carries IS-IS (GRE protocol type 0x00fe)")
+
     @property
     def is_watcher_alive(self):
-        for pkt in self.packets:
-            try:
-                if pkt[IP].src == self.watcher_internal_ip:
-                    log.info("Watcher is alive")
-                    return True
-            except IndexError:
-                # Layer IP not found
-                pass
+        if self.is_source_seen(self.watcher_internal_ip):
+            log.info("Watcher is alive")
+            self.warn_if_no_isis(self.watcher_internal_ip, "FRR watcher")
+            return True
         log.critical(
             """FRR watcher doesn't send IS-IS hellos over GRE. Please make sure that:
                 1.FRR is running\n
@@ -161,14 +600,10 @@ class WATCHER_HOST(BASE):
 
     @property
     def is_network_device_alive(self):
-        for pkt in self.packets:
-            try:
-                if pkt[IP].src == self.network_device_ip:
-                    log.info("Network device is alive")
-                    return True
-            except IndexError:
-                # Layer IP not found
-                pass
+        if self.is_source_seen(self.network_device_ip):
+            log.info("Network device is alive")
+            self.warn_if_no_isis(self.network_device_ip, "Network device")
+            return True
         log.critical(
             """Network device doesn't send IS-IS hellos over GRE. Please make sure that:
                 1.Network device has GRE interface configured \n
@@ -192,36 +627,415 @@ class WATCHER_HOST(BASE):
         if self.is_watcher_alive and self.is_network_device_alive:
             log.info("Watcher and Network device have reachability")
 
-    def does_conntrack_exist_for_gre(self):
+    def does_conntrack_exist_for_gre(self, conntracks_ll=None):
         """ Check if connection for the network device exist. If new watcher has been created - no conntrack should exist for the same device
         gre      47 29 src=169.254.4.2 dst=192.168.1.35 srckey=0x0 dstkey=0x0 src=192.168.1.35 dst=192.168.1.33 srckey=0x0 dstkey=0x0 mark=0 use=1
 
         """
-        conntracks_ll = LINUX_HOST().get_conntrack()
+        if conntracks_ll is None:
+            conntracks_ll = LINUX_HOST().iter_conntrack(proto=self.CONNTRACK_PROTO_GRE, dst=self.network_device_ip)
         for conntrack in conntracks_ll:
-            if conntrack['proto_name'] != 'gre':
+            if conntrack.proto_name != 'gre':
                 continue
-            if conntrack['inner_dst_ip'] == self.network_device_ip:
+            if conntrack.inner_dst_ip == self.network_device_ip:
                 log.critical(
                     f"""conntrack found {conntrack} for {self.network_device_ip}.
                     Remove it running:
-                    sudo conntrack -D --src={conntrack['inner_src_ip']} or
+                    sudo conntrack -D --src={conntrack.inner_src_ip} or
                     sudo conntrack -D --dst={self.network_device_ip}"""
                 )
                 return True
         log.info(f"No conntrack connections found. Good to proceed.")
+        return False
+
 
-class IPTABLE_ENTRY_IP:
-    def __init__(self, ip:str) -> None:
+class FLEET_WATCHER_HOST(BASE):
+    """
+    Diagnostic of all GRE watchers at once: a single capture on all host veths,
+    conntrack and iptables are read once, checks are run in a worker pool while packets are being captured.
+    """
+    MAX_WORKERS = 16
+
+    def __init__(self, watchers) -> None:
+        self.init_watchers(watchers)
+
+    @property
+    def expected_sources(self):
+        expected_sources = set()
+        for w in self.watchers:
+            if w['host_veth'] not in self.missing_if_names:
+                expected_sources.update({(w['host_veth'], w['watcher_internal_ip']), (w['host_veth'], w['network_device_ip'])})
+        return expected_sources
+
+    def is_watcher_alive_for(self, watcher):
+        return self.is_source_seen(watcher['watcher_internal_ip'], watcher['host_veth'])
+
+    def is_network_device_alive_for(self, watcher):
+        return self.is_source_seen(watcher['network_device_ip'], watcher['host_veth'])
+
+    @property
+    def is_watcher_alive(self):
+        return all(self.is_watcher_alive_for(w) for w in self.watchers)
+
+    @property
+    def is_network_device_alive(self):
+        return all(self.is_network_device_alive_for(w) for w in self.watchers)
+
+    @staticmethod
+    def check_before_capture(watcher, conntracks_ll, iptables_snapshot):
+        """
+        Checks which don't depend on captured packets. conntracks_ll and iptables_snapshot are None if they
+        can't be read on this host, it's logged once by check() and these checks are skipped
+        """
+        watcher_host = WATCHER_HOST(if_names=[watcher['host_veth']], watcher_internal_ip=watcher['watcher_internal_ip'], network_device_ip=watcher['network_device_ip'])
+        return {
+            'conntrack_exists': bool(watcher_host.does_conntrack_exist_for_gre(conntracks_ll)) if conntracks_ll is not None else None,
+            'nat_unique': IPTABLES_NAT_FOR_REMOTE_NETWORK_DEVICE_UNIQUE.check(watcher['network_device_ip'], iptables_snapshot) if iptables_snapshot is not None else None,
+        }
+
+    def check_after_capture(self, watcher, iptables_snapshot, is_offline=False):
+        network_device_ip = watcher['network_device_ip']
+        result = {
+            'veth_exists': watcher['host_veth'] not in self.missing_if_names if not is_offline else None,
+            'watcher_alive': self.is_watcher_alive_for(watcher),
+            'network_device_alive': self.is_network_device_alive_for(watcher),
+            'watcher_isis': self.is_isis_seen(watcher['watcher_internal_ip'], watcher['host_veth']),
+            'network_device_isis': self.is_isis_seen(watcher['network_device_ip'], watcher['host_veth']),
+            'frr_forward_to_device': None,
+            'device_forward_to_frr': None,
+            'device_nat_to_frr': None,
+        }
+        if is_offline or iptables_snapshot is None:
+            return result
+        if result['watcher_alive']:
+            result['frr_forward_to_device'] = IPTABLES_FRR_NETNS_FORWARD_TO_NETWORK_DEVICE_BEFORE_NAT.check(network_device_ip, iptables_snapshot)
+        if result['network_device_alive']:
+            result['device_forward_to_frr'] = IPTABLES_REMOTE_NETWORK_DEVICE_FORWARD_TO_FRR_NETNS.check(network_device_ip, iptables_snapshot)
+            if not result['device_forward_to_frr']:
+                result['device_nat_to_frr'] = IPTABLES_REMOTE_NETWORK_DEVICE_NAT_TO_FRR_NETNS.check(network_device_ip, iptables_snapshot)
+        return result
+
+    def check(self, pcap_paths=None, conntracks_ll=None, ring_buffer=None, capture_sec=0):
+        """
+        Return a list of per-watcher reports. With pcap_paths liveness is taken from saved captures and
+        iptables checks are skipped, their counters don't belong to the time of the capture
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        if pcap_paths:
+            # interfaces of the host don't matter for saved captures
+            self.missing_if_names = set()
+        if self.missing_if_names:
+            log.critical(f"Interfaces {', '.join(sorted(self.missing_if_names))} are not found, these watchers are not running")
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as pool:
+            if conntracks_ll is None:
+                # GRE entries only, filtered by the kernel. Each watcher looks for its device among them
+                try:
+                    conntracks_ll = LINUX_HOST().get_conntrack(proto=WATCHER_HOST.CONNTRACK_PROTO_GRE, if_raise=True)
+                except (LinuxCommandNotFound, LinuxCommandFailed):
+                    # logged once for the host, stale conntrack isn't checked for any watcher
+                    conntracks_ll = None
+            # None if iptables can't be read, it's logged once for the host
+            iptables_snapshot = IPTABLES_SNAPSHOT.get() if not pcap_paths else None
+            before_capture = pool.map(lambda w: self.check_before_capture(w, conntracks_ll, iptables_snapshot), self.watchers)
+            if pcap_paths:
+                self.run_offline(pcap_paths)
+            elif self.if_names:
+                self.run(ring_buffer=ring_buffer, capture_sec=capture_sec)
+            # counters are read again after the capture
+            iptables_snapshot = IPTABLES_SNAPSHOT.get() if not pcap_paths else None
+            after_capture = pool.map(lambda w: self.check_after_capture(w, iptables_snapshot, is_offline=bool(pcap_paths)), self.watchers)
+            reports = []
+            for watcher, before, after in zip(self.watchers, before_capture, after_capture):
+                reports.append({**watcher, **before, **after})
+        return reports
+
+    @staticmethod
+    def print_table(reports):
+        columns = [
+            ('watcher_name', 'Watcher'), ('host_veth', 'Host veth'), ('network_device_ip', 'Device IP'), ('veth_exists', 'Veth'),
+            ('watcher_alive', 'FRR GRE'), ('network_device_alive', 'Device GRE'), ('watcher_isis', 'FRR IS-IS'),
+            ('network_device_isis', 'Device IS-IS'), ('conntrack_exists', 'Stale conntrack'),
+            ('nat_unique', 'NAT unique'), ('frr_forward_to_device', 'FRR->Device FWD'), ('device_forward_to_frr', 'Device->FRR FWD'),
+            ('device_nat_to_frr', 'Device->FRR NAT'),
+        ]
+        BASE.print_columns(reports, columns)
+
+ISIS_HELLO_PDU_TYPES = {15, 16, 17}
+
+
+def gre_isis_pdu(ip_packet):
+    """
+    (IS-IS PDU type, holding time) of IS-IS carried by GRE in an IPv4 packet, None for anything else.
+    Holding time is taken from hellos only, it's 0 for other PDUs
+    """
+    if len(ip_packet) < 20 or ip_packet[9] != WATCHER_HOST.CONNTRACK_PROTO_GRE:
+        return None
+    offset = (ip_packet[0] & 0x0f) * 4
+    if len(ip_packet) < offset + 4 or ip_packet[offset + 2] != 0x00 or ip_packet[offset + 3] != 0xfe:
+        return None
+    # checksum, key and sequence number are present if their flags are set
+    flags = ip_packet[offset]
+    offset += 4 + 4 * (bool(flags & 0x80) + bool(flags & 0x20) + bool(flags & 0x10))
+    if len(ip_packet) < offset + 8:
+        return None
+    pdu_type = ip_packet[offset + 4] & 0x1f
+    holding_time = 0
+    # common header 8, circuit type 1, source ID 6, holding time 2
+    if pdu_type in ISIS_HELLO_PDU_TYPES and len(ip_packet) >= offset + 17:
+        holding_time = ip_packet[offset + 15] << 8 | ip_packet[offset + 16]
+    return pdu_type, holding_time
+
+
+class HELLO_STATS:
+    """
+    Inter-arrival times of hellos of one direction of a tunnel in constant memory:
+    running mean and variance (Welford), maximum and interarrival jitter smoothed as in RFC 3550
+    """
+    __slots__ = ("hellos_num", "last_time", "mean_interval", "m2", "max_interval", "last_interval", "jitter", "holding_time", "gaps_num", "is_down")
+
+    def __init__(self) -> None:
+        self.hellos_num = 0
+        self.last_time = 0.0
+        self.mean_interval = 0.0
+        self.m2 = 0.0
+        self.max_interval = 0.0
+        self.last_interval = 0.0
+        self.jitter = 0.0
+        # advertised by the sender in its hellos
+        self.holding_time = 0
+        # intervals longer than the holding time, adjacency was lost
+        self.gaps_num = 0
+        self.is_down = False
+
+    def observe(self, pkt_time, holding_time, default_holding_time):
+        """ Return the interval since the previous hello if it was longer than the holding time, otherwise 0 """
+        gap = 0.0
+        if self.hellos_num:
+            interval = pkt_time - self.last_time
+            intervals_num = self.hellos_num
+            delta = interval - self.mean_interval
+            self.mean_interval += delta / intervals_num
+            self.m2 += delta * (interval - self.mean_interval)
+            self.max_interval = max(self.max_interval, interval)
+            if intervals_num > 1:
+                self.jitter += (abs(interval - self.last_interval) - self.jitter) / 16
+            self.last_interval = interval
+            if interval > (self.holding_time or default_holding_time):
+                gap = interval
+                if not self.is_down:
+                    # the gap was shorter than the check interval of the monitor
+                    self.gaps_num += 1
+        self.hellos_num += 1
+        self.last_time = pkt_time
+        self.holding_time = holding_time or self.holding_time
+        self.is_down = False
+        return gap
+
+    @property
+    def stddev_interval(self):
+        return (self.m2 / (self.hellos_num - 2)) ** 0.5 if self.hellos_num > 2 else 0.0
+
+    def to_dict(self, now):
+        return {
+            'hellos_num': self.hellos_num,
+            'last_seen_sec_ago': round(now - self.last_time, 3) if self.hellos_num else None,
+            'mean_interval_sec': round(self.mean_interval, 3),
+            'stddev_interval_sec': round(self.stddev_interval, 3),
+            'max_interval_sec': round(self.max_interval, 3),
+            'jitter_sec': round(self.jitter, 3),
+            'holding_time_sec': self.holding_time,
+            'gaps_num': self.gaps_num,
+            'is_down': self.is_down,
+        }
+
+
+class HELLO_MONITOR(BASE):
+    """
+    Long-running capture of IS-IS hellos on host veths of all GRE watchers. Both directions of every tunnel
+    (watcher -> device and device -> watcher) have their own HELLO_STATS, an alert is logged as soon as
+    no hello is received for longer than the holding time advertised by the sender.
+    The BPF filter passes hellos only, LSP floods don't reach Python. As the XDP filter, it expects
+    IP and GRE headers without options.
+    """
+    # GRE protocol type at ip[22], IS-IS PDU type at ip[28]: IP header 20, GRE 4, offset of PDU type 4
+    DUMP_FILTER_HELLO = "proto gre and ip[22:2] = 0x00fe and (ip[28] & 0x1f) >= 15 and (ip[28] & 0x1f) <= 17"
+    DEFAULT_HOLDING_TIME_SEC = 30
+    CHECK_INTERVAL_SEC = 1
+    DIRECTION_TO_DEVICE = "watcher->device"
+    DIRECTION_TO_WATCHER = "device->watcher"
+
+    def __init__(self, watchers, default_holding_time_sec=DEFAULT_HOLDING_TIME_SEC) -> None:
+        self.default_holding_time_sec = default_holding_time_sec
+        self.init_watchers(watchers)
+        # (host veth, outer IP source) -> (watcher, direction, HELLO_STATS), created once, so the capture thread never resizes it
+        self.stats_dd = {}
+        for w in watchers:
+            if w['host_veth'] in self.missing_if_names:
+                continue
+            self.stats_dd[(w['host_veth'], w['watcher_internal_ip'])] = (w, self.DIRECTION_TO_DEVICE, HELLO_STATS())
+            self.stats_dd[(w['host_veth'], w['network_device_ip'])] = (w, self.DIRECTION_TO_WATCHER, HELLO_STATS())
+        self.started_at = time.time()
+
+    @property
+    def dump_filter(self):
+        return self.DUMP_FILTER_HELLO
+
+    @property
+    def bpf_instructions(self):
+        return CLASSIC_BPF.gre(is_isis_hello_only=True)
+
+    def on_frame(self, if_name, frame, length, pkt_time) -> None:
+        if length > ETH_HEADER_SIZE + 20:
+            self.observe(if_name, frame[ETH_HEADER_SIZE:length], pkt_time)
+
+    def on_packet(self, pkt) -> None:
+        ip = pkt.getlayer(IP)
+        if ip is None:
+            return
+        self.observe(pkt.sniffed_on, bytes(ip), float(pkt.time))
+
+    def observe(self, if_name, ip_packet, pkt_time):
+        tracked = self.stats_dd.get((if_name, f"{ip_packet[12]}.{ip_packet[13]}.{ip_packet[14]}.{ip_packet[15]}"))
+        if tracked is None:
+            return
+        pdu = gre_isis_pdu(ip_packet)
+        if pdu is None or pdu[0] not in ISIS_HELLO_PDU_TYPES:
+            return
+        watcher, direction, stats = tracked
+        was_down = stats.is_down
+        gap = stats.observe(pkt_time, pdu[1], self.default_holding_time_sec)
+        if gap:
+            log.warning(f"{watcher['watcher_name']} {direction}: hellos are received again after {gap:.1f}sec" +
+                        ("" if was_down else ", the gap was longer than the holding time"))
+
+    def check_gaps(self, now):
+        """ Alert once per gap, when the holding time since the last hello is over """
+        for watcher, direction, stats in self.stats_dd.values():
+            holding_time = stats.holding_time or self.default_holding_time_sec
+            last_time = stats.last_time or self.started_at
+            if not stats.is_down and now - last_time > holding_time:
+                stats.is_down = True
+                stats.gaps_num += 1
+                log.critical(f"{watcher['watcher_name']} {direction}: no hellos for {now - last_time:.1f}sec, holding time {holding_time}sec is over. IS-IS adjacency is down")
+
+    def report(self, now=None):
+        now = time.time() if now is None else now
+        return [
+            {'watcher_name': watcher['watcher_name'], 'host_veth': if_name, 'direction': direction, 'src': src, **stats.to_dict(now)}
+            for (if_name, src), (watcher, direction, stats) in self.stats_dd.items()
+        ]
+
+    @staticmethod
+    def save_report(reports, report_path):
+        import json
+        tmp_report_path = f"{report_path}.tmp"
+        with open(tmp_report_path, "w") as f:
+            json.dump({'saved_at': time.time(), 'tunnels': reports}, f, indent=2)
+        os.replace(tmp_report_path, report_path)
+
+    @staticmethod
+    def print_table(reports):
+        columns = [
+            ('watcher_name', 'Watcher'), ('direction', 'Direction'), ('hellos_num', 'Hellos'), ('last_seen_sec_ago', 'Last, sec ago'),
+            ('mean_interval_sec', 'Mean'), ('stddev_interval_sec', 'Stddev'), ('jitter_sec', 'Jitter'), ('max_interval_sec', 'Max'),
+            ('holding_time_sec', 'Hold'), ('gaps_num', 'Gaps'), ('is_down', 'Down'),
+        ]
+        BASE.print_columns(reports, columns)
+
+    def monitor(self, report_interval_sec=60, report_path="", duration_sec=0):
+        """ Run until Ctrl+C or duration_sec, print and save stats every report_interval_sec """
+        if self.missing_if_names:
+            log.critical(f"Interfaces {', '.join(sorted(self.missing_if_names))} are not found, these watchers are not monitored")
+        if not self.if_names:
+            return []
+        log.info(f"Monitoring hellos on {self.if_names} interfaces, filter: {self.dump_filter}")
+        self.started_at = time.time()
+        self.sniffer.start()
+        reported_at = time.monotonic()
+        try:
+            while self.sniffer.running and (not duration_sec or time.time() - self.started_at < duration_sec):
+                time.sleep(self.CHECK_INTERVAL_SEC)
+                self.check_gaps(time.time())
+                if time.monotonic() - reported_at >= report_interval_sec:
+                    reported_at = time.monotonic()
+                    self.print_table(self.report())
+                    if report_path:
+                        self.save_report(self.report(), report_path)
+        except KeyboardInterrupt:
+            log.info("Monitoring is stopped")
+        if self.sniffer.running:
+            self.sniffer.stop()
+        reports = self.report()
+        self.print_table(reports)
+        if report_path:
+            self.save_report(reports, report_path)
+        return reports
+
+class IPTABLES_SNAPSHOT:
+    """
+    nat PREROUTING and filter FORWARD chains dumped once and indexed by source and destination.
+    All IPTABLES_* checks of a diagnostic run query the same snapshot instead of dumping chains again.
+    Take a new snapshot to see the latest packet counters. If iptables can't be read, it isn't tried again in this run.
+    """
+    # the error of a failed dump
+    _dump_error = None
+
+    def __init__(self, nat_prerouting_ll, filter_forward_ll) -> None:
+        self.nat_prerouting_by_src = self.index_by(nat_prerouting_ll, lambda row: row.get('src', ''))
+        self.filter_forward_by_src = self.index_by(filter_forward_ll, lambda row: row.get('src', ''))
+        self.filter_forward_by_dst = self.index_by(filter_forward_ll, lambda row: row.get('dst', ''))
+
+    @classmethod
+    def dump(cls):
+        """ Raise an exception if iptc is not available """
+        import iptc
+        return cls(
+            nat_prerouting_ll=iptc.easy.dump_chain('nat', 'PREROUTING', ipv6=False),
+            filter_forward_ll=iptc.easy.dump_chain('filter', 'FORWARD', ipv6=False),
+        )
+
+    @classmethod
+    def get(cls, snapshot=None):
+        """ Return the given snapshot or a new one, None if iptables can't be read """
+        if snapshot is not None:
+            return snapshot
+        if cls._dump_error is not None:
+            return None
+        try:
+            return cls.dump()
+        except Exception as e:
+            cls._dump_error = e
+            log.info(f"Iptables checks are ignored, {e}")
+            return None
+
+    @staticmethod
+    def dnat_ip(row):
+        return row.get('target', {}).get('DNAT', {}).get('to-destination', '')
+
+    @staticmethod
+    def index_by(rows, get_key):
+        index_dd = {}
+        for row in rows:
+            index_dd.setdefault(get_key(row), []).append(row)
+        return index_dd
+
+    @staticmethod
+    def entry_ip(ip: str) -> str:
+        """ iptc returns addresses with a prefix length, 192.168.1.35 -> 192.168.1.35/32 """
         import ipaddress
         try:
-            self.ip = ipaddress.ip_interface(ip)
+            return str(ipaddress.ip_interface(ip))
         except ValueError:
-            self.ip = ""
-    def __repr__(self):
-        return str(self.ip)
-    def __eq__(self, other):
-        return str(self.ip) == other
+            return ""
+
+    def nat_prerouting_from(self, ip):
+        return self.nat_prerouting_by_src.get(self.entry_ip(ip), [])
+
+    def filter_forward_from(self, ip):
+        return self.filter_forward_by_src.get(self.entry_ip(ip), [])
+
+    def filter_forward_to(self, ip):
+        return self.filter_forward_by_dst.get(self.entry_ip(ip), [])
 
 class IPTABLES_NAT_FOR_REMOTE_NETWORK_DEVICE_UNIQUE:
 
@@ -243,18 +1057,13 @@ class IPTABLES_NAT_FOR_REMOTE_NETWORK_DEVICE_UNIQUE:
     """
 
     @staticmethod
-    def check(network_device_ip):
-        try:
-            import iptc
-        except Exception as e:
-            log.info(f"Iptables checks are ignored, {e}")
+    def check(network_device_ip, snapshot=None):
+        snapshot = IPTABLES_SNAPSHOT.get(snapshot)
+        if snapshot is None:
             return True
         existed_nat_records_hash = set()
-        for nat_table_row in iptc.easy.dump_chain('nat', 'PREROUTING', ipv6=False):
-            if nat_table_row.get('src', '') != IPTABLE_ENTRY_IP(network_device_ip):
-                continue
-            dnat_ip = nat_table_row.get('target', {}).get('DNAT', {}).get('to-destination', '')
-            existed_nat_records_hash.add((network_device_ip, dnat_ip))
+        for nat_table_row in snapshot.nat_prerouting_from(network_device_ip):
+            existed_nat_records_hash.add((network_device_ip, snapshot.dnat_ip(nat_table_row)))
         if not existed_nat_records_hash:
             log.critical(f"""There is no NAT settings for watcher, please check iptables, run:
             1. sudo iptables -nvL -t nat --line-numbers""")
@@ -278,17 +1087,12 @@ class IPTABLES_FORWARD_FOR_REMOTE_NETWORK_DEVICE_EXIST:
         It's possible to create GRE tunnel for a single Watchet - Network device pair only.
     """
     @staticmethod
-    def check(network_device_ip):
-        try:
-            import iptc
-        except Exception as e:
+    def check(network_device_ip, snapshot=None):
+        snapshot = IPTABLES_SNAPSHOT.get(snapshot)
+        if snapshot is None:
             print(f"Iptables checks are ignored")
             return True
-        existed_records_ll = []
-        for filter_table_row in iptc.easy.dump_chain('filter', 'FORWARD', ipv6=False):
-            if filter_table_row.get('src', '') != IPTABLE_ENTRY_IP(network_device_ip):
-                continue
-            existed_records_ll.append(filter_table_row)
+        existed_records_ll = snapshot.filter_forward_from(network_device_ip)
         if len(existed_records_ll) == 0:
             log.info("Iptables -t filter doesn't have settings for such remote network device. Good to add it.")
             return True
@@ -323,16 +1127,12 @@ class IPTABLES_REMOTE_NETWORK_DEVICE_NAT_TO_FRR_NETNS:
         return f"sudo iptables -nv -t nat -L PREROUTING --line-numbers | grep {network_device_ip}"
 
     @staticmethod
-    def check(network_device_ip):
-        try:
-            import iptc
-        except Exception as e:
+    def check(network_device_ip, snapshot=None):
+        snapshot = IPTABLES_SNAPSHOT.get(snapshot)
+        if snapshot is None:
             print(f"Iptables checks are ignored, please use {IPTABLES_REMOTE_NETWORK_DEVICE_NAT_TO_FRR_NETNS.bash_cmd(network_device_ip)}")
             return True
-        for nat_table_row in iptc.easy.dump_chain('nat', 'PREROUTING', ipv6=False):
-            #for nat_table_row in nat_table['PREROUTING']:
-            if nat_table_row.get('src', '') != IPTABLE_ENTRY_IP(network_device_ip):
-                continue
+        for nat_table_row in snapshot.nat_prerouting_from(network_device_ip):
             pkts, bytes = nat_table_row.get('counters', (0, 0))
             if pkts > 0:
                 log.info("NAT is working for remote network device.")
@@ -364,15 +1164,12 @@ class IPTABLES_REMOTE_NETWORK_DEVICE_FORWARD_TO_FRR_NETNS:
         return f"sudo iptables -nv -t filter -L FORWARD --line-numbers | grep {network_device_ip}"
 
     @staticmethod
-    def check(network_device_ip):
-        try:
-            import iptc
-        except Exception as e:
+    def check(network_device_ip, snapshot=None):
+        snapshot = IPTABLES_SNAPSHOT.get(snapshot)
+        if snapshot is None:
             print(f"Iptables checks are ignored, please use {IPTABLES_REMOTE_NETWORK_DEVICE_FORWARD_TO_FRR_NETNS.bash_cmd(network_device_ip)}")
             return True
-        for filter_table_row in iptc.easy.dump_chain('filter', 'FORWARD', ipv6=False):
-            if filter_table_row.get('src', '') != IPTABLE_ENTRY_IP(network_device_ip):
-                continue
+        for filter_table_row in snapshot.filter_forward_from(network_device_ip):
             pkts, bytes = filter_table_row.get('counters', (0, 0))
             if pkts > 0:
                 log.info("Remote network device sends IGP packets and iptables allows them.")
@@ -392,15 +1189,12 @@ class IPTABLES_FRR_NETNS_FORWARD_TO_NETWORK_DEVICE_BEFORE_NAT:
         return f"sudo iptables -nv -t filter -L FORWARD --line-numbers | grep {network_device_ip}"
 
     @staticmethod
-    def check(network_device_ip):
-        try:
-            import iptc
-        except Exception as e:
+    def check(network_device_ip, snapshot=None):
+        snapshot = IPTABLES_SNAPSHOT.get(snapshot)
+        if snapshot is None:
             print(f"Iptables checks are ignored, please use {IPTABLES_FRR_NETNS_FORWARD_TO_NETWORK_DEVICE_BEFORE_NAT.bash_cmd(network_device_ip)}")
             return True
-        for filter_table_row in iptc.easy.dump_chain('filter', 'FORWARD', ipv6=False):
-            if filter_table_row.get('dst', '') != IPTABLE_ENTRY_IP(network_device_ip):
-                continue
+        for filter_table_row in snapshot.filter_forward_to(network_device_ip):
             pkts, bytes = filter_table_row.get('counters', (0, 0))
             if pkts > 0:
                 log.info("Watcher's FRR sends IGP packets and iptables allows them.")
@@ -0,0 +1,43 @@
+"""
+Parser throughput: how many watcher log lines per second parse_line handles in a single process.
+python3 benchmark.py --lines 1000000
+"""
+import argparse
+import itertools
+import time
+
+from events import parse_line
+
+SAMPLE_LINES = [
+    "2024-12-29T13:20:50.398Z,isis-watcher,1,temetric,0200.1001.0002,changed,0_17_19_20_21_22_26_29_30,1000000000,1000000000,1000000000_1000000008_1000000016_1000000024_1000000032_1000000040_1000000048_1000000056,11223344,0200.1001.0003,2024-07-28T18:03:05Z,49.0001,01Jan2023_00h00m00s_7_hosts,10.1.23.3,10.1.23.2,179,\n",
+    "2024-10-08T22:55:32Z,watcher1,1,metric,0200.1001.0003,changed,old_cost:5,new_cost:-1,0200.1001.0002,10Oct2024_00h00m00s_7_hosts,49.0002,12345,10.1.23.2,10.1.23.3,,\n",
+    "2024-10-08T22:55:33Z,watcher1,1,metric,0200.1001.0003,changed,old_cost:-1,new_cost:10,0200.1001.0002,10Oct2024_00h00m00s_7_hosts,49.0002,12345,10.1.23.2,10.1.23.3\n",
+    "2024-10-08T22:55:34Z,watcher1,2,metric,0200.1001.0003,changed,old_cost:10,new_cost:12,0200.1001.0002,10Oct2024_00h00m00s_7_hosts,49.0002,12345,10.1.23.2,10.1.23.3,,\n",
+    "2024-08-31T12:56:51Z,watcher1,1,network,10.10.10.1/32,changed,old_cost:10,new_cost:-1,0200.1025.0002,10Oct2024_00h00m00s_7_hosts,49.0002,12345,internal,0,,\n",
+    "2024-08-31T12:56:52Z,watcher1,2,network,4ffe::192:168:23:2/127,changed,old_cost:10,new_cost:12,0200.1001.0002,10Oct2024_00h00m00s_7_hosts,49.0002,12345,external,1,,\n",
+    # not exported
+    "2024-10-08T22:47:39Z,watcher1,2,network,4ffe:10::5:0:0:d8/127,up,0200.1001.0005,,49.0002,12345\n",
+    "2024-10-08T22:55:36Z,watcher1,2,host,0200.1001.0004,down,0200.1001.0005,,49.0002,12345\n",
+]
+
+
+def run(lines_num):
+    lines = list(itertools.islice(itertools.cycle(SAMPLE_LINES), lines_num))
+    events_num = 0
+    start = time.perf_counter()
+    for line in lines:
+        if parse_line(line) is not None:
+            events_num += 1
+    elapsed = time.perf_counter() - start
+    print(f"{lines_num} lines ({events_num} events) in {elapsed:.3f}s: {lines_num / elapsed:,.0f} lines/sec")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Measure watcher log parsing throughput"
+    )
+    parser.add_argument(
+        "--lines", required=False, default=1000000, type=int, help="Number of lines to parse"
+    )
+    args = parser.parse_args()
+    run(args.lines)
@@ -0,0 +1,215 @@
+"""
+Flap dampening of up/down events, the same idea as BGP route flap dampening (RFC 2439).
+
+Every up/down of (watcher, level, event_object, event_detected_by) adds a penalty, the penalty decays
+exponentially with the half-life. When it reaches the suppress threshold, a single `flapping` event is
+exported instead and further up/down events are held back. When the penalty decays below the reuse
+threshold, the last held back event is exported if its status differs from the last exported up/down, so outputs
+end up with the current state of the object without a repeated up or down.
+Cost changes and TE attributes are not dampened.
+"""
+import collections
+import logging
+import math
+import os
+import time
+
+from events import COST_EVENT, EVENT, ELASTICSEARCH_UPDOWN_INDEX
+from outputs import env_bool
+
+log = logging.getLogger(__name__)
+
+
+class FLAPPING_EVENT(EVENT):
+    """ Summary of an object which is suppressed, it's built from the up/down event which reached the suppress threshold """
+
+    __slots__ = ("source_event", "flaps_count", "penalty", "suppressed_sec")
+    FIELDS = EVENT.FIELDS + ("flaps_count", "penalty", "suppressed_sec")
+
+    def __init__(self, source_event, flaps_count, penalty, suppressed_sec) -> None:
+        for field in EVENT.FIELDS:
+            setattr(self, field, getattr(source_event, field))
+        self.observed_by = source_event.observed_by
+        self.read_at = source_event.read_at
+        self.position = source_event.position
+        self.source_event = source_event
+        self.flaps_count = flaps_count
+        self.penalty = int(penalty)
+        # estimated time until reuse if the object stops flapping now
+        self.suppressed_sec = int(suppressed_sec)
+
+    @property
+    def object_status(self):
+        return "flapping"
+
+    @property
+    def elasticsearch_index(self):
+        return ELASTICSEARCH_UPDOWN_INDEX
+
+    @property
+    def mongo_collection_name(self):
+        return self.source_event.mongo_collection_name
+
+    @property
+    def zabbix_host(self):
+        return self.source_event.zabbix_host
+
+    @property
+    def z_object_item_name(self):
+        return self.source_event.z_object_item_name
+
+    @property
+    def message(self):
+        return (f"IS-IS L{self.level_number} {self.event_name} {self.event_object} is flapping, {self.flaps_count} up/down events, "
+                f"detected by:{self.event_detected_by}, events are suppressed for at least {self.suppressed_sec}s")
+
+    def to_dict(self):
+        record = super().to_dict()
+        record["object_status"] = self.object_status
+        return record
+
+
+class DAMPENED_OBJECT:
+
+    __slots__ = ("penalty", "updated_at", "flaps_count", "is_suppressed", "held_event", "held_count", "exported_status")
+
+    def __init__(self, now) -> None:
+        self.penalty = 0.0
+        self.updated_at = now
+        self.flaps_count = 0
+        self.is_suppressed = False
+        # the last up/down event received while suppressed
+        self.held_event = None
+        self.held_count = 0
+        # up or down of the last exported event
+        self.exported_status = ""
+
+    def release(self):
+        """ The held back event if it changes the exported status, otherwise outputs have the state already """
+        held_event = self.held_event
+        self.is_suppressed = False
+        self.held_event = None
+        self.held_count = 0
+        if held_event is None or held_event.object_status == self.exported_status:
+            return None
+        self.exported_status = held_event.object_status
+        return held_event
+
+
+class FLAP_DAMPENING:
+    """ Stage between the parser and outputs. process() and tick() return the list of events to export """
+
+    NAME = "dampening"
+
+    def __init__(self, penalty=1000, half_life_sec=60, suppress_threshold=2000, reuse_threshold=750, max_suppress_sec=600) -> None:
+        if not 0 < reuse_threshold < suppress_threshold:
+            raise ValueError(f"Reuse threshold {reuse_threshold} should be positive and less than suppress threshold {suppress_threshold}")
+        self.penalty = penalty
+        self.half_life_sec = half_life_sec
+        self.suppress_threshold = suppress_threshold
+        self.reuse_threshold = reuse_threshold
+        # penalty is capped, so an object is suppressed for max_suppress_sec at most after the last flap
+        self.max_penalty = reuse_threshold * 2 ** (max_suppress_sec / half_life_sec)
+        # (watcher, level, event_object, event_detected_by) -> DAMPENED_OBJECT
+        self.objects = {}
+        self.suppressed = {}
+        self._cleaned_at = time.monotonic()
+        self.suppressed_count = 0
+        # (watcher log file, event name) -> number of held back events
+        self.dropped_dd = collections.Counter()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            penalty=float(os.getenv("FLAP_DAMPENING_PENALTY", "1000")),
+            half_life_sec=float(os.getenv("FLAP_DAMPENING_HALF_LIFE_SEC", "60")),
+            suppress_threshold=float(os.getenv("FLAP_DAMPENING_SUPPRESS", "2000")),
+            reuse_threshold=float(os.getenv("FLAP_DAMPENING_REUSE", "750")),
+            max_suppress_sec=float(os.getenv("FLAP_DAMPENING_MAX_SUPPRESS_SEC", "600")),
+        )
+
+    @staticmethod
+    def is_enabled():
+        return env_bool("FLAP_DAMPENING_BOOL")
+
+    def _decay(self, obj, now):
+        elapsed = now - obj.updated_at
+        if elapsed > 0:
+            obj.penalty *= 2 ** (-elapsed / self.half_life_sec)
+            obj.updated_at = now
+
+    def _reuse_in_sec(self, obj):
+        """ Time until the penalty decays to the reuse threshold """
+        if obj.penalty <= self.reuse_threshold:
+            return 0
+        return self.half_life_sec * math.log2(obj.penalty / self.reuse_threshold)
+
+    def process(self, event, now=None):
+        if not isinstance(event, COST_EVENT) or event.object_status == "changed":
+            return [event]
+        now = time.monotonic() if now is None else now
+        key = (event.watcher_name, event.level_number, event.event_object, event.event_detected_by)
+        obj = self.objects.get(key)
+        if obj is None:
+            obj = self.objects[key] = DAMPENED_OBJECT(now)
+        self._decay(obj, now)
+        obj.penalty = min(obj.penalty + self.penalty, self.max_penalty)
+        obj.flaps_count += 1
+        if obj.is_suppressed:
+            obj.held_event = event
+            obj.held_count += 1
+            self.suppressed_count += 1
+            self.dropped_dd[(event.file_name, event.event_name)] += 1
+            return []
+        if obj.penalty < self.suppress_threshold:
+            obj.exported_status = event.object_status
+            return [event]
+        obj.is_suppressed = True
+        self.suppressed[key] = obj
+        self.suppressed_count += 1
+        self.dropped_dd[(event.file_name, event.event_name)] += 1
+        log.info(f"{event.watcher_name} L{event.level_number} {event.event_object} detected by {event.event_detected_by} is flapping, "
+                 f"penalty {int(obj.penalty)}, events are suppressed")
+        # the event which reached the threshold is held back, `flapping` is exported instead
+        obj.held_event = event
+        obj.held_count = 1
+        return [FLAPPING_EVENT(event, obj.flaps_count, obj.penalty, self._reuse_in_sec(obj))]
+
+    def tick(self, now=None):
+        """ Release objects which penalty decayed below the reuse threshold. Only suppressed objects are looked through """
+        now = time.monotonic() if now is None else now
+        released_events = []
+        for key, obj in list(self.suppressed.items()):
+            self._decay(obj, now)
+            if obj.penalty >= self.reuse_threshold:
+                continue
+            del self.suppressed[key]
+            log.info(f"{key[0]} L{key[1]} {key[2]} detected by {key[3]} is not suppressed anymore, "
+                     f"{obj.held_count} events were suppressed")
+            held_event = obj.release()
+            if held_event is not None:
+                released_events.append(held_event)
+        if now - self._cleaned_at >= self.half_life_sec:
+            self._clean(now)
+        return released_events
+
+    def held_positions(self):
+        """ Lines of held back events are read again after a restart """
+        return [obj.held_event.position for obj in list(self.suppressed.values()) if obj.held_event is not None]
+
+    def close(self):
+        """ Events which are still held back, outputs get the current state of suppressed objects """
+        released_events = [obj.release() for obj in self.suppressed.values()]
+        self.suppressed.clear()
+        return [event for event in released_events if event is not None]
+
+    def _clean(self, now):
+        """ Forget objects which penalty has decayed to nearly zero, so the dict doesn't grow with every object ever seen """
+        self._cleaned_at = now
+        forgotten_penalty = self.penalty / 16
+        for key, obj in list(self.objects.items()):
+            if obj.is_suppressed:
+                continue
+            self._decay(obj, now)
+            if obj.penalty < forgotten_penalty:
+                del self.objects[key]
@@ -0,0 +1,131 @@
+"""
+Deduplication of the same change reported by several watchers of one area.
+
+Every watcher of an area receives the same LSPs, so a change is logged once per watcher. Events are
+fingerprinted by all their columns except the ones which belong to the watcher (name, time, AS, session).
+The first event of a fingerprint is held for `hold_sec` to collect the watchers which report it in
+observed_by, then it is forwarded once. Reports of the same change by other watchers are dropped while
+the fingerprint is in the window. A watcher which reports the fingerprint again has seen the change
+once more (down, up, down of the same link), so its event starts a new fingerprint and is forwarded.
+The index is bounded by time and by the number of fingerprints.
+"""
+import collections
+import logging
+import os
+import time
+
+from outputs import env_bool
+
+log = logging.getLogger(__name__)
+
+# columns which differ between watchers reporting the same change
+WATCHER_FIELDS = {"watcher_time", "watcher_name", "asn", "sesid", "srcid"}
+
+
+class FINGERPRINTED:
+
+    __slots__ = ("event", "first_seen_at", "is_pending")
+
+    def __init__(self, event, first_seen_at) -> None:
+        self.event = event
+        self.first_seen_at = first_seen_at
+        self.is_pending = True
+
+
+class EVENT_DEDUP:
+    """ Stage between the parser and outputs. process() and tick() return the list of events to export """
+
+    NAME = "dedup"
+
+    def __init__(self, hold_sec=1.0, window_sec=60.0, max_fingerprints=100000) -> None:
+        self.hold_sec = hold_sec
+        self.window_sec = max(window_sec, hold_sec)
+        self.max_fingerprints = max_fingerprints
+        # fingerprint -> FINGERPRINTED, in the order of arrival, so expired ones are at the head
+        self.index = collections.OrderedDict()
+        # held events in the order of arrival
+        self.pending = collections.deque()
+        # event class -> fields of the fingerprint
+        self._fingerprint_fields = {}
+        self.duplicates_count = 0
+        # (watcher log file, event name) -> number of dropped duplicates
+        self.dropped_dd = collections.Counter()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            hold_sec=float(os.getenv("DEDUP_HOLD_SEC", "1")),
+            window_sec=float(os.getenv("DEDUP_WINDOW_SEC", "60")),
+            max_fingerprints=int(os.getenv("DEDUP_MAX_FINGERPRINTS", "100000")),
+        )
+
+    @staticmethod
+    def is_enabled():
+        return env_bool("DEDUP_BOOL")
+
+    def fingerprint(self, event):
+        event_cls = type(event)
+        fields = self._fingerprint_fields.get(event_cls)
+        if fields is None:
+            fields = self._fingerprint_fields[event_cls] = tuple(field for field in event_cls.FIELDS if field not in WATCHER_FIELDS)
+        return (event_cls,) + tuple(getattr(event, field) for field in fields)
+
+    def process(self, event, now=None):
+        now = time.monotonic() if now is None else now
+        released_events = self._expire(now)
+        fingerprint = self.fingerprint(event)
+        known = self.index.get(fingerprint)
+        if known is not None:
+            if event.watcher_name not in known.event.observed_by:
+                self.duplicates_count += 1
+                self.dropped_dd[(event.file_name, event.event_name)] += 1
+                known.event.observed_by.append(event.watcher_name)
+                return released_events
+            # a repeat from the same watcher, the previous entry stays in pending if it's still held
+            del self.index[fingerprint]
+        event.observed_by = [event.watcher_name]
+        fingerprinted = FINGERPRINTED(event, now)
+        self.index[fingerprint] = fingerprinted
+        if len(self.index) > self.max_fingerprints:
+            _, oldest = self.index.popitem(last=False)
+            if oldest.is_pending:
+                oldest.is_pending = False
+                released_events.append(oldest.event)
+        if self.hold_sec > 0:
+            self.pending.append(fingerprinted)
+        else:
+            fingerprinted.is_pending = False
+            released_events.append(event)
+        return released_events
+
+    def tick(self, now=None):
+        """ Forward events which were held for hold_sec """
+        return self._expire(time.monotonic() if now is None else now)
+
+    def _expire(self, now):
+        released_events = []
+        pending = self.pending
+        while pending and (not pending[0].is_pending or now - pending[0].first_seen_at >= self.hold_sec):
+            fingerprinted = pending.popleft()
+            if fingerprinted.is_pending:
+                fingerprinted.is_pending = False
+                released_events.append(fingerprinted.event)
+        index = self.index
+        while index:
+            oldest = next(iter(index.values()))
+            if now - oldest.first_seen_at < self.window_sec:
+                break
+            index.popitem(last=False)
+        return released_events
+
+    def held_positions(self):
+        """ Lines of held events are read again after a restart """
+        return [fingerprinted.event.position for fingerprinted in self.pending if fingerprinted.is_pending]
+
+    def close(self):
+        """ Events which are still held """
+        released_events = [fingerprinted.event for fingerprinted in self.pending if fingerprinted.is_pending]
+        for fingerprinted in self.pending:
+            fingerprinted.is_pending = False
+        self.pending.clear()
+        return released_events
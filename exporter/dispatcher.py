@@ -0,0 +1,259 @@
+"""
+Asynchronous dispatcher of events to outputs. Every output is a destination with its own bounded queue,
+worker and thread, so a slow or dead Elasticsearch doesn't stall Zabbix, webhook or Topolograph.
+
+The exporter loop only appends events to the queues. Workers run on an asyncio loop in a background thread,
+blocking clients (requests sessions with keep-alive connections) are called in a single thread per
+destination. A failed event is retried with exponential backoff, after `failures_threshold` failures in
+a row the circuit breaker of the destination opens and nothing is sent to it for `reset_timeout_sec`.
+While it is open, events are kept in the queue, the oldest ones are dropped when the queue is full.
+Events which are queued or buffered by an output are reported as held, the tailer checkpoint stops before them.
+"""
+import asyncio
+import collections
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from outputs import OUTPUT, OutputRejected
+
+log = logging.getLogger(__name__)
+
+
+class CIRCUIT_BREAKER:
+    """ closed: events are sent; open: nothing is sent until reset timeout; half-open: one attempt decides """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, name, failures_threshold=5, reset_timeout_sec=30) -> None:
+        self.name = name
+        self.failures_threshold = failures_threshold
+        self.reset_timeout_sec = reset_timeout_sec
+        self.state = self.CLOSED
+        self.failures_count = 0
+        self.opened_at = 0
+
+    def retry_in(self):
+        """ Seconds to wait before the next attempt, 0 if sending is allowed """
+        if self.state != self.OPEN:
+            return 0
+        left_sec = self.opened_at + self.reset_timeout_sec - time.monotonic()
+        if left_sec > 0:
+            return left_sec
+        self.state = self.HALF_OPEN
+        return 0
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            log.info(f"{self.name} is available again, circuit breaker is closed")
+        self.state = self.CLOSED
+        self.failures_count = 0
+
+    def record_failure(self):
+        self.failures_count += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures_count >= self.failures_threshold):
+            log.error(f"{self.name} failed {self.failures_count} times in a row, circuit breaker is open for {self.reset_timeout_sec}s")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class DESTINATION:
+
+    MAX_BACKOFF_SEC = 30
+
+    def __init__(self, output, max_queue_events=10000, max_batch_events=500, max_retries=5, backoff_sec=0.5,
+                 failures_threshold=5, reset_timeout_sec=30, flush_interval_sec=0.2) -> None:
+        self.output = output
+        self.name = output.NAME
+        self.max_queue_events = max_queue_events
+        self.max_batch_events = max_batch_events
+        self.max_retries = max_retries
+        self.backoff_sec = backoff_sec
+        self.flush_interval_sec = flush_interval_sec
+        self.breaker = CIRCUIT_BREAKER(self.name, failures_threshold, reset_timeout_sec)
+        # (sequence number, event), appended by the exporter thread, taken by the worker
+        self.queue = collections.deque()
+        self.lock = threading.Lock()
+        self._seq = itertools.count()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"output-{self.name}")
+        self.wakeup = None
+        self.is_closing = False
+        self.retries = 0
+        self.sent_count = 0
+        self.dropped_count = 0
+        self.retries_count = 0
+        # EXPORTER_METRICS, set when metrics are enabled
+        self.metrics = None
+
+    @property
+    def is_breaker_open(self):
+        return self.breaker.state == CIRCUIT_BREAKER.OPEN
+
+    def put(self, event):
+        with self.lock:
+            self.queue.append((next(self._seq), event))
+            if len(self.queue) > self.max_queue_events:
+                self.queue.popleft()
+                self.dropped_count += 1
+                if self.dropped_count % 1000 == 1:
+                    log.warning(f"{self.name} queue is full, {self.dropped_count} events were dropped so far")
+
+    def _peek(self):
+        with self.lock:
+            return list(itertools.islice(self.queue, self.max_batch_events))
+
+    def _remove_up_to(self, seq):
+        """ Remove sent events, the head may have been dropped by put() meanwhile """
+        with self.lock:
+            while self.queue and self.queue[0][0] <= seq:
+                self.queue.popleft()
+
+    def held_positions(self):
+        """ The queue is read first, an event is removed from it after the output has buffered or delivered it """
+        with self.lock:
+            positions = [event.position for _, event in self.queue]
+        positions.extend(self.output.held_positions())
+        return positions
+
+    def _send_batch(self, batch):
+        """ Runs in the destination thread. Return the number of sent events and the error which stopped sending """
+        for sent_num, (_, event) in enumerate(batch):
+            try:
+                self.output.send(event)
+            except Exception as e:
+                return sent_num, e
+            if self.metrics is not None:
+                self.metrics.observe_output(self.name, event)
+        self._flush()
+        return len(batch), None
+
+    def _flush(self, force=False):
+        try:
+            self.output.flush(force=force)
+        except Exception as e:
+            log.error(f"{self.name} flush failed, {e}")
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        while True:
+            if not self.queue:
+                if self.is_closing:
+                    break
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.flush_interval_sec)
+                except asyncio.TimeoutError:
+                    pass
+                # buffered outputs send by linger time
+                await loop.run_in_executor(self.executor, self._flush)
+                continue
+            wait_sec = self.breaker.retry_in()
+            if wait_sec > 0:
+                if self.is_closing:
+                    log.error(f"{self.name} is not available, {len(self.queue)} queued events are not sent")
+                    break
+                await asyncio.sleep(min(wait_sec, self.flush_interval_sec))
+                continue
+            batch = self._peek()
+            sent_num, error = await loop.run_in_executor(self.executor, self._send_batch, batch)
+            if sent_num:
+                self._remove_up_to(batch[sent_num - 1][0])
+                self.sent_count += sent_num
+                self.retries = 0
+                self.breaker.record_success()
+            if error is None:
+                continue
+            failed_seq = batch[sent_num][0]
+            if isinstance(error, OutputRejected):
+                log.error(f"{error}, the event is dropped")
+                self._remove_up_to(failed_seq)
+                self.dropped_count += 1
+                continue
+            self.breaker.record_failure()
+            self.retries += 1
+            self.retries_count += 1
+            if self.retries > self.max_retries:
+                log.error(f"{error}, the event is dropped after {self.max_retries} retries")
+                self._remove_up_to(failed_seq)
+                self.dropped_count += 1
+                self.retries = 0
+                continue
+            backoff_sec = min(self.backoff_sec * 2 ** (self.retries - 1), self.MAX_BACKOFF_SEC)
+            log.warning(f"{error}, retry in {backoff_sec}s")
+            await asyncio.sleep(backoff_sec)
+        await loop.run_in_executor(self.executor, self._close_output)
+
+    def _close_output(self):
+        try:
+            self.output.close()
+        except Exception as e:
+            log.error(f"{self.name} close failed, {e}")
+
+
+class ASYNC_DISPATCHER(OUTPUT):
+    """ Looks like a single output to the exporter, fans events out to destinations """
+
+    CLOSE_TIMEOUT_SEC = 10
+
+    def __init__(self, outputs, **destination_kwargs) -> None:
+        self.destinations = [DESTINATION(output, **destination_kwargs) for output in outputs]
+        self.NAME = ", ".join(destination.name for destination in self.destinations)
+        self.loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self.thread = threading.Thread(target=self._run_loop, name="output-dispatcher", daemon=True)
+        self.thread.start()
+        self._started.wait()
+
+    @classmethod
+    def from_env(cls, outputs):
+        return cls(
+            outputs,
+            max_queue_events=int(os.getenv("OUTPUT_QUEUE_MAX_EVENTS", "10000")),
+            max_retries=int(os.getenv("OUTPUT_MAX_RETRIES", "5")),
+            failures_threshold=int(os.getenv("OUTPUT_BREAKER_FAILURES", "5")),
+            reset_timeout_sec=float(os.getenv("OUTPUT_BREAKER_RESET_SEC", "30")),
+        )
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._main())
+        self.loop.close()
+
+    async def _main(self):
+        workers = [asyncio.ensure_future(destination.run()) for destination in self.destinations]
+        # let workers create their events before the exporter wakes them up
+        await asyncio.sleep(0)
+        self._started.set()
+        await asyncio.gather(*workers)
+
+    def _wake_up(self):
+        for destination in self.destinations:
+            destination.wakeup.set()
+
+    def emit(self, event):
+        for destination in self.destinations:
+            destination.put(event)
+
+    def held_positions(self):
+        return [position for destination in self.destinations for position in destination.held_positions()]
+
+    def flush(self, force=False):
+        if self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self._wake_up)
+
+    def close(self):
+        for destination in self.destinations:
+            destination.is_closing = True
+        self.flush()
+        self.thread.join(self.CLOSE_TIMEOUT_SEC)
+        if self.thread.is_alive():
+            log.error(f"Outputs were not closed in {self.CLOSE_TIMEOUT_SEC}s, "
+                      f"{sum(len(destination.queue) for destination in self.destinations)} queued events are not sent")
+        for destination in self.destinations:
+            destination.executor.shutdown(wait=False)
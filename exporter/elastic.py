@@ -0,0 +1,184 @@
+"""
+Elasticsearch output. Events are buffered and sent by _bulk API when the number of documents,
+the size of a request or the linger time is reached.
+"""
+import collections
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+from outputs import env_bool, HELD_POSITIONS, OUTPUT
+
+log = logging.getLogger(__name__)
+
+
+class ELASTICSEARCH_BULK_OUTPUT(OUTPUT):
+
+    NAME = "elasticsearch"
+    # per request and per item statuses which are worth to retry
+    RETRY_STATUSES = {429, 502, 503, 504}
+    MAX_BACKOFF_SEC = 30
+
+    def __init__(self, url, auth=None, max_docs=500, max_bytes=5 * 1024 * 1024, linger_sec=1.0, max_retries=3,
+                 max_buffered_docs=100000, pool_maxsize=4, op_type="index", timeout=(5, 30)) -> None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.bulk_url = f"{url}/_bulk"
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.linger_sec = linger_sec
+        self.max_retries = max_retries
+        self.max_buffered_docs = max_buffered_docs
+        self.op_type = op_type
+        self.timeout = timeout
+        # keep-alive connections are reused between flushes
+        self.session = requests.Session()
+        self.session.auth = auth
+        self.session.headers.update({"Content-Type": "application/x-ndjson"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # (ndjson action and source, number of retries, position of the line)
+        self.buffer = collections.deque()
+        self.held = HELD_POSITIONS()
+        self.buffer_bytes = 0
+        self.first_buffered_at = 0
+        self.retry_after = 0
+        self.failed_requests = 0
+        self.sent_docs = 0
+        self.dropped_docs = 0
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        elastic_ip = os.getenv('ELASTIC_IP', '') if os.getenv('ELASTIC_IP') else '172.25.80.1'
+        elastic_port = os.getenv('ELASTIC_PORT', '') if os.getenv('ELASTIC_PORT') else '9200'
+        return cls(
+            url=f"http://{elastic_ip}:{elastic_port}",
+            auth=(os.getenv('ELASTIC_USER_LOGIN', 'elastic'), os.getenv('ELASTIC_USER_PASS', 'changeme')),
+            max_docs=int(os.getenv('ELASTIC_BULK_MAX_DOCS', '500')),
+            max_bytes=int(os.getenv('ELASTIC_BULK_MAX_BYTES', str(5 * 1024 * 1024))),
+            linger_sec=float(os.getenv('ELASTIC_BULK_LINGER_SEC', '1')),
+            # data streams accept only `create` operation
+            op_type="create" if env_bool('ELASTIC_DATA_STREAM_BOOL') else "index",
+            **kwargs,
+        )
+
+    def emit(self, event):
+        record = event.to_dict()
+        record["@timestamp"] = datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+        action = {self.op_type: {"_index": event.elasticsearch_index}}
+        payload = f"{json.dumps(action)}\n{json.dumps(record)}\n".encode()
+        self._push(payload, 0, event.position)
+        if self._is_full():
+            self.flush()
+
+    def _push(self, payload, retries, position, left=False):
+        """ Requeued documents were taken from the buffer, a full buffer refuses new documents only """
+        if not left and len(self.buffer) >= self.max_buffered_docs:
+            # the position is not held, so the checkpoint moves past the dropped document
+            self.dropped_docs += 1
+            if self.dropped_docs % 1000 == 1:
+                log.warning(f"Elasticsearch buffer is full, {self.dropped_docs} documents were dropped so far")
+            return
+        if not self.buffer:
+            self.first_buffered_at = time.monotonic()
+        if left:
+            self.buffer.appendleft((payload, retries, position))
+        else:
+            self.buffer.append((payload, retries, position))
+        self.held.add(position)
+        self.buffer_bytes += len(payload)
+
+    def _is_full(self):
+        return len(self.buffer) >= self.max_docs or self.buffer_bytes >= self.max_bytes
+
+    def _is_due(self):
+        return self._is_full() or (self.buffer and time.monotonic() - self.first_buffered_at >= self.linger_sec)
+
+    def _take_batch(self):
+        batch, batch_bytes = [], 0
+        while self.buffer and len(batch) < self.max_docs:
+            payload = self.buffer[0][0]
+            if batch and batch_bytes + len(payload) > self.max_bytes:
+                break
+            batch.append(self.buffer.popleft())
+            batch_bytes += len(payload)
+        self.buffer_bytes -= batch_bytes
+        if self.buffer:
+            self.first_buffered_at = time.monotonic()
+        return batch
+
+    def _requeue(self, batch):
+        """ Put the whole batch back at the head of the buffer keeping the order """
+        for payload, retries, position in reversed(batch):
+            self._push(payload, retries, position, left=True)
+
+    def flush(self, force=False):
+        if not force and (not self._is_due() or time.monotonic() < self.retry_after):
+            return
+        while self.buffer:
+            batch = self._take_batch()
+            is_sent = self._send(batch)
+            if not is_sent:
+                self._requeue(batch)
+            # documents to resend are buffered again by now
+            for _, _, position in batch:
+                self.held.release(position)
+            # requeued documents wait for the backoff even when forced, close() sends each of them once at most
+            if not is_sent or time.monotonic() < self.retry_after:
+                break
+            if not force and not self._is_due():
+                break
+
+    def _send(self, batch):
+        """ Return False if the whole request has to be repeated later """
+        try:
+            r = self.session.post(self.bulk_url, data=b"".join(payload for payload, _, _ in batch), timeout=self.timeout)
+        except Exception as e:
+            return self._backoff(f"Elasticsearch is not available, {e}")
+        if r.status_code in self.RETRY_STATUSES or r.status_code >= 500:
+            return self._backoff(f"Elasticsearch replied {r.status_code}")
+        self.failed_requests = 0
+        if not r.ok:
+            # auth or malformed request, repeating doesn't help
+            log.critical(f"Elasticsearch rejected bulk request of {len(batch)} documents, {r.status_code}: {r.text}")
+            self.dropped_docs += len(batch)
+            return True
+        reply = r.json()
+        if not reply.get("errors"):
+            self.sent_docs += len(batch)
+            return True
+        self._handle_item_errors(batch, reply.get("items", []))
+        return True
+
+    def _handle_item_errors(self, batch, items):
+        retry_ll = []
+        for (payload, retries, position), item in zip(batch, items):
+            result = next(iter(item.values()), {})
+            status = result.get("status", 200)
+            if status < 300:
+                self.sent_docs += 1
+            elif status in self.RETRY_STATUSES and retries < self.max_retries:
+                retry_ll.append((payload, retries + 1, position))
+            else:
+                self.dropped_docs += 1
+                log.error(f"Elasticsearch rejected document {status}: {result.get('error')}")
+        if retry_ll:
+            self._requeue(retry_ll)
+            self._backoff(f"{len(retry_ll)} documents of {len(batch)} were not indexed by Elasticsearch and will be resent")
+
+    def _backoff(self, reason):
+        self.failed_requests += 1
+        backoff_sec = min(2 ** self.failed_requests, self.MAX_BACKOFF_SEC)
+        self.retry_after = time.monotonic() + backoff_sec
+        log.error(f"{reason}. {len(self.buffer)} buffered documents, retry in {backoff_sec}s")
+        return False
+
+    def held_positions(self):
+        return list(self.held)
+
+    def close(self):
+        self.flush(force=True)
+        self.session.close()
@@ -0,0 +1,254 @@
+"""
+Watcher log line -> compact event record.
+
+One pass per line: the line is split once and dispatched on the event_name column.
+v3.1.0+ lines carry a trailing `sesid,srcid` pair, older lines don't have it.
+
+2024-12-29T13:20:50.398Z,isis-watcher,1,temetric,0200.1001.0002,changed,0_17_19_20_21_22_26_29_30,1000000000,1000000000,1000000000_1000000008_1000000016_1000000024_1000000032_1000000040_1000000048_1000000056,11223344,0200.1001.0003,2024-07-28T18:03:05Z,49.0001,01Jan2023_00h00m00s_7_hosts,10.1.23.3,10.1.23.2,179,
+2024-10-08T22:55:32Z,watcher1,1,metric,0200.1001.0003,changed,old_cost:5,new_cost:-1,0200.1001.0002,10Oct2024_00h00m00s_7_hosts,49.0002,12345,10.1.23.2,10.1.23.3,,
+2024-08-31T12:56:51Z,watcher1,1,network,10.10.10.1/32,changed,old_cost:10,new_cost:-1,0200.1025.0002,10Oct2024_00h00m00s_7_hosts,49.0002,12345,internal,0,,
+"""
+import os
+
+ELASTICSEARCH_UPDOWN_INDEX = "isis-watcher-updown-events"
+ELASTICSEARCH_COSTS_INDEX = "isis-watcher-costs-changes"
+ELASTICSEARCH_TEMETRIC_INDEX = "isis-watcher-temetric-changes"
+
+
+class UnparsableEvent(ValueError):
+    pass
+
+
+def _cost(column):
+    """ old_cost:10 -> 10 """
+    return int(column.rpartition(":")[2])
+
+
+class EVENT:
+    """ Columns shared by all exported events """
+
+    FIELDS = ("watcher_time", "watcher_name", "level_number", "event_name", "event_object", "event_status",
+              "event_detected_by", "graph_time", "area_num", "asn", "sesid", "srcid")
+    # observed_by is set by the deduplication stage, read_at and position of the line by the exporter
+    __slots__ = FIELDS + ("observed_by", "read_at", "position")
+    MIN_COLUMNS = 0
+
+    def __init__(self, parts):
+        self.watcher_time, self.watcher_name, self.level_number, self.event_name, self.event_object, self.event_status = parts[:6]
+        # v3.1.0+
+        self.sesid = ""
+        self.srcid = ""
+        self.observed_by = None
+        self.read_at = 0
+        self.position = None
+
+    @property
+    def object_status(self):
+        return "changed"
+
+    @property
+    def file_name(self):
+        """ Watcher log file of the line, empty if the event wasn't read by the exporter """
+        return os.path.basename(self.position[0]) if self.position else ""
+
+    @property
+    def elasticsearch_index(self):
+        raise NotImplementedError
+
+    @property
+    def mongo_collection_name(self):
+        raise NotImplementedError
+
+    @property
+    def zabbix_host(self):
+        return ""
+
+    @property
+    def z_object_item_name(self):
+        return ""
+
+    @property
+    def message(self):
+        """ Human readable text, the same as z_item_value and webhook_item_value in logstash.conf """
+        raise NotImplementedError
+
+    def to_dict(self):
+        record = {field: getattr(self, field) for field in self.FIELDS}
+        record["watcher_time_iso8601"] = self.watcher_time
+        record["protocol"] = "isis"
+        if self.observed_by:
+            record["observed_by"] = list(self.observed_by)
+        return record
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.watcher_name}, L{self.level_number}, {self.event_object}, {self.object_status})"
+
+
+class COST_EVENT(EVENT):
+    """ metric and network events: old_cost:-1 is up, new_cost:-1 is down """
+
+    __slots__ = ("old_cost", "new_cost")
+    FIELDS = EVENT.FIELDS + __slots__
+
+    @property
+    def object_status(self):
+        if self.new_cost == -1:
+            return "down"
+        elif self.old_cost == -1:
+            return "up"
+        return "changed"
+
+    @property
+    def elasticsearch_index(self):
+        return ELASTICSEARCH_COSTS_INDEX if self.object_status == "changed" else ELASTICSEARCH_UPDOWN_INDEX
+
+    def to_dict(self):
+        record = super().to_dict()
+        record["object_status"] = self.object_status
+        return record
+
+
+class METRIC_EVENT(COST_EVENT):
+
+    __slots__ = ("local_ip_address", "remote_ip_address")
+    FIELDS = COST_EVENT.FIELDS + __slots__
+    MIN_COLUMNS = 14
+
+    def __init__(self, parts):
+        super().__init__(parts)
+        self.old_cost = _cost(parts[6])
+        self.new_cost = _cost(parts[7])
+        self.event_detected_by, self.graph_time, self.area_num, self.asn, self.local_ip_address, self.remote_ip_address = parts[8:14]
+        if len(parts) >= 16:
+            self.sesid, self.srcid = parts[14:16]
+
+    @property
+    def mongo_collection_name(self):
+        return "isis_link_cost_change" if self.object_status == "changed" else "isis_neighbor_up_down"
+
+    @property
+    def zabbix_host(self):
+        return self.mongo_collection_name
+
+    @property
+    def z_object_item_name(self):
+        return self.mongo_collection_name
+
+    @property
+    def message(self):
+        object_status = self.object_status
+        if object_status == "changed":
+            return (f"IS-IS L{self.level_number} link cost changed between:{self.event_object}-{self.event_detected_by}, old:{self.old_cost}, new:{self.new_cost}, "
+                    f"detected by:{self.event_detected_by}, local ip address:{self.local_ip_address}")
+        return (f"IS-IS L{self.level_number} {object_status} between {self.event_object}-{self.event_detected_by}, cost:{self.new_cost}, "
+                f"detected by:{self.event_detected_by}, local ip address:{self.local_ip_address}")
+
+
+class NETWORK_EVENT(COST_EVENT):
+
+    __slots__ = ("subnet_type", "int_ext_subtype")
+    FIELDS = COST_EVENT.FIELDS + __slots__
+    MIN_COLUMNS = 14
+
+    def __init__(self, parts):
+        super().__init__(parts)
+        self.old_cost = _cost(parts[6])
+        self.new_cost = _cost(parts[7])
+        self.event_detected_by, self.graph_time, self.area_num, self.asn, self.subnet_type = parts[8:13]
+        self.int_ext_subtype = int(parts[13])
+        if len(parts) >= 16:
+            self.sesid, self.srcid = parts[14:16]
+
+    @property
+    def mongo_collection_name(self):
+        return "isis_network_cost_change" if self.object_status == "changed" else "isis_network_up_down"
+
+    @property
+    def zabbix_host(self):
+        return self.mongo_collection_name
+
+    @property
+    def z_object_item_name(self):
+        return "isis_stub_network_cost_change" if self.object_status == "changed" else "isis_network_up_down"
+
+    @property
+    def message(self):
+        object_status = self.object_status
+        if object_status == "down":
+            return f"IS-IS L{self.level_number} {self.subnet_type} {self.event_object} network down, cost:{self.old_cost}, detected by:{self.event_detected_by}"
+        elif object_status == "up":
+            return f"IS-IS L{self.level_number} {self.subnet_type} {self.event_object} network up, cost:{self.new_cost}, detected by:{self.event_detected_by}"
+        return (f"IS-IS L{self.level_number} {self.subnet_type} network cost changed:{self.event_object}, old:{self.old_cost}, new:{self.new_cost}, "
+                f"detected by:{self.event_detected_by}")
+
+
+class TEMETRIC_EVENT(EVENT):
+
+    __slots__ = ("admin_groups", "max_link_bw", "max_rsrv_link_bw", "unreserved_bandwidth", "temetric",
+                 "local_ip_address", "remote_ip_address")
+    FIELDS = EVENT.FIELDS + __slots__
+    MIN_COLUMNS = 17
+    UNRESERVED_BANDWIDTH_PRIORITIES = 8
+
+    def __init__(self, parts):
+        super().__init__(parts)
+        self.admin_groups = tuple(int(group) for group in parts[6].split("_") if group)
+        self.max_link_bw = int(parts[7])
+        self.max_rsrv_link_bw = int(parts[8])
+        self.unreserved_bandwidth = tuple(int(bw) for bw in parts[9].split("_") if bw)
+        self.temetric = int(parts[10])
+        self.event_detected_by, self.graph_time, self.area_num, self.asn, self.local_ip_address, self.remote_ip_address = parts[11:17]
+        if len(parts) >= 19:
+            self.sesid, self.srcid = parts[17:19]
+
+    @property
+    def elasticsearch_index(self):
+        return ELASTICSEARCH_TEMETRIC_INDEX
+
+    @property
+    def mongo_collection_name(self):
+        return "temetric_change"
+
+    @property
+    def message(self):
+        unreserved_bandwidth = ",".join(f"unreserved_bandwidth_{priority}:{bw}" for priority, bw in enumerate(self.unreserved_bandwidth))
+        return (f"IS-IS L{self.level_number} te link attributes changed between:{self.event_object}-{self.event_detected_by} new: "
+                f"admin_groups:{list(self.admin_groups)},max_link_bw:{self.max_link_bw},max_rsrv_link_bw:{self.max_rsrv_link_bw},{unreserved_bandwidth},"
+                f"temetric:{self.temetric}, detected by:{self.event_detected_by}, local ip address:{self.local_ip_address}")
+
+    def to_dict(self):
+        record = super().to_dict()
+        record["admin_groups"] = list(self.admin_groups)
+        del record["unreserved_bandwidth"]
+        for priority, bw in enumerate(self.unreserved_bandwidth[:self.UNRESERVED_BANDWIDTH_PRIORITIES]):
+            record[f"unreserved_bandwidth_{priority}"] = bw
+        return record
+
+
+EVENT_NAME_TO_CLASS = {
+    "metric": METRIC_EVENT,
+    "network": NETWORK_EVENT,
+    "temetric": TEMETRIC_EVENT,
+}
+
+
+def parse_line(line):
+    """
+    Return an event record for a `changed` line or None for lines which are not exported (host/up/down and others).
+    Raise UnparsableEvent if a `changed` line doesn't match its layout.
+    """
+    # cheap substring check rejects most of lines before splitting
+    if "changed" not in line:
+        return None
+    parts = line.rstrip("\r\n").split(",")
+    if len(parts) < 6 or parts[5] != "changed":
+        return None
+    event_cls = EVENT_NAME_TO_CLASS.get(parts[3])
+    if event_cls is None:
+        raise UnparsableEvent(f"Unknown event name {parts[3]}: {line!r}")
+    if len(parts) < event_cls.MIN_COLUMNS:
+        raise UnparsableEvent(f"{parts[3]} line has {len(parts)} columns, expected at least {event_cls.MIN_COLUMNS}: {line!r}")
+    try:
+        return event_cls(parts)
+    except ValueError as e:
+        raise UnparsableEvent(f"{e}: {line!r}") from e
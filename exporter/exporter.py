@@ -0,0 +1,181 @@
+"""
+Single-process exporter of watcher*.isis.log events. Replacement for Logstash/Fluent Bit pipelines.
+Follows watcher log files, parses `changed` lines and ships them to enabled outputs.
+Outputs are enabled by the same .env variables as logstash.conf.
+"""
+import argparse
+import logging
+import os
+import signal
+import sys
+import time
+
+from events import parse_line, UnparsableEvent
+from outputs import env_bool, STDOUT_OUTPUT, HTTP_OUTPUT, WEBHOOK_OUTPUT
+from elastic import ELASTICSEARCH_BULK_OUTPUT
+from topology import TOPOLOGY_STATE_OUTPUT
+from zabbix import ZABBIX_SENDER_OUTPUT
+from mongo import MONGO_BULK_OUTPUT
+from dampening import FLAP_DAMPENING
+from dedup import EVENT_DEDUP
+from dispatcher import ASYNC_DISPATCHER
+from metrics import EXPORTER_METRICS, METRICS_SERVER
+from tailer import LOG_TAILER
+
+log = logging.getLogger(__name__)
+
+WATCHER_LOGS_PATTERN = "/home/watcher/watcher/logs/watcher*.isis.log"
+
+
+class EXPORTER:
+
+    def __init__(self, tailer, outputs, stages=(), metrics_server=None) -> None:
+        self.tailer = tailer
+        self.outputs = outputs
+        # events pass stages in order, each stage returns a list of events for the next one from process() and tick()
+        self.stages = list(stages)
+        self.metrics_server = metrics_server
+        self.metrics = None
+        if metrics_server is not None:
+            self.metrics = metrics_server.metrics
+            self.metrics.bind(self.stages, self.outputs)
+        self.lines_count = 0
+        self.events_count = 0
+        self.unparsable_count = 0
+
+    @classmethod
+    def from_env(cls, pattern):
+        outputs = []
+        if env_bool("DEBUG_BOOL"):
+            outputs.append(STDOUT_OUTPUT())
+        if env_bool("EXPORT_TO_TOPOLOGRAPH_SOCKET"):
+            outputs.append(HTTP_OUTPUT("topolograph", f"http://{os.getenv('TOPOLOGRAPH_HOST', '')}:{os.getenv('TOPOLOGRAPH_PORT', '')}/websocket"))
+        if env_bool("EXPORT_TO_WEBHOOK_URL_BOOL"):
+            outputs.append(WEBHOOK_OUTPUT("webhook", os.getenv("WEBHOOK_URL", "localhost")))
+        if env_bool("EXPORT_TO_ELASTICSEARCH_BOOL"):
+            outputs.append(ELASTICSEARCH_BULK_OUTPUT.from_env())
+        if env_bool("EXPORT_TO_MONGO_BOOL"):
+            outputs.append(MONGO_BULK_OUTPUT.from_env())
+        if env_bool("EXPORT_TO_ZABBIX_BOOL"):
+            outputs.append(ZABBIX_SENDER_OUTPUT.from_env())
+        if os.getenv("TOPOLOGY_STATE_FILE"):
+            outputs.append(TOPOLOGY_STATE_OUTPUT.from_env())
+        # every output gets its own queue and worker, so a dead one doesn't block the others
+        if outputs and env_bool("ASYNC_OUTPUTS_BOOL", "True"):
+            outputs = [ASYNC_DISPATCHER.from_env(outputs)]
+        stages = []
+        # duplicates are removed first, so dampening counts a flap once for all watchers of the area
+        if EVENT_DEDUP.is_enabled():
+            stages.append(EVENT_DEDUP.from_env())
+        if FLAP_DAMPENING.is_enabled():
+            stages.append(FLAP_DAMPENING.from_env())
+        metrics_server = METRICS_SERVER.from_env(EXPORTER_METRICS()) if os.getenv("METRICS_PORT") else None
+        tailer = LOG_TAILER(pattern, checkpoint_file_path=os.getenv("TAILER_CHECKPOINT_FILE", ""))
+        return cls(tailer, outputs, stages=stages, metrics_server=metrics_server)
+
+    def process_line(self, path, line, position=None):
+        self.lines_count += 1
+        read_at = time.monotonic()
+        try:
+            event = parse_line(line)
+        except UnparsableEvent as e:
+            parse_sec = time.monotonic() - read_at
+            self.unparsable_count += 1
+            log.warning(f"{path}: {e}")
+            if self.metrics is not None:
+                self.metrics.observe_unparsable(os.path.basename(path), parse_sec)
+            return
+        if self.metrics is not None:
+            self.metrics.observe_line(os.path.basename(path), event, time.monotonic() - read_at)
+        if event is None:
+            return
+        event.read_at = read_at
+        event.position = position
+        self.events_count += 1
+        if self.stages:
+            self.push([event])
+        else:
+            self.emit(event)
+
+    def push(self, events, first_stage_index=0):
+        """ Pass events through stages starting from first_stage_index and emit the result """
+        for stage in self.stages[first_stage_index:]:
+            if not events:
+                return
+            events = [stage_event for event in events for stage_event in stage.process(event)]
+        for event in events:
+            self.emit(event)
+
+    def emit(self, event):
+        for output in self.outputs:
+            output.emit(event)
+            # the dispatcher reports latency of its destinations itself
+            if self.metrics is not None and not isinstance(output, ASYNC_DISPATCHER):
+                self.metrics.observe_output(output.NAME, event)
+
+    def tick_stages(self, is_closing=False):
+        for stage_index, stage in enumerate(self.stages):
+            released_events = stage.close() if is_closing else stage.tick()
+            if released_events:
+                self.push(released_events, stage_index + 1)
+
+    def held_positions(self):
+        """ Positions of lines which events are held by stages or not delivered by outputs yet """
+        for component in self.stages + self.outputs:
+            yield from component.held_positions()
+
+    def run_once(self):
+        lines = self.tailer.poll()
+        for path, line, position in lines:
+            self.process_line(path, line, position)
+        self.tick_stages()
+        for output in self.outputs:
+            output.flush()
+        # delivered lines are not read again after restart, the rest are read again
+        self.tailer.checkpoint(get_held_positions=self.held_positions)
+        return len(lines)
+
+    def run(self, poll_interval=0.2):
+        log.info(f"Exporting to: {', '.join(output.NAME for output in self.outputs) or 'nowhere'}")
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+        try:
+            while True:
+                if not self.run_once():
+                    self.tailer.wait(poll_interval)
+        finally:
+            self.close()
+
+    def close(self):
+        self.tick_stages(is_closing=True)
+        for output in self.outputs:
+            output.close()
+        # events which outputs failed to deliver while closing are read again after restart
+        self.tailer.close(get_held_positions=self.held_positions)
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+
+
+def terminate(signum, frame):
+    # the second signal doesn't interrupt closing
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    log.info("Terminated, closing outputs")
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Export IS-IS Watcher events from watcher*.isis.log files"
+    )
+    parser.add_argument(
+        "--path", required=False, default=os.getenv("WATCHER_LOGS_PATTERN", WATCHER_LOGS_PATTERN), help="Glob pattern of watcher log files"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO)
+    # `docker stop` sends SIGTERM, PID 1 of the container ignores it without a handler. Outputs are closed by run()
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        EXPORTER.from_env(args.path).run()
+    except KeyboardInterrupt:
+        print("\nInterrupted. Bye!")
+        sys.exit(1)
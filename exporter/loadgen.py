@@ -0,0 +1,184 @@
+"""
+Synthetic watcher logs: realistic `changed` lines of all three layouts written to N watcher files at a given rate.
+Every line carries its sequence number in the sesid column and `loadgen` in srcid, so a sink can match
+the exported event to the time it was written.
+python3 loadgen.py --logs-dir /tmp/logs --watchers 4 --rate 1000 --duration 60 --mix temetric=1,metric=4,network=2
+"""
+import argparse
+import collections
+import os
+import random
+import time
+from datetime import datetime, timezone
+
+SRCID = "loadgen"
+DEFAULT_MIX = "temetric=1,metric=4,network=2"
+ADMIN_GROUPS = [0, 1, 2, 3, 17, 19, 20, 21, 22, 26, 29, 30]
+BANDWIDTHS = [100000000, 1000000000, 10000000000, 100000000000]
+
+
+def parse_mix(mix):
+    """ temetric=1,metric=4,network=2 -> {"temetric": 1.0, "metric": 4.0, "network": 2.0} """
+    mix_dd = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ("temetric", "metric", "network"):
+            raise ValueError(f"Unknown event name {name} in mix {mix}, expected temetric, metric, network")
+        mix_dd[name] = float(weight or 1)
+    if not any(mix_dd.values()):
+        raise ValueError(f"Mix {mix} has no events")
+    return mix_dd
+
+
+class WATCHER_LINES:
+    """ Lines of one watcher, the topology is random but fixed, so up/down/change events repeat for the same links """
+
+    def __init__(self, watcher_name, area_num, asn, rnd, nodes_num=50, links_num=100, prefixes_num=200) -> None:
+        self.watcher_name = watcher_name
+        self.area_num = area_num
+        self.asn = asn
+        self.rnd = rnd
+        self.graph_time = "01Jan2025_00h00m00s_{}_hosts".format(nodes_num)
+        self.nodes = [f"0200.1001.{num:04d}" for num in range(1, nodes_num + 1)]
+        self.links = []
+        for num in range(links_num):
+            local_node, remote_node = rnd.sample(self.nodes, 2)
+            local_ip = f"10.{num // 250}.{num % 250}.1"
+            remote_ip = f"10.{num // 250}.{num % 250}.2"
+            self.links.append((local_node, remote_node, local_ip, remote_ip))
+        self.prefixes = []
+        for num in range(prefixes_num):
+            prefix = f"192.168.{num // 64}.{num % 64 * 4}/30" if num % 3 else f"4ffe:10::{num:x}:0/127"
+            self.prefixes.append((prefix, rnd.choice(self.nodes), "external" if num % 5 == 0 else "internal"))
+
+    @staticmethod
+    def now():
+        return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+    def metric(self, seq):
+        local_node, remote_node, local_ip, remote_ip = self.rnd.choice(self.links)
+        kind = self.rnd.random()
+        cost = self.rnd.choice((10, 20, 100))
+        if kind < 0.35:
+            old_cost, new_cost = cost, -1
+        elif kind < 0.7:
+            old_cost, new_cost = -1, cost
+        else:
+            old_cost, new_cost = cost, cost + self.rnd.randint(1, 50)
+        level = self.rnd.choice("12")
+        return (f"{self.now()},{self.watcher_name},{level},metric,{remote_node},changed,old_cost:{old_cost},new_cost:{new_cost},{local_node},"
+                f"{self.graph_time},{self.area_num},{self.asn},{local_ip},{remote_ip},{seq},{SRCID}\n")
+
+    def network(self, seq):
+        prefix, node, subnet_type = self.rnd.choice(self.prefixes)
+        kind = self.rnd.random()
+        cost = self.rnd.choice((0, 10, 20))
+        if kind < 0.35:
+            old_cost, new_cost = cost, -1
+        elif kind < 0.7:
+            old_cost, new_cost = -1, cost
+        else:
+            old_cost, new_cost = cost, cost + self.rnd.randint(1, 50)
+        int_ext_subtype = 1 if subnet_type == "external" else 0
+        level = self.rnd.choice("12")
+        return (f"{self.now()},{self.watcher_name},{level},network,{prefix},changed,old_cost:{old_cost},new_cost:{new_cost},{node},"
+                f"{self.graph_time},{self.area_num},{self.asn},{subnet_type},{int_ext_subtype},{seq},{SRCID}\n")
+
+    def temetric(self, seq):
+        local_node, remote_node, local_ip, remote_ip = self.rnd.choice(self.links)
+        admin_groups = "_".join(str(group) for group in sorted(self.rnd.sample(ADMIN_GROUPS, self.rnd.randint(1, 6))))
+        max_link_bw = self.rnd.choice(BANDWIDTHS)
+        unreserved_bandwidth = "_".join(str(max_link_bw - priority * self.rnd.randint(0, 1000)) for priority in range(8))
+        level = self.rnd.choice("12")
+        return (f"{self.now()},{self.watcher_name},{level},temetric,{remote_node},changed,{admin_groups},{max_link_bw},{max_link_bw},"
+                f"{unreserved_bandwidth},{self.rnd.randint(1, 16777215)},{local_node},2025-01-01T00:00:00Z,{self.area_num},{self.graph_time},"
+                f"{local_ip},{remote_ip},{seq},{SRCID}\n")
+
+
+class LOAD_GENERATOR:
+    """ Writes lines round-robin to watcher files, paced to `rate` lines per second """
+
+    BATCH_SEC = 0.01
+
+    def __init__(self, logs_dir, watchers_num=1, mix=DEFAULT_MIX, seed=None) -> None:
+        self.logs_dir = logs_dir
+        rnd = random.Random(seed)
+        self.rnd = rnd
+        self.watchers = [WATCHER_LINES(f"watcher{num}", f"49.{num:04d}", 65000 + num, rnd) for num in range(1, watchers_num + 1)]
+        mix_dd = parse_mix(mix)
+        self.event_names = list(mix_dd)
+        self.weights = [mix_dd[name] for name in self.event_names]
+        self.files = []
+        # sequence number -> time.time() when the line was written
+        self.written_at = []
+        # event name -> number of written lines
+        self.written_dd = collections.Counter()
+
+    def open(self):
+        os.makedirs(self.logs_dir, exist_ok=True)
+        self.files = [open(os.path.join(self.logs_dir, f"{watcher.watcher_name}.isis.log"), "a", buffering=1 << 16)
+                      for watcher in self.watchers]
+
+    def close(self):
+        for f in self.files:
+            f.close()
+        self.files = []
+
+    def line(self, seq, watcher_index):
+        event_name = self.rnd.choices(self.event_names, self.weights)[0]
+        self.written_dd[event_name] += 1
+        return getattr(self.watchers[watcher_index], event_name)(seq)
+
+    def write(self, rate, duration_sec):
+        """ Return the number of written lines. Lines are written in batches every BATCH_SEC and flushed """
+        if not self.files:
+            self.open()
+        started_at = time.monotonic()
+        watchers_num = len(self.watchers)
+        first_seq = seq = len(self.written_at)
+        while True:
+            elapsed = time.monotonic() - started_at
+            if elapsed >= duration_sec:
+                break
+            due_num = int(min(elapsed + self.BATCH_SEC, duration_sec) * rate) - (seq - first_seq)
+            batch_ll = [[] for _ in range(watchers_num)]
+            for _ in range(due_num):
+                batch_ll[seq % watchers_num].append(self.line(seq, seq % watchers_num))
+                seq += 1
+            for f, lines in zip(self.files, batch_ll):
+                if lines:
+                    f.write("".join(lines))
+                    f.flush()
+            written_at = time.time()
+            self.written_at.extend([written_at] * (seq - len(self.written_at)))
+            time.sleep(self.BATCH_SEC)
+        return len(self.written_at)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Write synthetic watcher log lines"
+    )
+    parser.add_argument(
+        "--logs-dir", required=True, help="Folder of watcher*.isis.log files"
+    )
+    parser.add_argument(
+        "--watchers", required=False, default=1, type=int, help="Number of watcher files"
+    )
+    parser.add_argument(
+        "--rate", required=False, default=1000, type=float, help="Lines per second, all files together"
+    )
+    parser.add_argument(
+        "--duration", required=False, default=10, type=float, help="Seconds"
+    )
+    parser.add_argument(
+        "--mix", required=False, default=DEFAULT_MIX, help="Weights of temetric, metric and network events"
+    )
+    args = parser.parse_args()
+    generator = LOAD_GENERATOR(args.logs_dir, watchers_num=args.watchers, mix=args.mix)
+    try:
+        written_num = generator.write(args.rate, args.duration)
+    finally:
+        generator.close()
+    print(f"{written_num} lines written to {args.logs_dir}")
@@ -0,0 +1,215 @@
+"""
+Prometheus metrics of the exporter in text exposition format, served on METRICS_PORT at /metrics.
+No client library is needed: counters and histograms are plain dicts updated by the exporter loop and the
+dispatcher, queue depths and output counters are collected when /metrics is scraped.
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger(__name__)
+
+# seconds
+PARSE_TIME_BUCKETS = (0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005)
+OUTPUT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(label_names, labels):
+    if not label_names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(label_names, labels))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class METRIC:
+
+    TYPE = ""
+
+    def __init__(self, name, help_text, label_names=(), collect=None) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        # labels tuple -> value
+        self.values = {}
+        # function returning {labels tuple: value}, called on scrape
+        self.collect = collect
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.TYPE}"]
+        values = self.collect() if self.collect is not None else dict(self.values)
+        for labels, value in values.items():
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class COUNTER(METRIC):
+
+    TYPE = "counter"
+
+    def inc(self, labels=(), value=1):
+        self.values[labels] = self.values.get(labels, 0) + value
+
+
+class GAUGE(METRIC):
+
+    TYPE = "gauge"
+
+    def set(self, value, labels=()):
+        self.values[labels] = value
+
+
+class HISTOGRAM(METRIC):
+
+    TYPE = "histogram"
+
+    def __init__(self, name, help_text, buckets, label_names=()) -> None:
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labels=()):
+        """ values[labels] is [count per bucket..., count above the last bucket, sum] """
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.TYPE}"]
+        label_names = self.label_names + ("le",)
+        for labels, counts in list(self.values.items()):
+            cumulative = 0
+            for bucket, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(label_names, labels + (bucket,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {counts[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class EXPORTER_METRICS:
+    """ All series of the exporter. The exporter calls observe_* methods, the rest is collected on scrape """
+
+    def __init__(self) -> None:
+        self.lines = COUNTER("isis_exporter_lines_total", "Lines read from watcher log files", ["file"])
+        self.parsed = COUNTER("isis_exporter_events_parsed_total", "Changed events parsed", ["file", "event_name"])
+        self.unparsable = COUNTER("isis_exporter_events_unparsable_total", "Changed lines which don't match their layout", ["file"])
+        self.skipped = COUNTER("isis_exporter_lines_skipped_total", "Lines which are not exported (host, up, down)", ["file"])
+        self.parse_seconds = HISTOGRAM("isis_exporter_parse_seconds", "Time to parse a line, unparsable lines included", PARSE_TIME_BUCKETS)
+        self.output_latency = HISTOGRAM(
+            "isis_exporter_output_latency_seconds",
+            "Time from reading the line until its event is handed to the output client",
+            OUTPUT_LATENCY_BUCKETS, ["destination"],
+        )
+        self.stage_dropped = COUNTER("isis_exporter_stage_dropped_total", "Events dropped by dedup and held back by dampening",
+                                     ["stage", "file", "event_name"], collect=self._collect_stage_dropped)
+        self.queue_depth = GAUGE("isis_exporter_output_queue_events", "Events waiting in the queue of the output",
+                                 ["destination"], collect=lambda: self._collect_destinations("queue_depth"))
+        self.sent = COUNTER("isis_exporter_output_sent_total", "Events handed to the output client",
+                            ["destination"], collect=lambda: self._collect_destinations("sent_count"))
+        self.retries = COUNTER("isis_exporter_output_retries_total", "Retries of failed events",
+                               ["destination"], collect=lambda: self._collect_destinations("retries_count"))
+        self.dropped = COUNTER("isis_exporter_output_dropped_total", "Events dropped by the output queue: overflow, rejected or retries exceeded",
+                               ["destination"], collect=lambda: self._collect_destinations("dropped_count"))
+        self.breaker_open = GAUGE("isis_exporter_output_circuit_open", "1 if the circuit breaker of the output is open",
+                                  ["destination"], collect=lambda: self._collect_destinations("is_breaker_open"))
+        self.metrics = [
+            self.lines, self.parsed, self.unparsable, self.skipped, self.parse_seconds, self.output_latency,
+            self.stage_dropped, self.queue_depth, self.sent, self.retries, self.dropped, self.breaker_open,
+        ]
+        self.stages = []
+        self.destinations = []
+
+    def bind(self, stages, outputs):
+        """ Stages and dispatcher destinations are read on scrape """
+        self.stages = stages
+        self.destinations = [destination for output in outputs for destination in getattr(output, "destinations", [])]
+        for destination in self.destinations:
+            destination.metrics = self
+
+    def _collect_stage_dropped(self):
+        values = {}
+        for stage in self.stages:
+            for (file_name, event_name), count in list(stage.dropped_dd.items()):
+                values[(stage.NAME, file_name, event_name)] = count
+        return values
+
+    def _collect_destinations(self, attribute):
+        values = {}
+        for destination in self.destinations:
+            value = len(destination.queue) if attribute == "queue_depth" else getattr(destination, attribute)
+            values[(destination.name,)] = int(value)
+        return values
+
+    def observe_line(self, file_name, event, parse_sec):
+        labels = (file_name,)
+        self.lines.inc(labels)
+        self.parse_seconds.observe(parse_sec)
+        if event is None:
+            self.skipped.inc(labels)
+        else:
+            self.parsed.inc((file_name, event.event_name))
+
+    def observe_unparsable(self, file_name, parse_sec):
+        self.lines.inc((file_name,))
+        self.parse_seconds.observe(parse_sec)
+        self.unparsable.inc((file_name,))
+
+    def observe_output(self, destination_name, event):
+        self.output_latency.observe(time.monotonic() - event.read_at, (destination_name,))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class METRICS_SERVER:
+
+    def __init__(self, metrics, port, host="0.0.0.0") -> None:
+        self.metrics = metrics
+        handler = self._make_handler(metrics)
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True)
+
+    @classmethod
+    def from_env(cls, metrics):
+        return cls(metrics, port=int(os.getenv("METRICS_PORT")))
+
+    @staticmethod
+    def _make_handler(metrics):
+
+        class METRICS_HANDLER(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return METRICS_HANDLER
+
+    def start(self):
+        self.thread.start()
+        log.info(f"Metrics are served on http://{self.server.server_address[0]}:{self.server.server_address[1]}/metrics")
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,193 @@
+"""
+MongoDB output. Events are buffered per collection and written by unordered insert_many when the number of
+documents or the linger time is reached. _id is derived from the event, so a log read twice (i.e. after restart)
+doesn't produce duplicates: duplicate key errors are counted and ignored.
+
+Topolograph looks up history by watcher, object and time range, compound indexes are created at startup.
+For Logstash mongodb output indexes can be created once by: python3 mongo.py --create-indexes
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+from outputs import HELD_POSITIONS, OUTPUT
+
+log = logging.getLogger(__name__)
+
+MONGO_COLLECTIONS = [
+    "isis_neighbor_up_down",
+    "isis_link_cost_change",
+    "isis_network_up_down",
+    "isis_network_cost_change",
+    "temetric_change",
+]
+MONGO_INDEXES = [
+    [("watcher_name", 1), ("event_object", 1), ("watcher_time", 1)],
+    [("area_num", 1), ("level_number", 1), ("watcher_time", 1)],
+]
+MONGO_DUPLICATE_KEY_ERROR = 11000
+
+
+def mongo_uri_from_env():
+    return (f"mongodb://{os.getenv('MONGODB_USERNAME', 'admin')}:{os.getenv('MONGODB_PASSWORD', 'myadminpassword')}"
+            f"@{os.getenv('MONGODB_IP', '') or '127.0.0.1'}:{os.getenv('MONGODB_PORT', '') or '27017'}")
+
+
+def create_indexes(database):
+    for collection_name in MONGO_COLLECTIONS:
+        for keys in MONGO_INDEXES:
+            database[collection_name].create_index(keys, name="_".join(field for field, _ in keys))
+
+
+class MONGO_BULK_OUTPUT(OUTPUT):
+
+    NAME = "mongodb"
+    MAX_BACKOFF_SEC = 30
+
+    def __init__(self, uri, database_name="admin", max_docs=500, linger_sec=1.0, max_buffered_docs=100000, timeout_ms=5000) -> None:
+        import pymongo
+        self.pymongo = pymongo
+        self.client = pymongo.MongoClient(uri, serverSelectionTimeoutMS=timeout_ms, connectTimeoutMS=timeout_ms)
+        self.database = self.client[database_name]
+        self.max_docs = max_docs
+        self.linger_sec = linger_sec
+        self.max_buffered_docs = max_buffered_docs
+        # collection name -> list of (arrival number, document, position of the line)
+        self.buffer_dd = {}
+        self.arrivals = 0
+        self.held = HELD_POSITIONS()
+        self.buffered_docs = 0
+        self.first_buffered_at = 0
+        self.retry_after = 0
+        self.failed_requests = 0
+        self.has_indexes = False
+        self.inserted_docs = 0
+        self.duplicate_docs = 0
+        self.dropped_docs = 0
+        self._ensure_indexes()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            uri=mongo_uri_from_env(),
+            database_name=os.getenv("MONGODB_DATABASE", "admin") or "admin",
+            max_docs=int(os.getenv("MONGODB_BULK_MAX_DOCS", "500")),
+            linger_sec=float(os.getenv("MONGODB_BULK_LINGER_SEC", "1")),
+        )
+
+    def _ensure_indexes(self):
+        """ Indexes are created when MongoDB is available, at startup or with the first successful write """
+        try:
+            create_indexes(self.database)
+        except self.pymongo.errors.PyMongoError as e:
+            log.error(f"MongoDB indexes were not created, {e}")
+            return
+        self.has_indexes = True
+
+    @staticmethod
+    def document(event):
+        record = event.to_dict()
+        # the same line gives the same _id, observed_by depends on which watchers logged the event before it was exported
+        source_line = {field: value for field, value in record.items() if field != "observed_by"}
+        record["_id"] = hashlib.blake2b(json.dumps(source_line, sort_keys=True).encode(), digest_size=12).hexdigest()
+        record["@timestamp"] = datetime.now(timezone.utc)
+        return record
+
+    def emit(self, event):
+        if not self.buffered_docs:
+            self.first_buffered_at = time.monotonic()
+        self.arrivals += 1
+        self.buffer_dd.setdefault(event.mongo_collection_name, []).append((self.arrivals, self.document(event), event.position))
+        self.held.add(event.position)
+        self.buffered_docs += 1
+        if self.buffered_docs > self.max_buffered_docs:
+            self._drop_oldest()
+        if self.buffered_docs >= self.max_docs:
+            self.flush()
+
+    def _drop_oldest(self):
+        """ The earliest buffered document of all collections, lists are in arrival order so it's one of their heads """
+        collection_name = min((name for name, documents in self.buffer_dd.items() if documents), key=lambda name: self.buffer_dd[name][0][0])
+        _, _, position = self.buffer_dd[collection_name].pop(0)
+        self.held.release(position)
+        self.buffered_docs -= 1
+        self.dropped_docs += 1
+        if self.dropped_docs % 1000 == 1:
+            log.warning(f"MongoDB buffer is full, {self.dropped_docs} documents were dropped so far")
+
+    def _is_due(self):
+        return self.buffered_docs and (self.buffered_docs >= self.max_docs or time.monotonic() - self.first_buffered_at >= self.linger_sec)
+
+    def flush(self, force=False):
+        if not force and (not self._is_due() or time.monotonic() < self.retry_after):
+            return
+        for collection_name in list(self.buffer_dd):
+            documents = self.buffer_dd[collection_name]
+            while documents:
+                batch = documents[:self.max_docs]
+                if not self._insert(collection_name, [document for _, document, _ in batch]):
+                    return
+                del documents[:len(batch)]
+                self.buffered_docs -= len(batch)
+                for _, _, position in batch:
+                    self.held.release(position)
+            del self.buffer_dd[collection_name]
+        self.first_buffered_at = time.monotonic()
+        if not self.has_indexes:
+            self._ensure_indexes()
+
+    def _insert(self, collection_name, batch):
+        """ Return False if the batch has to be inserted again later """
+        errors = self.pymongo.errors
+        try:
+            result = self.database[collection_name].insert_many(batch, ordered=False)
+            self.inserted_docs += len(result.inserted_ids)
+        except errors.BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            self.inserted_docs += e.details.get("nInserted", 0)
+            for write_error in write_errors:
+                if write_error.get("code") == MONGO_DUPLICATE_KEY_ERROR:
+                    self.duplicate_docs += 1
+                else:
+                    self.dropped_docs += 1
+                    log.error(f"MongoDB rejected document in {collection_name}: {write_error.get('errmsg')}")
+        except errors.ConnectionFailure as e:
+            # the batch is repeated as a whole, documents which were inserted are duplicates then
+            self.failed_requests += 1
+            backoff_sec = min(2 ** self.failed_requests, self.MAX_BACKOFF_SEC)
+            self.retry_after = time.monotonic() + backoff_sec
+            log.error(f"MongoDB is not available, {e}. {self.buffered_docs} buffered documents, retry in {backoff_sec}s")
+            return False
+        except errors.PyMongoError as e:
+            self.dropped_docs += len(batch)
+            log.critical(f"MongoDB rejected {len(batch)} documents of {collection_name}: {e}")
+        self.failed_requests = 0
+        return True
+
+    def held_positions(self):
+        return list(self.held)
+
+    def close(self):
+        self.flush(force=True)
+        self.client.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="MongoDB collections of IS-IS Watcher events"
+    )
+    parser.add_argument(
+        "--create-indexes", required=False, action="store_true", help="Create compound indexes using MONGODB_* variables"
+    )
+    args = parser.parse_args()
+    if args.create_indexes:
+        import pymongo
+        client = pymongo.MongoClient(mongo_uri_from_env(), serverSelectionTimeoutMS=5000)
+        create_indexes(client[os.getenv("MONGODB_DATABASE", "admin") or "admin"])
+        print(f"Indexes of {', '.join(MONGO_COLLECTIONS)} are created")
+    else:
+        parser.print_help()
@@ -0,0 +1,127 @@
+"""
+Exporter outputs. Each output receives parsed events via emit() and is flushed by the exporter loop.
+"""
+import collections
+import json
+import logging
+import os
+import sys
+
+log = logging.getLogger(__name__)
+
+
+def env_bool(name, default="False"):
+    return os.getenv(name, default) == "True"
+
+
+class OutputUnavailable(Exception):
+    """ Destination is down or overloaded, the event can be sent again later """
+    pass
+
+
+class OutputRejected(Exception):
+    """ Destination refused the event, sending it again doesn't help """
+    pass
+
+
+class HELD_POSITIONS:
+    """
+    Positions of lines which events are buffered by an output. It's changed by the thread of the output only,
+    a position is added when an event is buffered again before it's released by the finished request
+    """
+
+    def __init__(self) -> None:
+        self.counter = collections.Counter()
+
+    def add(self, position):
+        if position is not None:
+            self.counter[position] += 1
+
+    def release(self, position):
+        if position is None:
+            return
+        if self.counter[position] > 1:
+            self.counter[position] -= 1
+        else:
+            del self.counter[position]
+
+    def __iter__(self):
+        # a copy, the exporter thread reads it while the output thread changes it
+        return iter(list(self.counter))
+
+
+class OUTPUT:
+
+    NAME = ""
+
+    def emit(self, event):
+        raise NotImplementedError
+
+    def send(self, event):
+        """ Deliver one event and raise OutputUnavailable or OutputRejected on failure. Outputs which handle failures themselves just emit """
+        self.emit(event)
+
+    def flush(self, force=False):
+        """ Called by the exporter after every read. Buffered outputs send data when force is set or their limits are reached """
+        pass
+
+    def held_positions(self):
+        """ Positions of lines which events are accepted but not delivered yet, the checkpoint doesn't pass them """
+        return ()
+
+    def close(self):
+        self.flush(force=True)
+
+
+class STDOUT_OUTPUT(OUTPUT):
+
+    NAME = "stdout"
+
+    def emit(self, event):
+        record = event.to_dict()
+        record["metadata"] = {"elasticsearch_index": event.elasticsearch_index, "webhook_item_value": event.message}
+        sys.stdout.write(json.dumps(record) + "\n")
+
+    def flush(self, force=False):
+        sys.stdout.flush()
+
+
+class HTTP_OUTPUT(OUTPUT):
+    """ POST one JSON object per event, the same as logstash http output with format => json """
+
+    def __init__(self, name, url, timeout=(5, 30)) -> None:
+        import requests
+        self.NAME = name
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def body(self, event):
+        return event.to_dict()
+
+    RETRY_STATUSES = {408, 429}
+
+    def send(self, event):
+        try:
+            r = self.session.post(self.url, json=self.body(event), timeout=self.timeout)
+        except Exception as e:
+            raise OutputUnavailable(f"{self.NAME} is not available, {e}") from e
+        if r.status_code in self.RETRY_STATUSES or r.status_code >= 500:
+            raise OutputUnavailable(f"{self.NAME} replied {r.status_code}: {r.text}")
+        if not r.ok:
+            raise OutputRejected(f"{self.NAME} replied {r.status_code}: {r.text}")
+
+    def emit(self, event):
+        try:
+            self.send(event)
+        except (OutputUnavailable, OutputRejected) as e:
+            log.error(str(e))
+
+    def close(self):
+        self.session.close()
+
+
+class WEBHOOK_OUTPUT(HTTP_OUTPUT):
+
+    def body(self, event):
+        return {"text": event.message}
@@ -0,0 +1,327 @@
+"""
+End-to-end throughput of the export pipeline: synthetic watcher logs -> pipeline -> local HTTP and TCP sinks.
+
+The generator writes lines with a sequence number in sesid, the sinks record when each sequence number arrived.
+The report has throughput, p50/p99 latency from write to sink and peak memory of every stage: generator,
+pipeline and sinks run as separate processes. Zabbix items have no sesid, with zabbix output items are counted
+against written metric and network lines (temetric is not sent to Zabbix) and latency is not available.
+
+The Python exporter is started by the benchmark:
+python3 pipeline_benchmark.py --rate 2000 --duration 30 --watchers 4 --output topolograph
+Logstash or Fluent Bit are started by you, with logs folder mounted to --logs-dir and outputs pointed to
+the sinks (i.e. TOPOLOGRAPH_HOST=<this host> TOPOLOGRAPH_PORT=8089), pass --pipeline-pid to measure its memory:
+python3 pipeline_benchmark.py --pipeline external --logs-dir ../watcher/logs --http-port 8089 --tcp-port 10051
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import resource
+import shutil
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from loadgen import DEFAULT_MIX, LOAD_GENERATOR
+from zabbix import ZABBIX_HEADER, pack_zabbix_message, read_zabbix_message
+
+EXPORTER_FOLDER_PATH = os.path.dirname(os.path.abspath(__file__))
+# the same sesid regex matches JSON of Python exporter, Logstash and Fluent Bit
+SESID_RE = re.compile(rb'"sesid"\s*:\s*"(\d+)"')
+
+
+def peak_rss_kb(pid=None):
+    """ Peak resident memory of a process in KB, VmHWM of /proc or ru_maxrss of the current process """
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class SINK_STATE:
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # sequence number -> time.time() of the first arrival
+        self.arrived_at = {}
+        self.requests_count = 0
+        self.unmatched_count = 0
+        self.zabbix_items_count = 0
+        self.zabbix_arrived_at = 0
+
+    def record(self, data):
+        arrived_at = time.time()
+        seqs = SESID_RE.findall(data)
+        with self.lock:
+            self.requests_count += 1
+            if not seqs:
+                self.unmatched_count += 1
+            for seq in seqs:
+                self.arrived_at.setdefault(int(seq), arrived_at)
+
+
+def make_http_handler(state):
+
+    class SINK_HTTP_HANDLER(BaseHTTPRequestHandler):
+        """ Topolograph /websocket, webhook and Elasticsearch _bulk stand-in """
+        protocol_version = "HTTP/1.1"
+        # headers and body are written separately, Nagle's algorithm would delay every reply by ~40ms
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            state.record(body)
+            reply = b'{"errors": false, "items": []}' if self.path.endswith("/_bulk") else b"{}"
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+
+        do_PUT = do_POST
+
+        def log_message(self, format, *args):
+            pass
+
+    return SINK_HTTP_HANDLER
+
+
+def make_tcp_handler(state):
+
+    class SINK_TCP_HANDLER(socketserver.BaseRequestHandler):
+        """ Zabbix trapper which accepts all items, other protocols are recorded chunk by chunk """
+
+        def handle(self):
+            if self.request.recv(len(ZABBIX_HEADER), socket.MSG_PEEK) == ZABBIX_HEADER:
+                message = read_zabbix_message(self.request)
+                items_num = len(message.get("data", []))
+                with state.lock:
+                    state.requests_count += 1
+                    state.zabbix_items_count += items_num
+                    state.zabbix_arrived_at = time.time()
+                info = f"processed: {items_num}; failed: 0; total: {items_num}; seconds spent: 0.000001"
+                self.request.sendall(pack_zabbix_message({"response": "success", "info": info}))
+                return
+            while True:
+                data = self.request.recv(1 << 16)
+                if not data:
+                    break
+                state.record(data)
+
+    return SINK_TCP_HANDLER
+
+
+class THREADING_TCP_SERVER(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def run_sinks(http_port, tcp_port, conn):
+    """ Sinks process: serve until anything is received from conn, then send back arrivals and peak memory """
+    state = SINK_STATE()
+    http_server = ThreadingHTTPServer(("127.0.0.1" if http_port == 0 else "0.0.0.0", http_port), make_http_handler(state))
+    http_server.daemon_threads = True
+    tcp_server = THREADING_TCP_SERVER(("127.0.0.1" if tcp_port == 0 else "0.0.0.0", tcp_port), make_tcp_handler(state))
+    for server in (http_server, tcp_server):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    conn.send((http_server.server_address[1], tcp_server.server_address[1]))
+    while True:
+        if conn.poll(0.5):
+            command = conn.recv()
+            with state.lock:
+                if command == "count":
+                    conn.send(len(state.arrived_at) + state.zabbix_items_count)
+                    continue
+                conn.send({
+                    "arrived_at": state.arrived_at,
+                    "requests_count": state.requests_count,
+                    "unmatched_count": state.unmatched_count,
+                    "zabbix_items_count": state.zabbix_items_count,
+                    "zabbix_arrived_at": state.zabbix_arrived_at,
+                    "peak_rss_kb": peak_rss_kb(),
+                })
+            break
+    http_server.shutdown()
+    tcp_server.shutdown()
+
+
+def start_exporter(logs_dir, output, http_port, tcp_port):
+    env = dict(os.environ)
+    for name in list(env):
+        if name.startswith(("EXPORT_TO_", "DEDUP_", "FLAP_DAMPENING_", "TOPOLOGY_STATE_")) or name == "DEBUG_BOOL":
+            del env[name]
+    if output == "topolograph":
+        env.update(EXPORT_TO_TOPOLOGRAPH_SOCKET="True", TOPOLOGRAPH_HOST="127.0.0.1", TOPOLOGRAPH_PORT=str(http_port))
+    elif output == "webhook":
+        env.update(EXPORT_TO_WEBHOOK_URL_BOOL="True", WEBHOOK_URL=f"http://127.0.0.1:{http_port}/webhook")
+    elif output == "elasticsearch":
+        env.update(EXPORT_TO_ELASTICSEARCH_BOOL="True", ELASTIC_IP="127.0.0.1", ELASTIC_PORT=str(http_port))
+    elif output == "zabbix":
+        env.update(EXPORT_TO_ZABBIX_BOOL="True", ZABBIX_HOST="127.0.0.1", ZABBIX_PORT=str(tcp_port))
+    return subprocess.Popen(
+        [sys.executable, "exporter.py", "--path", os.path.join(logs_dir, "watcher*.isis.log")],
+        cwd=EXPORTER_FOLDER_PATH, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def run(args):
+    logs_dir = args.logs_dir or tempfile.mkdtemp(prefix="isiswatcher-pipeline-")
+    parent_conn, sinks_conn = multiprocessing.Pipe()
+    sinks = multiprocessing.Process(target=run_sinks, args=(args.http_port, args.tcp_port, sinks_conn), daemon=True)
+    sinks.start()
+    http_port, tcp_port = parent_conn.recv()
+    print(f"Sinks: http://127.0.0.1:{http_port}, tcp 127.0.0.1:{tcp_port}, logs: {logs_dir}")
+    generator = LOAD_GENERATOR(logs_dir, watchers_num=args.watchers, mix=args.mix, seed=args.seed)
+    generator.open()
+    pipeline = None
+    pipeline_pid = args.pipeline_pid
+    try:
+        if args.pipeline == "exporter":
+            pipeline = start_exporter(logs_dir, args.output, http_port, tcp_port)
+            pipeline_pid = pipeline.pid
+            # existing files are read from the end, wait until the exporter follows them
+            time.sleep(args.warmup)
+        started_at = time.time()
+        written_num = generator.write(args.rate, args.duration)
+        written_at_ll = generator.written_at
+        generator.close()
+        expected_num = written_num - generator.written_dd["temetric"] if args.output == "zabbix" else written_num
+        # drain: wait until everything arrived or nothing new arrives for drain seconds
+        arrived_num, last_change_at = -1, time.monotonic()
+        while time.monotonic() - last_change_at < args.drain:
+            parent_conn.send("count")
+            count = parent_conn.recv()
+            if count >= expected_num:
+                break
+            if count != arrived_num:
+                arrived_num, last_change_at = count, time.monotonic()
+            time.sleep(0.2)
+        pipeline_rss_kb = peak_rss_kb(pipeline_pid) if pipeline_pid else 0
+        parent_conn.send("report")
+        sinks_report = parent_conn.recv()
+    finally:
+        if pipeline is not None:
+            pipeline.terminate()
+            pipeline.wait()
+        sinks.join(timeout=5)
+        if not args.logs_dir:
+            shutil.rmtree(logs_dir, ignore_errors=True)
+    arrived_at = sinks_report["arrived_at"]
+    # Zabbix items can't be matched to lines, only their number is known
+    is_zabbix = args.output == "zabbix" and not arrived_at
+    if is_zabbix:
+        received_num = sinks_report["zabbix_items_count"]
+        finished_at = sinks_report["zabbix_arrived_at"] or started_at
+        latencies = None
+    else:
+        received_num = len(arrived_at)
+        finished_at = max(arrived_at.values()) if arrived_at else started_at
+        latencies = sorted(arrived_at[seq] - written_at_ll[seq] for seq in arrived_at if seq < len(written_at_ll))
+    report_dd = {
+        "pipeline": args.pipeline if args.pipeline != "exporter" else f"exporter ({args.output})",
+        "watchers": args.watchers,
+        "mix": args.mix,
+        "target_rate": args.rate,
+        "written": written_num,
+        "expected": expected_num,
+        "received": received_num,
+        "lost": expected_num - received_num,
+        "sink_requests": sinks_report["requests_count"],
+        "sink_requests_without_sesid": sinks_report["unmatched_count"],
+        "zabbix_items": sinks_report["zabbix_items_count"],
+        "throughput_per_sec": received_num / max(finished_at - started_at, 1e-9),
+        # None when latency is not available
+        "latency_p50_ms": percentile(latencies, 0.5) * 1000 if latencies is not None else None,
+        "latency_p99_ms": percentile(latencies, 0.99) * 1000 if latencies is not None else None,
+        "latency_max_ms": (latencies[-1] if latencies else 0) * 1000 if latencies is not None else None,
+        "peak_rss_kb": {
+            "generator": peak_rss_kb(),
+            "pipeline": pipeline_rss_kb,
+            "sinks": sinks_report["peak_rss_kb"],
+        },
+    }
+    print(f"{report_dd['pipeline']}: {written_num} written, {expected_num} expected, {received_num} received, "
+          f"{report_dd['throughput_per_sec']:,.0f} events/sec")
+    if latencies is None:
+        print("latency n/a, Zabbix items have no sesid")
+    else:
+        print(f"latency p50 {report_dd['latency_p50_ms']:.1f}ms, p99 {report_dd['latency_p99_ms']:.1f}ms, max {report_dd['latency_max_ms']:.1f}ms")
+    print("peak memory: " + ", ".join(f"{stage} {rss_kb / 1024:.1f}MB" for stage, rss_kb in report_dd["peak_rss_kb"].items()))
+    if sinks_report["zabbix_items_count"]:
+        print(f"zabbix: {sinks_report['zabbix_items_count']} items in {sinks_report['requests_count']} trapper requests")
+    if sinks_report["unmatched_count"]:
+        print(f"{sinks_report['unmatched_count']} sink requests had no sesid, i.e. webhook text, they are counted only as requests")
+    return report_dd
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Measure throughput and latency of the export pipeline with synthetic watcher logs"
+    )
+    parser.add_argument(
+        "--pipeline", required=False, default="exporter", choices=["exporter", "external"],
+        help="exporter is started by the benchmark, external (Logstash, Fluent Bit) is started by you"
+    )
+    parser.add_argument(
+        "--output", required=False, default="topolograph", choices=["topolograph", "webhook", "elasticsearch", "zabbix"],
+        help="Output of the Python exporter, zabbix is pointed to the TCP sink, others to the HTTP sink"
+    )
+    parser.add_argument(
+        "--logs-dir", required=False, default="", help="Folder of watcher*.isis.log files, a temporary one by default"
+    )
+    parser.add_argument(
+        "--watchers", required=False, default=1, type=int, help="Number of watcher files"
+    )
+    parser.add_argument(
+        "--rate", required=False, default=1000, type=float, help="Lines per second, all files together"
+    )
+    parser.add_argument(
+        "--duration", required=False, default=10, type=float, help="Seconds of writing"
+    )
+    parser.add_argument(
+        "--mix", required=False, default=DEFAULT_MIX, help="Weights of temetric, metric and network events"
+    )
+    parser.add_argument(
+        "--seed", required=False, default=None, type=int, help="Seed of random generator"
+    )
+    parser.add_argument(
+        "--http-port", required=False, default=0, type=int, help="HTTP sink port, a free one by default"
+    )
+    parser.add_argument(
+        "--tcp-port", required=False, default=0, type=int, help="TCP sink port, a free one by default"
+    )
+    parser.add_argument(
+        "--pipeline-pid", required=False, default=0, type=int, help="PID of external pipeline to measure its memory"
+    )
+    parser.add_argument(
+        "--warmup", required=False, default=2, type=float, help="Seconds to wait for the exporter to start"
+    )
+    parser.add_argument(
+        "--drain", required=False, default=5, type=float, help="Seconds without new arrivals after writing to stop"
+    )
+    parser.add_argument(
+        "--report", required=False, default="", help="Path to save JSON report"
+    )
+    args = parser.parse_args()
+    report_dd = run(args)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report_dd, f, indent=2)
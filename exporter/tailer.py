@@ -0,0 +1,348 @@
+"""
+Follower of watcher*.isis.log files.
+
+Logs are truncated in place by logrotate (copytruncate, LOGROTATE_ROTATE: "0"), so a file keeps its inode.
+The position of every file is checkpointed as inode, offset of the last complete line and a hash of that line.
+Every line is returned with its position (path, generation, offset of the line), the caller reports positions of
+lines which events are not delivered yet and the checkpoint of a file stops at the first of them, so they are read
+again after a restart. The generation changes when a file is opened or read from the head again.
+After a restart a file is continued from its offset if the same line is still there, otherwise it was
+truncated or replaced meanwhile and it is read from the head. New files are picked up by inotify, the folder
+is also scanned every `refresh_interval` in case inotify is not available or its queue overflowed.
+"""
+import ctypes
+import ctypes.util
+import fnmatch
+import glob
+import hashlib
+import itertools
+import json
+import logging
+import os
+import select
+import struct
+import time
+
+log = logging.getLogger(__name__)
+
+
+# a longer line before a held position is checkpointed without the hash check
+MAX_LINE_LENGTH = 1 << 16
+
+
+def line_hash(line):
+    return hashlib.blake2b(line, digest_size=8).hexdigest()
+
+
+class INOTIFY:
+    """ inotify of a single folder via libc, raises OSError if it's not available """
+
+    IN_MODIFY = 0x00000002
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    EVENT_STRUCT = struct.Struct("iIII")
+
+    def __init__(self, folder_path) -> None:
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(f"{libc_name} has no inotify")
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = self.IN_MODIFY | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder_path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch of {folder_path} failed")
+
+    def wait(self, timeout):
+        """ Return True if there are events to read """
+        return bool(select.select([self.fd], [], [], timeout)[0])
+
+    def read(self):
+        """ Return a list of (mask, file name) """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                return events
+            position = 0
+            while position < len(data):
+                _, mask, _, name_length = self.EVENT_STRUCT.unpack_from(data, position)
+                position += self.EVENT_STRUCT.size
+                name = data[position:position + name_length].rstrip(b"\0").decode(errors="replace")
+                position += name_length
+                events.append((mask, name))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class TAILED_FILE:
+
+    __slots__ = ("path", "f", "inode", "generation", "offset", "partial", "last_line")
+
+    def __init__(self, path, f, inode, generation, offset) -> None:
+        self.path = path
+        self.f = f
+        self.inode = inode
+        # positions of other generations point to content which is gone
+        self.generation = generation
+        # bytes read so far, including the partial line
+        self.offset = offset
+        self.partial = b""
+        # the last complete line with its newline, checks that the file wasn't truncated and written again
+        self.last_line = b""
+
+    @property
+    def line_offset(self):
+        """ Offset right after the last complete line """
+        return self.offset - len(self.partial)
+
+    def line_before(self, offset):
+        """ The complete line which ends at offset, read back from the file. Empty at the head or if it's too long """
+        start = max(offset - MAX_LINE_LENGTH, 0)
+        data = os.pread(self.f.fileno(), offset - start, start)
+        line_start = data.rfind(b"\n", 0, len(data) - 1) + 1
+        if not line_start and start:
+            return b""
+        return data[line_start:]
+
+    def checkpoint(self, held_offset=None):
+        """ Position after the last complete line or before the first line which is still held """
+        offset, last_line = self.line_offset, self.last_line
+        if held_offset is not None and held_offset < offset:
+            offset = held_offset
+            try:
+                last_line = self.line_before(offset) if offset else b""
+            except OSError:
+                last_line = b""
+        return {
+            "inode": self.inode,
+            "offset": offset,
+            "last_line_length": len(last_line),
+            "last_line_hash": line_hash(last_line) if last_line else "",
+        }
+
+
+class LOG_TAILER:
+    """
+    Follow all files matched by glob pattern. Without a checkpoint, files existed at start are read from the end
+    (as read_from_head: false) and files appeared later are read from the head. With a checkpoint, files are continued
+    from the saved position and files unknown to the checkpoint are read from the head.
+    Truncated file is read from the head again.
+    """
+    READ_CHUNK_SIZE = 1 << 20
+
+    def __init__(self, pattern, refresh_interval=1, read_from_head=False, checkpoint_file_path="", checkpoint_interval_sec=1) -> None:
+        self.pattern = pattern
+        self.read_from_head = read_from_head
+        self.checkpoint_file_path = checkpoint_file_path
+        self.checkpoint_interval_sec = checkpoint_interval_sec
+        # path -> TAILED_FILE
+        self.files = {}
+        self._generations = itertools.count()
+        self.buffer = bytearray(self.READ_CHUNK_SIZE)
+        self.inotify = None
+        folder_path, file_pattern = os.path.split(pattern)
+        self.file_pattern = file_pattern
+        if not glob.has_magic(folder_path):
+            try:
+                self.inotify = INOTIFY(folder_path or ".")
+            except OSError as e:
+                log.warning(f"inotify is not available, {pattern} is scanned every {refresh_interval}s: {e}")
+        # with inotify the scan is a fallback only
+        self.refresh_interval = max(refresh_interval, 60) if self.inotify is not None else refresh_interval
+        self._checkpointed_at = 0
+        self._last_refresh = 0
+        self._refresh(is_startup=True, checkpoint_dd=self._load_checkpoint())
+
+    def _load_checkpoint(self):
+        """ Return {path: checkpoint} or None if there is no checkpoint yet """
+        if not self.checkpoint_file_path or not os.path.exists(self.checkpoint_file_path):
+            return None
+        try:
+            with open(self.checkpoint_file_path) as f:
+                return json.load(f).get("files", {})
+        except (OSError, ValueError) as e:
+            log.error(f"Checkpoint {self.checkpoint_file_path} is not readable, files are read from the head: {e}")
+            return {}
+
+    def checkpoint(self, force=False, get_held_positions=None):
+        """
+        Save positions of lines which were returned by poll(). get_held_positions() returns positions of lines
+        which events are not delivered yet, every file is saved up to the first of them
+        """
+        if not self.checkpoint_file_path or (not force and time.monotonic() - self._checkpointed_at < self.checkpoint_interval_sec):
+            return
+        self._checkpointed_at = time.monotonic()
+        # (path, generation) -> the lowest held offset
+        held_dd = {}
+        for path, generation, offset in (get_held_positions() if get_held_positions is not None else ()):
+            key = (path, generation)
+            if offset < held_dd.get(key, offset + 1):
+                held_dd[key] = offset
+        checkpoint_dd = {
+            "files": {path: tailed.checkpoint(held_dd.get((path, tailed.generation))) for path, tailed in self.files.items()},
+            "saved_at": time.time(),
+        }
+        tmp_file_path = f"{self.checkpoint_file_path}.tmp"
+        try:
+            with open(tmp_file_path, "w") as f:
+                json.dump(checkpoint_dd, f)
+            os.replace(tmp_file_path, self.checkpoint_file_path)
+        except OSError as e:
+            log.error(f"Checkpoint was not saved to {self.checkpoint_file_path}: {e}")
+
+    @staticmethod
+    def _resume_offset(fd, st, checkpoint):
+        """ Offset to continue from if the file still has the checkpointed line at the checkpointed offset, otherwise 0 """
+        offset = checkpoint.get("offset", 0)
+        if checkpoint.get("inode") != st.st_ino:
+            return 0, "replaced"
+        if st.st_size < offset:
+            return 0, "truncated"
+        line_length = checkpoint.get("last_line_length", 0)
+        if line_length:
+            if offset < line_length or line_hash(os.pread(fd, line_length, offset - line_length)) != checkpoint.get("last_line_hash"):
+                return 0, "truncated and written again"
+        return offset, ""
+
+    def _open(self, path, from_head, checkpoint=None):
+        try:
+            f = open(path, "rb", buffering=0)
+        except OSError as e:
+            log.warning(f"Can't open {path}: {e}")
+            return
+        st = os.fstat(f.fileno())
+        last_line = b""
+        if checkpoint is not None:
+            offset, reason = self._resume_offset(f.fileno(), st, checkpoint)
+            if reason:
+                log.info(f"{path} was {reason} since the checkpoint, read from the head")
+            elif checkpoint.get("last_line_length"):
+                line_length = checkpoint["last_line_length"]
+                last_line = os.pread(f.fileno(), line_length, offset - line_length)
+        else:
+            offset = 0 if from_head else st.st_size
+        f.seek(offset)
+        tailed = self.files[path] = TAILED_FILE(path, f, st.st_ino, next(self._generations), offset)
+        tailed.last_line = last_line
+        log.info(f"Following {path} from offset {offset}")
+
+    def _refresh(self, is_startup=False, checkpoint_dd=None):
+        self._last_refresh = time.monotonic()
+        for path in glob.glob(self.pattern):
+            if path in self.files:
+                continue
+            if checkpoint_dd is not None and path in checkpoint_dd:
+                self._open(path, from_head=True, checkpoint=checkpoint_dd[path])
+            else:
+                # files which appeared after the checkpoint are new
+                self._open(path, from_head=self.read_from_head or not is_startup or checkpoint_dd is not None)
+        for path in list(self.files):
+            self._check_replaced(path)
+
+    def _check_replaced(self, path):
+        try:
+            inode = os.stat(path).st_ino
+        except FileNotFoundError:
+            self._close(path)
+            return
+        if inode != self.files[path].inode:
+            # file was replaced, read the new one from the head
+            self._close(path)
+            self._open(path, from_head=True)
+
+    def _handle_inotify(self):
+        for mask, name in self.inotify.read():
+            if mask & INOTIFY.IN_Q_OVERFLOW:
+                self._refresh()
+                continue
+            if not fnmatch.fnmatch(name, self.file_pattern):
+                continue
+            path = os.path.join(os.path.dirname(self.pattern), name)
+            if mask & (INOTIFY.IN_CREATE | INOTIFY.IN_MOVED_TO):
+                if path in self.files:
+                    self._check_replaced(path)
+                else:
+                    self._open(path, from_head=True)
+            elif mask & (INOTIFY.IN_DELETE | INOTIFY.IN_MOVED_FROM) and path in self.files:
+                self._close(path)
+
+    def _close(self, path):
+        self.files.pop(path).f.close()
+
+    def _read(self, path):
+        tailed = self.files[path]
+        fd = tailed.f.fileno()
+        size = os.fstat(fd).st_size
+        if size < tailed.offset:
+            log.info(f"{path} was truncated, read from the head")
+            self._rewind(tailed)
+        elif size > tailed.offset and tailed.last_line:
+            # copytruncate followed by writes beyond the old offset before this poll
+            line_length = len(tailed.last_line)
+            if os.pread(fd, line_length, tailed.line_offset - line_length) != tailed.last_line:
+                log.info(f"{path} was truncated and written again, read from the head")
+                self._rewind(tailed)
+        lines = []
+        line_offset = tailed.line_offset
+        buffer = self.buffer
+        view = memoryview(buffer)
+        while True:
+            read_num = tailed.f.readinto(buffer)
+            if not read_num:
+                break
+            tailed.offset += read_num
+            chunk_lines = (tailed.partial + view[:read_num].tobytes()).split(b"\n")
+            tailed.partial = chunk_lines.pop()
+            lines.extend(chunk_lines)
+            if read_num < len(buffer):
+                break
+        if lines:
+            tailed.last_line = lines[-1] + b"\n"
+        positioned_lines = []
+        for line in lines:
+            positioned_lines.append((line_offset, line))
+            line_offset += len(line) + 1
+        return positioned_lines
+
+    def _rewind(self, tailed):
+        tailed.generation = next(self._generations)
+        tailed.offset = 0
+        tailed.partial = b""
+        tailed.last_line = b""
+        tailed.f.seek(0)
+
+    def wait(self, timeout):
+        """ Sleep until a watched file is changed or timeout """
+        if self.inotify is None:
+            time.sleep(timeout)
+        else:
+            self.inotify.wait(timeout)
+
+    def poll(self):
+        """ Return a list of (path, line, position) for all complete lines written since the last call """
+        if self.inotify is not None:
+            self._handle_inotify()
+        if time.monotonic() - self._last_refresh >= self.refresh_interval:
+            self._refresh()
+        new_lines = []
+        for path in list(self.files):
+            lines = self._read(path)
+            generation = self.files[path].generation
+            new_lines.extend((path, line.decode("utf-8", errors="replace"), (path, generation, offset)) for offset, line in lines)
+        return new_lines
+
+    def close(self, get_held_positions=None):
+        self.checkpoint(force=True, get_held_positions=get_held_positions)
+        for path in list(self.files):
+            self._close(path)
+        if self.inotify is not None:
+            self.inotify.close()
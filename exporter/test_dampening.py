@@ -0,0 +1,45 @@
+"""
+python3 -m unittest test_dampening (from the exporter folder)
+"""
+import unittest
+
+from dampening import FLAP_DAMPENING
+from events import parse_line
+
+LINE = "2024-10-08T22:55:{second:02d}Z,watcher1,1,metric,0200.1001.0003,changed,old_cost:{old_cost},new_cost:{new_cost},0200.1001.0002,10Oct2024_00h00m00s_7_hosts,49.0002,12345,10.1.23.2,10.1.23.3,,"
+
+
+def updown_event(second, status):
+    old_cost, new_cost = (10, -1) if status == "down" else (-1, 10)
+    return parse_line(LINE.format(second=second, old_cost=old_cost, new_cost=new_cost))
+
+
+class TestFlapDampening(unittest.TestCase):
+
+    def run_flaps(self, statuses):
+        """ Flaps at once, so the second one reaches the suppress threshold, then the object is quiet until reuse """
+        dampening = FLAP_DAMPENING(penalty=1000, half_life_sec=60, suppress_threshold=2000, reuse_threshold=750)
+        emitted = []
+        for second, status in enumerate(statuses):
+            emitted.extend(dampening.process(updown_event(second, status), now=0))
+        self.assertEqual(dampening.held_positions(), [None])
+        emitted.extend(dampening.tick(now=600))
+        self.assertEqual(dampening.held_positions(), [])
+        return [event.object_status for event in emitted]
+
+    def test_held_event_of_the_exported_state_is_not_repeated(self):
+        # down is exported, up reaches the threshold, the object is down again when it's reused
+        self.assertEqual(self.run_flaps(["down", "up", "down"]), ["down", "flapping"])
+
+    def test_held_event_of_a_new_state_is_released(self):
+        self.assertEqual(self.run_flaps(["down", "up", "down", "up"]), ["down", "flapping", "up"])
+
+    def test_close_releases_a_new_state_only(self):
+        dampening = FLAP_DAMPENING()
+        for second, status in enumerate(["down", "up", "down"]):
+            dampening.process(updown_event(second, status), now=0)
+        self.assertEqual(dampening.close(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""
+python3 -m unittest test_dedup (from the exporter folder)
+"""
+import unittest
+
+from dedup import EVENT_DEDUP
+from events import parse_line
+
+LINE = "2024-10-08T22:55:{second:02d}Z,{watcher},1,metric,0200.1001.0003,changed,old_cost:{old_cost},new_cost:{new_cost},0200.1001.0002,10Oct2024_00h00m00s_7_hosts,49.0002,12345,10.1.23.2,10.1.23.3,,"
+
+
+def metric_event(second, old_cost, new_cost, watcher="watcher1"):
+    return parse_line(LINE.format(second=second, watcher=watcher, old_cost=old_cost, new_cost=new_cost))
+
+
+class TestEventDedup(unittest.TestCase):
+
+    def run_events(self, dedup, timed_events):
+        emitted = []
+        for now, event in timed_events:
+            emitted.extend(dedup.process(event, now=now))
+        emitted.extend(dedup.tick(now=timed_events[-1][0] + dedup.window_sec))
+        return emitted
+
+    def test_down_up_down_of_one_watcher_is_not_deduplicated(self):
+        dedup = EVENT_DEDUP(hold_sec=1, window_sec=60)
+        emitted = self.run_events(dedup, [
+            (0, metric_event(0, 10, -1)),
+            (5, metric_event(5, -1, 10)),
+            (10, metric_event(10, 10, -1)),
+        ])
+        self.assertEqual([event.object_status for event in emitted], ["down", "up", "down"])
+        self.assertEqual(dedup.duplicates_count, 0)
+
+    def test_repeat_within_hold_keeps_order(self):
+        dedup = EVENT_DEDUP(hold_sec=1, window_sec=60)
+        emitted = self.run_events(dedup, [
+            (0, metric_event(0, 10, -1)),
+            (0.1, metric_event(0, -1, 10)),
+            (0.2, metric_event(0, 10, -1)),
+        ])
+        self.assertEqual([event.object_status for event in emitted], ["down", "up", "down"])
+
+    def test_same_change_of_other_watchers_is_dropped(self):
+        dedup = EVENT_DEDUP(hold_sec=1, window_sec=60)
+        emitted = self.run_events(dedup, [
+            (0, metric_event(0, 10, -1, watcher="watcher1")),
+            (0.2, metric_event(1, 10, -1, watcher="watcher2")),
+            (5, metric_event(5, -1, 10, watcher="watcher1")),
+            (5.1, metric_event(5, -1, 10, watcher="watcher2")),
+        ])
+        self.assertEqual([event.object_status for event in emitted], ["down", "up"])
+        self.assertEqual([event.observed_by for event in emitted], [["watcher1", "watcher2"], ["watcher1", "watcher2"]])
+        self.assertEqual(dedup.duplicates_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+"""
+python3 -m unittest test_topology (from the exporter folder)
+"""
+import os
+import tempfile
+import unittest
+
+from events import parse_line
+from topology import TOPOLOGY_STATE_OUTPUT
+
+METRIC_LINE = "2024-10-08T22:55:{second:02d}Z,watcher1,1,metric,0200.1001.{remote},changed,old_cost:{old_cost},new_cost:{new_cost},0200.1001.0002,10Oct2024_00h00m00s_7_hosts,49.0002,12345,10.1.23.2,10.1.23.3,,"
+NETWORK_LINE = "2024-10-08T22:55:{second:02d}Z,watcher1,1,network,10.10.10.0/24,changed,old_cost:{old_cost},new_cost:{new_cost},0200.1001.0002,10Oct2024_00h00m00s_7_hosts,49.0002,12345,internal,0,,"
+
+
+def metric_event(second, remote, old_cost, new_cost):
+    return parse_line(METRIC_LINE.format(second=second, remote=remote, old_cost=old_cost, new_cost=new_cost))
+
+
+class TestTopologyStateOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.state_file_path = os.path.join(self.folder.name, "topology.json")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_state_is_loaded_after_restart(self):
+        output = TOPOLOGY_STATE_OUTPUT(self.state_file_path)
+        output.emit(metric_event(0, "0003", 10, -1))
+        output.emit(metric_event(1, "0004", 10, 20))
+        output.emit(parse_line(NETWORK_LINE.format(second=2, old_cost=10, new_cost=-1)))
+        output.flush(force=True)
+
+        restarted = TOPOLOGY_STATE_OUTPUT(self.state_file_path)
+        state = restarted.state
+        self.assertEqual([link.event_object for link in state.get_down_links()], ["0200.1001.0003"])
+        self.assertEqual(state.get_link_cost("watcher1", "49.0002", 1, "0200.1001.0002", "0200.1001.0003"), -1)
+        self.assertEqual(state.get_link_cost("watcher1", "49.0002", 1, "0200.1001.0002", "0200.1001.0004"), 20)
+        self.assertEqual([prefix.event_object for prefix in state.get_down_prefixes()], ["10.10.10.0/24"])
+
+        # events after the restart are applied on top of the loaded state
+        restarted.emit(metric_event(3, "0003", -1, 10))
+        restarted.flush(force=True)
+        state = TOPOLOGY_STATE_OUTPUT(self.state_file_path).state
+        self.assertEqual(state.get_down_links(), [])
+        self.assertEqual(state.get_link_cost("watcher1", "49.0002", 1, "0200.1001.0002", "0200.1001.0003", "10.1.23.2"), 10)
+        self.assertEqual(state.get_link_cost("watcher1", "49.0002", 1, "0200.1001.0002", "0200.1001.0004"), 20)
+
+    def test_unreadable_state_starts_empty(self):
+        with open(self.state_file_path, "w") as f:
+            f.write("{not json")
+        self.assertEqual(TOPOLOGY_STATE_OUTPUT(self.state_file_path).state.links, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
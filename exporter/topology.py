@@ -0,0 +1,271 @@
+"""
+Current IS-IS topology built from the stream of watcher events.
+
+Watcher logs are deltas: metric old_cost:-1 is an adjacency up, new_cost:-1 is down, the same for networks,
+temetric carries the latest TE attributes of a link. Every event is applied to indexed dicts in O(1), so
+"which links are down right now" and "current cost of a link" are answered without scanning the history.
+"""
+import json
+import logging
+import os
+import time
+
+from events import METRIC_EVENT, NETWORK_EVENT, TEMETRIC_EVENT
+from outputs import OUTPUT
+
+log = logging.getLogger(__name__)
+
+
+class LINK:
+    """ Adjacency from event_detected_by to event_object, parallel links are told apart by local IP address """
+
+    __slots__ = ("watcher_name", "area_num", "level_number", "event_detected_by", "event_object", "local_ip_address",
+                 "remote_ip_address", "cost", "last_up_cost", "te", "changed_at")
+
+    def __init__(self, key) -> None:
+        self.watcher_name, self.area_num, self.level_number, self.event_detected_by, self.event_object, self.local_ip_address = key
+        self.remote_ip_address = ""
+        # -1 is down, None if only TE attributes are known
+        self.cost = None
+        self.last_up_cost = None
+        self.te = {}
+        self.changed_at = ""
+
+    @property
+    def is_up(self):
+        return self.cost is not None and self.cost != -1
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, link_dd):
+        link = cls(tuple(link_dd[field] for field in cls.__slots__[:6]))
+        for field in cls.__slots__[6:]:
+            setattr(link, field, link_dd[field])
+        return link
+
+    def __repr__(self):
+        return f"LINK({self.watcher_name}, L{self.level_number}, {self.event_detected_by}->{self.event_object}, {self.local_ip_address}, cost:{self.cost})"
+
+
+class PREFIX:
+
+    __slots__ = ("watcher_name", "area_num", "level_number", "event_detected_by", "event_object", "cost",
+                 "subnet_type", "int_ext_subtype", "changed_at")
+
+    def __init__(self, key) -> None:
+        self.watcher_name, self.area_num, self.level_number, self.event_detected_by, self.event_object = key
+        self.cost = None
+        self.subnet_type = ""
+        self.int_ext_subtype = 0
+        self.changed_at = ""
+
+    @property
+    def is_up(self):
+        return self.cost is not None and self.cost != -1
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, prefix_dd):
+        prefix = cls(tuple(prefix_dd[field] for field in cls.__slots__[:5]))
+        for field in cls.__slots__[5:]:
+            setattr(prefix, field, prefix_dd[field])
+        return prefix
+
+
+class TOPOLOGY_STATE:
+
+    def __init__(self) -> None:
+        # (watcher, area, level, detected by, neighbor, local ip) -> LINK
+        self.links = {}
+        # (watcher, area, level, detected by, neighbor) -> {local ip: LINK}
+        self.links_by_pair = {}
+        # keys of links which are down now
+        self.down_links = {}
+        # (watcher, area, level, detected by, prefix) -> PREFIX
+        self.prefixes = {}
+        self.down_prefixes = {}
+        self.applied_count = 0
+
+    def apply(self, event):
+        if isinstance(event, METRIC_EVENT):
+            apply_method = self._apply_metric
+        elif isinstance(event, NETWORK_EVENT):
+            apply_method = self._apply_network
+        elif isinstance(event, TEMETRIC_EVENT):
+            apply_method = self._apply_temetric
+        else:
+            return
+        # a deduplicated event is applied for every watcher which reported it during the hold time
+        for watcher_name in event.observed_by or (event.watcher_name,):
+            apply_method(event, watcher_name)
+        self.applied_count += 1
+
+    def _get_link(self, event, watcher_name):
+        key = (watcher_name, event.area_num, event.level_number, event.event_detected_by, event.event_object, event.local_ip_address)
+        link = self.links.get(key)
+        if link is None:
+            link = self.links[key] = LINK(key)
+            self.links_by_pair.setdefault(key[:5], {})[event.local_ip_address] = link
+        link.remote_ip_address = event.remote_ip_address
+        link.changed_at = event.watcher_time
+        return key, link
+
+    def _apply_metric(self, event, watcher_name):
+        key, link = self._get_link(event, watcher_name)
+        link.cost = event.new_cost
+        if event.new_cost == -1:
+            link.last_up_cost = event.old_cost if event.old_cost != -1 else link.last_up_cost
+            self.down_links[key] = link
+        else:
+            link.last_up_cost = event.new_cost
+            self.down_links.pop(key, None)
+
+    def _apply_temetric(self, event, watcher_name):
+        _, link = self._get_link(event, watcher_name)
+        link.te = {
+            "admin_groups": list(event.admin_groups),
+            "max_link_bw": event.max_link_bw,
+            "max_rsrv_link_bw": event.max_rsrv_link_bw,
+            "unreserved_bandwidth": list(event.unreserved_bandwidth),
+            "temetric": event.temetric,
+        }
+
+    def _apply_network(self, event, watcher_name):
+        key = (watcher_name, event.area_num, event.level_number, event.event_detected_by, event.event_object)
+        prefix = self.prefixes.get(key)
+        if prefix is None:
+            prefix = self.prefixes[key] = PREFIX(key)
+        prefix.cost = event.new_cost
+        prefix.subnet_type = event.subnet_type
+        prefix.int_ext_subtype = event.int_ext_subtype
+        prefix.changed_at = event.watcher_time
+        if event.new_cost == -1:
+            self.down_prefixes[key] = prefix
+        else:
+            self.down_prefixes.pop(key, None)
+
+    @staticmethod
+    def _match(record, watcher_name, area_num, level_number):
+        return ((watcher_name is None or record.watcher_name == watcher_name)
+                and (area_num is None or record.area_num == area_num)
+                and (level_number is None or str(record.level_number) == str(level_number)))
+
+    def get_down_links(self, watcher_name=None, area_num=None, level_number=None):
+        """ Links which are down right now, only down links are looked through """
+        return [link for link in self.down_links.values() if self._match(link, watcher_name, area_num, level_number)]
+
+    def get_down_prefixes(self, watcher_name=None, area_num=None, level_number=None):
+        return [prefix for prefix in self.down_prefixes.values() if self._match(prefix, watcher_name, area_num, level_number)]
+
+    def get_links(self, watcher_name, area_num, level_number, event_detected_by, event_object):
+        """ All parallel links between two nodes, {local ip: LINK} """
+        return self.links_by_pair.get((watcher_name, area_num, str(level_number), event_detected_by, event_object), {})
+
+    def get_link_cost(self, watcher_name, area_num, level_number, event_detected_by, event_object, local_ip_address=None):
+        """ Current cost of a link, -1 if it's down, None if it's unknown. The lowest cost of parallel links if local IP is not given """
+        links = self.get_links(watcher_name, area_num, level_number, event_detected_by, event_object)
+        if local_ip_address is not None:
+            link = links.get(local_ip_address)
+            return link.cost if link is not None else None
+        costs = [link.cost for link in links.values() if link.cost is not None]
+        up_costs = [cost for cost in costs if cost != -1]
+        if up_costs:
+            return min(up_costs)
+        return -1 if costs else None
+
+    def get_prefix(self, watcher_name, area_num, level_number, event_detected_by, prefix):
+        return self.prefixes.get((watcher_name, area_num, str(level_number), event_detected_by, prefix))
+
+    @classmethod
+    def from_dict(cls, state_dd):
+        """ State saved by to_dict(), down links and prefixes are indexed again by their cost """
+        state = cls()
+        for link_dd in state_dd.get("links", []):
+            link = LINK.from_dict(link_dd)
+            key = (link.watcher_name, link.area_num, link.level_number, link.event_detected_by, link.event_object, link.local_ip_address)
+            state.links[key] = link
+            state.links_by_pair.setdefault(key[:5], {})[link.local_ip_address] = link
+            if link.cost == -1:
+                state.down_links[key] = link
+        for prefix_dd in state_dd.get("prefixes", []):
+            prefix = PREFIX.from_dict(prefix_dd)
+            key = (prefix.watcher_name, prefix.area_num, prefix.level_number, prefix.event_detected_by, prefix.event_object)
+            state.prefixes[key] = prefix
+            if prefix.cost == -1:
+                state.down_prefixes[key] = prefix
+        return state
+
+    def to_dict(self):
+        return {
+            "down_links": [link.to_dict() for link in self.down_links.values()],
+            "down_prefixes": [prefix.to_dict() for prefix in self.down_prefixes.values()],
+            "links": [link.to_dict() for link in self.links.values()],
+            "prefixes": [prefix.to_dict() for prefix in self.prefixes.values()],
+        }
+
+
+class TOPOLOGY_STATE_OUTPUT(OUTPUT):
+    """
+    Keeps TOPOLOGY_STATE up to date and saves its snapshot as JSON file every `interval_sec`.
+    The snapshot is loaded at start, the tailer continues after the lines which are already in it
+    """
+
+    NAME = "topology"
+
+    def __init__(self, state_file_path="", interval_sec=10) -> None:
+        self.state = self.load(state_file_path)
+        self.state_file_path = state_file_path
+        self.interval_sec = interval_sec
+        self._saved_at = 0
+        self._saved_count = 0
+        # positions of events applied since the last saved snapshot
+        self.unsaved_positions = []
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            state_file_path=os.getenv("TOPOLOGY_STATE_FILE", ""),
+            interval_sec=float(os.getenv("TOPOLOGY_STATE_INTERVAL_SEC", "10")),
+        )
+
+    @staticmethod
+    def load(state_file_path):
+        if not state_file_path or not os.path.exists(state_file_path):
+            return TOPOLOGY_STATE()
+        try:
+            with open(state_file_path) as f:
+                state = TOPOLOGY_STATE.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log.error(f"Topology state {state_file_path} is not readable, it's built from scratch: {e}")
+            return TOPOLOGY_STATE()
+        log.info(f"Topology state is loaded from {state_file_path}, {len(state.links)} links, {len(state.down_links)} of them are down")
+        return state
+
+    def emit(self, event):
+        self.state.apply(event)
+        if self.state_file_path and event.position is not None:
+            self.unsaved_positions.append(event.position)
+
+    def flush(self, force=False):
+        if not self.state_file_path or self._saved_count == self.state.applied_count:
+            return
+        if not force and time.monotonic() - self._saved_at < self.interval_sec:
+            return
+        self._saved_at = time.monotonic()
+        tmp_file_path = f"{self.state_file_path}.tmp"
+        try:
+            with open(tmp_file_path, "w") as f:
+                json.dump(self.state.to_dict(), f)
+            os.replace(tmp_file_path, self.state_file_path)
+        except OSError as e:
+            log.error(f"Topology state was not saved to {self.state_file_path}: {e}")
+            return
+        self._saved_count = self.state.applied_count
+        self.unsaved_positions = []
+
+    def held_positions(self):
+        return list(self.unsaved_positions)
@@ -0,0 +1,274 @@
+"""
+Zabbix sender output. Values of all hosts and items are buffered and sent as one trapper request per flush
+interval instead of one TCP session per event, as logstash zabbix output does.
+
+The trapper replies with counters only: `processed: 2; failed: 1; total: 3`. A request which wasn't processed
+(connection error, no reply) is repeated as a whole. When nothing of a request was processed, its
+(host, key) groups are sent one by one to find the rejected ones, only they are dropped.
+Zabbix doesn't say which items failed if a part of a request was processed, such failures are logged.
+
+A local fake trapper for testing: python3 zabbix.py --port 10051 --reject-host isis_network_up_down
+"""
+import argparse
+import collections
+import json
+import logging
+import os
+import re
+import socket
+import socketserver
+import struct
+import time
+
+from outputs import HELD_POSITIONS, OUTPUT
+
+log = logging.getLogger(__name__)
+
+ZABBIX_HEADER = b"ZBXD"
+ZABBIX_FLAG_PROTOCOL = 0x01
+# "ZBXD", flags, data length, reserved
+ZABBIX_HEADER_STRUCT = struct.Struct("<4sBII")
+ZABBIX_INFO_RE = re.compile(r"processed:\s*(\d+);\s*failed:\s*(\d+);\s*total:\s*(\d+)")
+
+
+def pack_zabbix_message(message_dd):
+    data = json.dumps(message_dd).encode()
+    return ZABBIX_HEADER_STRUCT.pack(ZABBIX_HEADER, ZABBIX_FLAG_PROTOCOL, len(data), 0) + data
+
+
+def read_zabbix_message(sock):
+    """ Read one framed message from the socket, return decoded JSON """
+    header = _recv_exactly(sock, ZABBIX_HEADER_STRUCT.size)
+    signature, flags, data_length, _ = ZABBIX_HEADER_STRUCT.unpack(header)
+    if signature != ZABBIX_HEADER:
+        raise ValueError(f"Not a Zabbix message, header {header!r}")
+    if flags & 0x02:
+        raise ValueError("Compressed Zabbix messages are not supported")
+    return json.loads(_recv_exactly(sock, data_length))
+
+
+def _recv_exactly(sock, size):
+    chunks, left = [], size
+    while left:
+        chunk = sock.recv(min(left, 1 << 16))
+        if not chunk:
+            raise ConnectionError(f"Connection closed, {left} of {size} bytes were not received")
+        chunks.append(chunk)
+        left -= len(chunk)
+    return b"".join(chunks)
+
+
+def parse_zabbix_info(info):
+    """ 'processed: 2; failed: 1; total: 3; seconds spent: 0.000055' -> (2, 1, 3) """
+    match = ZABBIX_INFO_RE.search(info or "")
+    if match is None:
+        raise ValueError(f"Unexpected Zabbix reply info: {info!r}")
+    return tuple(int(value) for value in match.groups())
+
+
+class ZABBIX_SENDER_OUTPUT(OUTPUT):
+
+    NAME = "zabbix"
+    MAX_BACKOFF_SEC = 30
+
+    def __init__(self, server_host, server_port=10051, flush_interval_sec=1.0, max_batch_items=1000,
+                 max_buffered_items=100000, max_retries=3, timeout=5) -> None:
+        self.server_host = server_host
+        self.server_port = server_port
+        self.flush_interval_sec = flush_interval_sec
+        self.max_batch_items = max_batch_items
+        self.max_buffered_items = max_buffered_items
+        self.max_retries = max_retries
+        self.timeout = timeout
+        # (item, number of retries, position of the line)
+        self.buffer = collections.deque()
+        self.held = HELD_POSITIONS()
+        self.first_buffered_at = 0
+        self.retry_after = 0
+        self.failed_requests = 0
+        self.sent_items = 0
+        self.failed_items = 0
+        self.dropped_items = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            server_host=os.getenv("ZABBIX_HOST", "127.0.0.1") or "127.0.0.1",
+            server_port=int(os.getenv("ZABBIX_PORT", "10051") or "10051"),
+            flush_interval_sec=float(os.getenv("ZABBIX_FLUSH_INTERVAL_SEC", "1")),
+            max_batch_items=int(os.getenv("ZABBIX_MAX_BATCH_ITEMS", "1000")),
+        )
+
+    def emit(self, event):
+        # temetric events are not sent to Zabbix
+        if not event.zabbix_host:
+            return
+        now = time.time()
+        item = {
+            "host": event.zabbix_host,
+            "key": event.z_object_item_name,
+            "value": event.message,
+            "clock": int(now),
+            "ns": int(now % 1 * 1e9),
+        }
+        self._push(item, 0, event.position)
+        if len(self.buffer) >= self.max_batch_items:
+            self.flush()
+
+    def _push(self, item, retries, position, left=False):
+        if not self.buffer:
+            self.first_buffered_at = time.monotonic()
+        if left:
+            self.buffer.appendleft((item, retries, position))
+        else:
+            self.buffer.append((item, retries, position))
+        self.held.add(position)
+        while len(self.buffer) > self.max_buffered_items:
+            self.held.release(self.buffer.popleft()[2])
+            self.dropped_items += 1
+            if self.dropped_items % 1000 == 1:
+                log.warning(f"Zabbix buffer is full, {self.dropped_items} items were dropped so far")
+
+    def _is_due(self):
+        return self.buffer and (len(self.buffer) >= self.max_batch_items or time.monotonic() - self.first_buffered_at >= self.flush_interval_sec)
+
+    def flush(self, force=False):
+        if not force and (not self._is_due() or time.monotonic() < self.retry_after):
+            return
+        while self.buffer:
+            batch = [self.buffer.popleft() for _ in range(min(self.max_batch_items, len(self.buffer)))]
+            if self.buffer:
+                self.first_buffered_at = time.monotonic()
+            retry_ll = self._send_batch(batch)
+            for item, retries, position in reversed(retry_ll):
+                self._push(item, retries, position, left=True)
+            # items to resend are buffered again by now
+            for _, _, position in batch:
+                self.held.release(position)
+            if retry_ll:
+                break
+            if not force and not self._is_due():
+                break
+
+    def request(self, items):
+        """ Return (processed, failed, total) of one trapper request """
+        message = pack_zabbix_message({"request": "sender data", "data": items, "clock": int(time.time())})
+        with socket.create_connection((self.server_host, self.server_port), timeout=self.timeout) as sock:
+            sock.sendall(message)
+            reply = read_zabbix_message(sock)
+        if reply.get("response") != "success":
+            raise ValueError(f"Zabbix replied {reply}")
+        return parse_zabbix_info(reply.get("info"))
+
+    def _send_batch(self, batch):
+        """ Return items which have to be sent again later """
+        try:
+            processed, failed, total = self.request([item for item, _, _ in batch])
+        except (OSError, ValueError) as e:
+            return self._backoff(batch, f"Zabbix {self.server_host}:{self.server_port} is not available, {e}")
+        self.failed_requests = 0
+        self.sent_items += processed
+        if not failed:
+            return []
+        if processed:
+            self.failed_items += failed
+            log.error(f"Zabbix rejected {failed} of {total} items, hosts and keys of the request: {self._groups_summary(batch)}")
+            return []
+        return self._send_groups(batch)
+
+    def _send_groups(self, batch):
+        """ Nothing was processed, send every (host, key) group alone to find the rejected ones """
+        groups_dd = {}
+        for buffered in batch:
+            item = buffered[0]
+            groups_dd.setdefault((item["host"], item["key"]), []).append(buffered)
+        if len(groups_dd) == 1:
+            self.failed_items += len(batch)
+            (host, key), = groups_dd
+            log.error(f"Zabbix rejected {len(batch)} items of host {host} key {key}, check that the host and the trapper item exist")
+            return []
+        retry_ll = []
+        for (host, key), group in groups_dd.items():
+            if retry_ll:
+                retry_ll.extend(group)
+                continue
+            try:
+                processed, failed, _ = self.request([item for item, _, _ in group])
+            except (OSError, ValueError) as e:
+                retry_ll.extend(self._backoff(group, f"Zabbix {self.server_host}:{self.server_port} is not available, {e}"))
+                continue
+            self.sent_items += processed
+            if failed:
+                self.failed_items += failed
+                log.error(f"Zabbix rejected {failed} items of host {host} key {key}, check that the host and the trapper item exist")
+        return retry_ll
+
+    @staticmethod
+    def _groups_summary(batch):
+        return ", ".join(sorted({f"{item['host']}/{item['key']}" for item, _, _ in batch}))
+
+    def _backoff(self, batch, reason):
+        self.failed_requests += 1
+        backoff_sec = min(2 ** self.failed_requests, self.MAX_BACKOFF_SEC)
+        self.retry_after = time.monotonic() + backoff_sec
+        retry_ll = []
+        for item, retries, position in batch:
+            if retries < self.max_retries:
+                retry_ll.append((item, retries + 1, position))
+            else:
+                self.dropped_items += 1
+        log.error(f"{reason}. {len(retry_ll) + len(self.buffer)} buffered items, retry in {backoff_sec}s")
+        return retry_ll
+
+    def held_positions(self):
+        return list(self.held)
+
+
+class FAKE_ZABBIX_TRAPPER(socketserver.ThreadingTCPServer):
+    """ Accepts sender data as Zabbix server does, items of reject_hosts are counted as failed """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, reject_hosts=()) -> None:
+        self.reject_hosts = set(reject_hosts)
+        self.requests_count = 0
+        self.items = []
+        super().__init__(address, FAKE_ZABBIX_TRAPPER_HANDLER)
+
+
+class FAKE_ZABBIX_TRAPPER_HANDLER(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        server = self.server
+        try:
+            message = read_zabbix_message(self.request)
+        except (OSError, ValueError) as e:
+            log.error(f"Fake trapper: {e}")
+            return
+        items = message.get("data", [])
+        failed = sum(1 for item in items if item.get("host") in server.reject_hosts)
+        server.requests_count += 1
+        server.items.extend(item for item in items if item.get("host") not in server.reject_hosts)
+        info = f"processed: {len(items) - failed}; failed: {failed}; total: {len(items)}; seconds spent: 0.000001"
+        self.request.sendall(pack_zabbix_message({"response": "success", "info": info}))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Fake Zabbix trapper for testing the Zabbix sender output"
+    )
+    parser.add_argument(
+        "--port", required=False, default=10051, type=int, help="Port to listen on"
+    )
+    parser.add_argument(
+        "--reject-host", required=False, default=[], action="append", help="Count items of this host as failed"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    trapper = FAKE_ZABBIX_TRAPPER(("0.0.0.0", args.port), reject_hosts=args.reject_host)
+    print(f"Fake Zabbix trapper is listening on {args.port}")
+    try:
+        trapper.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n{trapper.requests_count} requests, {len(trapper.items)} items")
@@ -1,5 +1,40 @@
 import requests
+import hashlib
 import json, os, sys
+
+ROLLOVER_POLICY_NAME = 'isis-watcher-rollover'
+
+
+def content_hash(settings):
+    """ Hash of settings we PUT. ES returns templates normalized, so the hash is kept in _meta and compared instead of the content """
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+def is_changed(url, auth, settings, get_meta):
+    """ Return True if an object doesn't exist or was created with different settings """
+    r = requests.get(url, auth=auth)
+    if r.status_code == 404:
+        return True
+    if not r.ok:
+        print(f"Couldn't get {url}, {r.status_code}: {r.text}")
+        return True
+    return get_meta(r.json()).get('content_hash') != content_hash(settings)
+
+
+def data_stream_settings(index_template_settings, number_of_shards, refresh_interval):
+    """ Turn a static index template into a data stream one with rollover, sorting by watcher_time and tuned refresh """
+    settings = json.loads(json.dumps(index_template_settings))
+    settings['data_stream'] = {}
+    settings['template']['settings'] = {
+        'index.lifecycle.name': ROLLOVER_POLICY_NAME,
+        'index.number_of_shards': number_of_shards,
+        'index.refresh_interval': refresh_interval,
+        'index.sort.field': 'watcher_time',
+        'index.sort.order': 'desc',
+    }
+    return settings
+
+
 if __name__ == '__main__':
     if os.getenv('EXPORT_TO_ELASTICSEARCH_BOOL', 'False') == 'False':
         # ELK is disable
@@ -44,8 +79,36 @@ if __name__ == '__main__':
     }
     indexTempateNameToSettings['isis-watcher-temetric-changes'] = {'index_patterns': ['isis-watcher-temetric-changes*'], 'template': {'mappings': {'dynamic': False, 'properties': temetric_properties}}, '_meta': {'description': 'IS-IS index template for Watcher costs changes logs'}, 'allow_auto_create': True}
 
+    auth = (ELASTIC_USER_LOGIN, ELASTIC_USER_PASS)
+    if os.getenv('ELASTIC_DATA_STREAM_BOOL', 'False') == 'True':
+        # Data streams roll over backing indices by size and age, so time range queries touch only recent indices
+        rolloverPhases = {'hot': {'actions': {'rollover': {
+            'max_primary_shard_size': os.getenv('ELASTIC_ROLLOVER_MAX_SIZE', '10gb'),
+            'max_age': os.getenv('ELASTIC_ROLLOVER_MAX_AGE', '30d'),
+        }}}}
+        rolloverPolicy = {'policy': {'phases': rolloverPhases, '_meta': {'content_hash': content_hash(rolloverPhases)}}}
+        policy_url = f"{ELASTIC_URL}:9200/_ilm/policy/{ROLLOVER_POLICY_NAME}"
+        get_policy_meta = lambda reply: reply.get(ROLLOVER_POLICY_NAME, {}).get('policy', {}).get('_meta', {})
+        if is_changed(policy_url, auth, rolloverPhases, get_policy_meta):
+            r = requests.put(policy_url, auth=auth, headers=headers, data=json.dumps(rolloverPolicy))
+            print(r.json())
+        else:
+            print(f"ILM policy {ROLLOVER_POLICY_NAME} is up to date")
+        for indexTemplateName in indexTempateNameToSettings:
+            indexTempateNameToSettings[indexTemplateName] = data_stream_settings(
+                indexTempateNameToSettings[indexTemplateName],
+                number_of_shards=int(os.getenv('ELASTIC_NUMBER_OF_SHARDS', '1')),
+                refresh_interval=os.getenv('ELASTIC_REFRESH_INTERVAL', '30s'),
+            )
+
+    get_template_meta = lambda reply: next(iter(reply.get('index_templates', [])), {}).get('index_template', {}).get('_meta', {})
     for indexTemplateName, indexTemplateSettings in indexTempateNameToSettings.items():
-        r = requests.put(f"{ELASTIC_URL}:9200/_index_template/{indexTemplateName}", auth=(ELASTIC_USER_LOGIN, ELASTIC_USER_PASS), headers=headers, data=json.dumps(indexTemplateSettings))
+        template_url = f"{ELASTIC_URL}:9200/_index_template/{indexTemplateName}"
+        if not is_changed(template_url, auth, indexTemplateSettings, get_template_meta):
+            print(f"Index template {indexTemplateName} is up to date")
+            continue
+        indexTemplateSettings['_meta']['content_hash'] = content_hash(indexTemplateSettings)
+        r = requests.put(template_url, auth=auth, headers=headers, data=json.dumps(indexTemplateSettings))
         print(r.json())
         if not r.ok:
             reply_dd = r.json()
@@ -0,0 +1,92 @@
+"""
+Startup time of client.py: time to --help and to the first useful work of each action.
+Actions are run in a temporary copy of watcher-template, the current watcher folder is not touched.
+python3 startup_benchmark.py --runs 10 --report startup_benchmark.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_FOLDER_PATH = os.path.dirname(os.path.abspath(__file__))
+INVENTORY = """
+defaults:
+  host_ip: 192.168.1.33
+  organisation: bench
+devices:
+  - {{mode: gre, device_ip: 10.0.{octet}.1, tunnel_subnet: 10.10.{octet}.0/30, gre_num: {gre_num}, area_num: "49.0001"}}
+"""
+
+
+def gen_commands():
+    """ (name, arguments of python interpreter) """
+    return [
+        ("--help", ["client.py", "--help"]),
+        ("import client", ["-c", "import client"]),
+        ("add_watchers", ["client.py", "--action", "add_watchers", "--inventory", "inventory.yml"]),
+        ("enable_xdp", ["client.py", "--action", "enable_xdp", "--watcher_num", "1"]),
+        ("disable_xdp", ["client.py", "--action", "disable_xdp", "--watcher_num", "1"]),
+        # diagnostic needs root and live interfaces, its first useful work is to have scapy loaded
+        ("diagnostic (import)", ["-c", "import client; client.import_diagnostic()"]),
+    ]
+
+
+def prepare_sandbox():
+    sandbox_path = tempfile.mkdtemp(prefix="isiswatcher-startup-")
+    for file_name in ["client.py", "diagnostic.py", ".env.template"]:
+        shutil.copyfile(os.path.join(ROOT_FOLDER_PATH, file_name), os.path.join(sandbox_path, file_name))
+    shutil.copytree(
+        os.path.join(ROOT_FOLDER_PATH, "watcher", "watcher-template"),
+        os.path.join(sandbox_path, "watcher", "watcher-template"),
+    )
+    return sandbox_path
+
+
+def run(runs_num):
+    sandbox_path = prepare_sandbox()
+    results_dd = {}
+    try:
+        for run_num in range(runs_num):
+            for name, command in gen_commands():
+                if name == "add_watchers":
+                    # a new device each time, the same one is rejected as a duplicate
+                    with open(os.path.join(sandbox_path, "inventory.yml"), "w") as f:
+                        f.write(INVENTORY.format(octet=run_num % 250, gre_num=1000 + run_num))
+                start = time.perf_counter()
+                r = subprocess.run([sys.executable] + command, cwd=sandbox_path, capture_output=True, text=True)
+                elapsed = time.perf_counter() - start
+                if r.returncode != 0:
+                    print(f"{name} failed: {r.stderr.strip()[-200:]}")
+                results_dd.setdefault(name, []).append(elapsed)
+    finally:
+        shutil.rmtree(sandbox_path, ignore_errors=True)
+    report_dd = {
+        name: {"median_sec": statistics.median(times), "min_sec": min(times), "max_sec": max(times), "runs": len(times)}
+        for name, times in results_dd.items()
+    }
+    name_width = max(len(name) for name in report_dd)
+    for name, stats in report_dd.items():
+        print(f"{name.ljust(name_width)}  median {stats['median_sec']:.3f}s  min {stats['min_sec']:.3f}s  max {stats['max_sec']:.3f}s")
+    return report_dd
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Measure startup time of client.py actions"
+    )
+    parser.add_argument(
+        "--runs", required=False, default=5, type=int, help="Number of runs of each command"
+    )
+    parser.add_argument(
+        "--report", required=False, default="", help="Path to save JSON report"
+    )
+    args = parser.parse_args()
+    report_dd = run(args.runs)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report_dd, f, indent=2)
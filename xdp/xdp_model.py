@@ -0,0 +1,394 @@
+"""
+Python reference model of xdp_isis_tlv_func from xdp_drop.c. Pcaps captured on the watcher's host veth are replayed
+through the same decision logic as the kernel program: the same header sizes, border checks, TLV checks and
+MAX_LSP_ENTRIES loop bound. The verdict is reported per packet and counted per TLV type.
+LSPs with more TLVs than the loop bound are flagged: the kernel program stops at the bound and passes them,
+the model also walks the rest of the TLVs to show what the filter doesn't see.
+
+sudo tcpdump -i vhost1025 -w watcher.pcap proto gre
+python3 xdp_model.py watcher.pcap
+python3 xdp_model.py watcher.pcap --drops-only --report xdp_report.json
+python3 xdp_model.py watcher.pcap --benchmark --runs 20
+
+Only the classic pcap format is read (tcpdump -w), pcapng can be converted by `editcap -F pcap in.pcapng out.pcap`.
+No dependencies besides the standard library.
+"""
+import argparse
+import collections
+import json
+import struct
+import sys
+import time
+from typing import NamedTuple
+
+# xdp_drop.c
+MAX_LSP_ENTRIES = 50
+ETH_P_IP = 0x0800
+IPPROTO_GRE = 47
+OSI_PROTO_TYPE = 0x00fe
+L1_LINK_STATE = 0x12
+L2_LINK_STATE = 0x14
+TLV128_INTERNAL_IP_REACH_TYPE_INT = 128
+TLV130_EXTERNAL_IP_REACH_TYPE_INT = 130
+TLV135_EXTENDED_IP_REACH_TYPE_INT = 135
+TLV236_IPV6_REACH_TYPE_INT = 236
+# sizeof() of the structs, headers are packed
+ETHHDR_SIZE = 14
+IPHDR_SIZE = 20
+GRE_HEADER_SIZE = 4
+ISIS_COMMON_PDU_SIZE = 8
+LSP_SIZE = 19
+TYPE_VALUE_SIZE = 2
+TLV135_SIZE = 7
+TLV236_SIZE = 8
+TLV128_SINGLE_NETWORK_LENGTH = 12
+
+XDP_PASS = "pass"
+XDP_DROP = "drop"
+
+# why the program returned, goto pass of the C code is split by the check which failed
+REASON_NOT_IPV4 = "not ipv4"
+REASON_NOT_GRE = "not gre"
+REASON_NOT_OSI = "not osi over gre"
+REASON_NOT_LSP = "not lsp"
+REASON_TRUNCATED = "truncated header"
+REASON_END_OF_PACKET = "all tlvs passed"
+REASON_TRUNCATED_TLV = "truncated tlv"
+REASON_LOOP_BOUND = "loop bound reached"
+REASON_TLV130 = "tlv130 external reachability"
+REASON_TLV128 = "tlv128 more than 1 network"
+REASON_TLV135 = "tlv135 more than 1 network"
+REASON_TLV236 = "tlv236 more than 1 network"
+
+# pcap link types
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+PCAP_MAGIC_DD = {
+    b"\xd4\xc3\xb2\xa1": "<", b"\xa1\xb2\xc3\xd4": ">",
+    # nanosecond timestamps
+    b"\x4d\x3c\xb2\xa1": "<", b"\xa1\xb2\x3c\x4d": ">",
+}
+# XDP sees Ethernet frames, other link types are given a fake Ethernet header
+FAKE_ETHERNET_IP_HEADER = b"\0" * 12 + struct.pack("!H", ETH_P_IP)
+
+
+def calc_cidr_lenght(prefixlength):
+    return (prefixlength + 7) // 8
+
+
+def xdp_isis_tlv_func(data, max_entries=MAX_LSP_ENTRIES, tlvs=None):
+    """
+    Return (action, reason, TLV type which caused drop or 0, offset of the TLV loop).
+    data is an Ethernet frame, len(data) is data_end. (type, length) of inspected TLVs are appended to tlvs if given.
+    Bit fields are read as clang lays them out on little-endian: the first field is in the lowest bits.
+    """
+    data_end = len(data)
+    if ETHHDR_SIZE > data_end:
+        return XDP_PASS, REASON_TRUNCATED, 0, 0
+    if data[12] << 8 | data[13] != ETH_P_IP:
+        return XDP_PASS, REASON_NOT_IPV4, 0, 0
+    offset = ETHHDR_SIZE
+    if offset + IPHDR_SIZE > data_end:
+        return XDP_PASS, REASON_TRUNCATED, 0, offset
+    if data[offset + 9] != IPPROTO_GRE:
+        return XDP_PASS, REASON_NOT_GRE, 0, offset
+    # ihl is not taken into account, IP options aren't expected
+    offset += IPHDR_SIZE
+    if offset + GRE_HEADER_SIZE > data_end:
+        return XDP_PASS, REASON_TRUNCATED, 0, offset
+    # GRE flags (key, checksum, sequence) aren't taken into account either
+    if data[offset + 2] << 8 | data[offset + 3] != OSI_PROTO_TYPE:
+        return XDP_PASS, REASON_NOT_OSI, 0, offset
+    offset += GRE_HEADER_SIZE
+    if offset + ISIS_COMMON_PDU_SIZE > data_end:
+        return XDP_PASS, REASON_TRUNCATED, 0, offset
+    pdutype = data[offset + 4] & 0x1f
+    offset += ISIS_COMMON_PDU_SIZE
+    if pdutype != L1_LINK_STATE and pdutype != L2_LINK_STATE:
+        return XDP_PASS, REASON_NOT_LSP, 0, offset
+    if offset + LSP_SIZE > data_end:
+        return XDP_PASS, REASON_TRUNCATED, 0, offset
+    offset += LSP_SIZE
+    if offset + TYPE_VALUE_SIZE > data_end:
+        return XDP_PASS, REASON_TRUNCATED, 0, offset
+    for _ in range(max_entries):
+        if offset + TYPE_VALUE_SIZE > data_end:
+            return XDP_PASS, REASON_END_OF_PACKET, 0, offset
+        tlv_type = data[offset]
+        tlv_length = data[offset + 1]
+        if tlvs is not None:
+            tlvs.append((tlv_type, tlv_length))
+        if tlv_type == TLV130_EXTERNAL_IP_REACH_TYPE_INT:
+            return XDP_DROP, REASON_TLV130, tlv_type, offset
+        elif tlv_type == TLV128_INTERNAL_IP_REACH_TYPE_INT:
+            if tlv_length > TLV128_SINGLE_NETWORK_LENGTH:
+                return XDP_DROP, REASON_TLV128, tlv_type, offset
+        elif tlv_type == TLV135_EXTENDED_IP_REACH_TYPE_INT:
+            if offset + TLV135_SIZE > data_end:
+                return XDP_PASS, REASON_TRUNCATED_TLV, 0, offset
+            # metric 4, flags and prefix length 1, prefix. Sub-TLVs make the TLV longer than a single network
+            if tlv_length > 4 + 1 + calc_cidr_lenght(data[offset + 6] & 0x3f):
+                return XDP_DROP, REASON_TLV135, tlv_type, offset
+        elif tlv_type == TLV236_IPV6_REACH_TYPE_INT:
+            if offset + TLV236_SIZE > data_end:
+                return XDP_PASS, REASON_TRUNCATED_TLV, 0, offset
+            # metric 4, flags 1, prefix length 1, prefix
+            if tlv_length > 4 + 1 + 1 + calc_cidr_lenght(data[offset + 7]):
+                return XDP_DROP, REASON_TLV236, tlv_type, offset
+        if offset + TYPE_VALUE_SIZE + tlv_length > data_end:
+            return XDP_PASS, REASON_TRUNCATED_TLV, 0, offset
+        offset += TYPE_VALUE_SIZE + tlv_length
+    return XDP_PASS, REASON_LOOP_BOUND, 0, offset
+
+
+def count_tlvs(data, offset):
+    """ Number of complete TLVs from offset until the end of the frame """
+    tlvs_num = 0
+    data_end = len(data)
+    while offset + TYPE_VALUE_SIZE <= data_end and offset + TYPE_VALUE_SIZE + data[offset + 1] <= data_end:
+        offset += TYPE_VALUE_SIZE + data[offset + 1]
+        tlvs_num += 1
+    return tlvs_num
+
+
+class PACKET_VERDICT(NamedTuple):
+    num: int
+    action: str
+    reason: str
+    src: str
+    dst: str
+    lsp_id: str
+    seqnum: int
+    # TLVs inspected by the program
+    tlvs_num: int
+    # TLVs after MAX_LSP_ENTRIES, never inspected
+    unchecked_tlvs_num: int
+    # verdict of the same program without the loop bound, differs if a TLV after the bound would be dropped
+    unbounded_action: str
+    unbounded_reason: str
+    # the frame was cut by snaplen, the kernel sees the full frame
+    is_truncated_capture: bool
+
+    @property
+    def is_over_loop_bound(self):
+        return self.unchecked_tlvs_num > 0
+
+
+def inspect(num, data, max_entries=MAX_LSP_ENTRIES, tlvs=None, is_truncated_capture=False):
+    action, reason, _, offset = xdp_isis_tlv_func(data, max_entries, tlvs)
+    src = dst = lsp_id = ""
+    seqnum = 0
+    tlvs_num = len(tlvs) if tlvs is not None else 0
+    if reason not in (REASON_TRUNCATED, REASON_NOT_IPV4) and len(data) >= ETHHDR_SIZE + IPHDR_SIZE:
+        src = ".".join(str(octet) for octet in data[26:30])
+        dst = ".".join(str(octet) for octet in data[30:34])
+    lsp_offset = ETHHDR_SIZE + IPHDR_SIZE + GRE_HEADER_SIZE + ISIS_COMMON_PDU_SIZE
+    if reason not in (REASON_NOT_IPV4, REASON_NOT_GRE, REASON_NOT_OSI, REASON_NOT_LSP) and len(data) >= lsp_offset + LSP_SIZE:
+        lsp_id_bytes = data[lsp_offset + 4:lsp_offset + 12]
+        lsp_id = f"{lsp_id_bytes[:6].hex('.', 2)}.{lsp_id_bytes[6]:02x}-{lsp_id_bytes[7]:02x}"
+        seqnum = struct.unpack_from("!I", data, lsp_offset + 12)[0]
+    unchecked_tlvs_num = 0
+    unbounded_action, unbounded_reason = action, reason
+    if reason == REASON_LOOP_BOUND:
+        unchecked_tlvs_num = count_tlvs(data, offset)
+        if unchecked_tlvs_num:
+            unbounded_action, unbounded_reason, _, _ = xdp_isis_tlv_func(data, max_entries + unchecked_tlvs_num)
+        else:
+            # the bound was reached with the last TLV, nothing is left unchecked
+            reason = unbounded_reason = REASON_END_OF_PACKET
+    return PACKET_VERDICT(
+        num, action, reason, src, dst, lsp_id, seqnum, tlvs_num, unchecked_tlvs_num,
+        unbounded_action, unbounded_reason, is_truncated_capture,
+    )
+
+
+class PCAP_READER:
+    """ Frames of a classic pcap file one by one as (frame as Ethernet, is_truncated_capture) """
+
+    GLOBAL_HEADER_SIZE = 24
+
+    def __init__(self, file_path) -> None:
+        self.file_path = file_path
+        self.f = open(file_path, "rb")
+        header = self.f.read(self.GLOBAL_HEADER_SIZE)
+        if len(header) < self.GLOBAL_HEADER_SIZE or header[:4] not in PCAP_MAGIC_DD:
+            self.f.close()
+            if header[:4] == b"\x0a\x0d\x0d\x0a":
+                raise ValueError(f"{file_path} is pcapng, convert it by `editcap -F pcap {file_path} out.pcap`")
+            raise ValueError(f"{file_path} is not a pcap file")
+        byte_order = PCAP_MAGIC_DD[header[:4]]
+        self.record_header = struct.Struct(f"{byte_order}IIII")
+        self.linktype = struct.unpack_from(f"{byte_order}I", header, 20)[0] & 0xffff
+        if self.linktype not in (LINKTYPE_ETHERNET, LINKTYPE_RAW, LINKTYPE_LINUX_SLL, LINKTYPE_IPV4):
+            self.f.close()
+            raise ValueError(f"{file_path} has unsupported link type {self.linktype}")
+
+    def to_ethernet(self, frame):
+        if self.linktype == LINKTYPE_ETHERNET:
+            return frame
+        if self.linktype == LINKTYPE_LINUX_SLL:
+            # protocol type is at the same place as Ethernet type, the header is 2 bytes longer
+            return frame[:12] + frame[14:]
+        return FAKE_ETHERNET_IP_HEADER + frame
+
+    def __iter__(self):
+        record_header = self.record_header
+        read = self.f.read
+        while True:
+            header = read(record_header.size)
+            if len(header) < record_header.size:
+                return
+            _, _, incl_len, orig_len = record_header.unpack(header)
+            frame = read(incl_len)
+            if len(frame) < incl_len:
+                return
+            yield self.to_ethernet(frame), incl_len < orig_len
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class REPLAY:
+
+    def __init__(self, max_entries=MAX_LSP_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self.verdicts = []
+        # reason -> number of packets
+        self.reasons_dd = collections.Counter()
+        # TLV type -> number of inspected TLVs, number of drops caused by the type
+        self.tlv_seen_dd = collections.Counter()
+        self.tlv_drop_dd = collections.Counter()
+        self.max_tlvs_num = 0
+        self.packets_num = 0
+
+    def run(self, file_path):
+        with PCAP_READER(file_path) as reader:
+            for num, (frame, is_truncated_capture) in enumerate(reader, start=1):
+                self.packets_num = num
+                tlvs = []
+                verdict = inspect(num, frame, self.max_entries, tlvs, is_truncated_capture)
+                self.reasons_dd[verdict.reason] += 1
+                for tlv_type, _ in tlvs:
+                    self.tlv_seen_dd[tlv_type] += 1
+                if verdict.action == XDP_DROP:
+                    self.tlv_drop_dd[tlvs[-1][0]] += 1
+                if verdict.lsp_id:
+                    self.max_tlvs_num = max(self.max_tlvs_num, verdict.tlvs_num + verdict.unchecked_tlvs_num)
+                    self.verdicts.append(verdict)
+        return self.verdicts
+
+    @property
+    def over_loop_bound(self):
+        return [verdict for verdict in self.verdicts if verdict.is_over_loop_bound]
+
+    def print_packets(self, drops_only=False):
+        for verdict in self.verdicts:
+            if drops_only and verdict.action != XDP_DROP and verdict.unbounded_action != XDP_DROP:
+                continue
+            line = f"#{verdict.num} {verdict.src} > {verdict.dst} LSP {verdict.lsp_id} seq {verdict.seqnum:#x}: {verdict.action.upper()}, {verdict.reason}"
+            line += f", {verdict.tlvs_num} TLVs inspected"
+            if verdict.is_over_loop_bound:
+                line += f", {verdict.unchecked_tlvs_num} TLVs after the loop bound are not inspected"
+                if verdict.unbounded_action != verdict.action:
+                    line += f" (without the bound: {verdict.unbounded_action.upper()}, {verdict.unbounded_reason})"
+            if verdict.is_truncated_capture:
+                line += ", capture is cut by snaplen"
+            print(line)
+
+    def print_summary(self):
+        actions_dd = collections.Counter(verdict.action for verdict in self.verdicts)
+        print(f"Packets: {self.packets_num}, LSPs: {len(self.verdicts)}, pass: {actions_dd[XDP_PASS]}, drop: {actions_dd[XDP_DROP]}")
+        for reason, count in self.reasons_dd.most_common():
+            print(f"  {reason}: {count}")
+        print("TLV type  inspected  drops")
+        for tlv_type in sorted(self.tlv_seen_dd):
+            print(f"{tlv_type:<8}  {self.tlv_seen_dd[tlv_type]:<9}  {self.tlv_drop_dd[tlv_type]}")
+        over_loop_bound = self.over_loop_bound
+        print(f"The largest LSP has {self.max_tlvs_num} TLVs, MAX_LSP_ENTRIES is {self.max_entries}")
+        if over_loop_bound:
+            missed_drops_num = sum(1 for verdict in over_loop_bound if verdict.unbounded_action == XDP_DROP)
+            print(f"{len(over_loop_bound)} LSPs have more TLVs than MAX_LSP_ENTRIES, {missed_drops_num} of them would be dropped without the bound")
+
+    def report(self):
+        return {
+            "max_lsp_entries": self.max_entries,
+            "packets_num": self.packets_num,
+            "max_tlvs_num": self.max_tlvs_num,
+            "reasons": dict(self.reasons_dd),
+            "tlvs": {str(tlv_type): {"inspected": self.tlv_seen_dd[tlv_type], "drops": self.tlv_drop_dd[tlv_type]} for tlv_type in sorted(self.tlv_seen_dd)},
+            "packets": [dict(verdict._asdict(), is_over_loop_bound=verdict.is_over_loop_bound) for verdict in self.verdicts],
+        }
+
+
+def benchmark(file_path, runs, max_entries=MAX_LSP_ENTRIES):
+    """ Packets per second of the decision only, frames are read into memory beforehand """
+    with PCAP_READER(file_path) as reader:
+        frames = [frame for frame, _ in reader]
+    if not frames:
+        raise ValueError(f"{file_path} has no packets")
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for frame in frames:
+            xdp_isis_tlv_func(frame, max_entries)
+        times.append(time.perf_counter() - start)
+    best_sec = min(times)
+    report_dd = {
+        "packets": len(frames), "runs": runs,
+        "packets_per_sec": len(frames) / best_sec,
+        "median_packets_per_sec": len(frames) / sorted(times)[len(times) // 2],
+    }
+    print(f"{len(frames)} packets x {runs} runs: {report_dd['packets_per_sec']:.0f} packets/sec (best), {report_dd['median_packets_per_sec']:.0f} packets/sec (median)")
+    return report_dd
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Replay a pcap of IS-IS over GRE through the model of the XDP IS-IS filter"
+    )
+    parser.add_argument(
+        "pcap", help="Path to a classic pcap file captured on the watcher's host veth"
+    )
+    parser.add_argument(
+        "--max-entries", required=False, default=MAX_LSP_ENTRIES, type=int, help="Loop bound, MAX_LSP_ENTRIES of xdp_drop.c"
+    )
+    parser.add_argument(
+        "--drops-only", required=False, action="store_true", help="Print only dropped LSPs and LSPs which would be dropped without the loop bound"
+    )
+    parser.add_argument(
+        "--benchmark", required=False, action="store_true", help="Measure packets/sec of the decision instead of the report"
+    )
+    parser.add_argument(
+        "--runs", required=False, default=10, type=int, help="Number of passes over the pcap in benchmark mode"
+    )
+    parser.add_argument(
+        "--report", required=False, default="", help="Path to save JSON report"
+    )
+    args = parser.parse_args()
+    try:
+        if args.benchmark:
+            report_dd = benchmark(args.pcap, args.runs, args.max_entries)
+        else:
+            replay = REPLAY(args.max_entries)
+            replay.run(args.pcap)
+            replay.print_packets(args.drops_only)
+            replay.print_summary()
+            report_dd = replay.report()
+    except (OSError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report_dd, f, indent=2)
+        print(f"JSON report is saved to {args.report}")
+    # non-zero exit code if the filter misses what it's supposed to drop
+    if not args.benchmark and any(verdict.unbounded_action != verdict.action for verdict in replay.verdicts):
+        sys.exit(2)